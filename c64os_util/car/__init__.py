@@ -2,6 +2,33 @@
 Classes and methods related to C64 Archive (``.car``) files.
 """
 
+from .aio import (
+    AsyncArchiveReader,
+    AsyncArchiveWriter,
+    AsyncRecordReader,
+    deserialize_async,
+    open_async,
+    serialize_async,
+)
 from .archive import C64Archive
+from .blob import ArchiveBlobStore
+from .columns import ArchiveColumns
 from .common import CarArchiveType, CarCompressionType, CarRecordType
-from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord
+from .compression import ArchiveCodec, get_codec, register_codec
+from .index import ArchiveIndex, ArchiveIndexEntry
+from .inplace import append_in_place, update_header
+from .layout import ArchiveLayout, read_headers, walk_layout
+from .record import (
+    ArchiveDirectory,
+    ArchiveFile,
+    ArchiveRecord,
+    MappedArchiveFile,
+    MemoryBudget,
+    SpooledArchiveFile,
+    TraversalOrder,
+    get_memory_budget,
+    set_memory_budget,
+)
+from .stream import ArchiveRecordReader, C64ArchiveReader, extract_record, iter_records
+from .toc import ArchiveTocCache, load_index
+from .writer import C64ArchiveWriter
@@ -0,0 +1,604 @@
+"""
+Classes and methods for reading and writing archives with ``asyncio`` streams, without
+blocking the event loop.
+"""
+
+import asyncio
+import concurrent.futures
+import datetime
+import io
+import os
+import typing
+
+from .archive import C64Archive
+from .common import CarArchiveType, CarCompressionType, CarRecordType
+from .compression import get_codec
+from .header import ArchiveHeader
+from .layout import ArchiveLayout
+from .record import (
+    ArchiveDirectory,
+    ArchiveFile,
+    ArchiveRecord,
+    MappedArchiveFile,
+    MemoryBudget,
+    SpooledArchiveFile,
+)
+from .record.header import ArchiveRecordHeader
+from .writer import C64ArchiveWriter
+
+CHUNK_SIZE = 64 * 1024
+
+Executor = typing.Optional[concurrent.futures.Executor]
+
+
+async def _run(executor: Executor, fn, *args):
+    """
+    Call a blocking function in an executor.
+
+    :param executor: The executor (if None, the event loop's default executor).
+    :param fn: The function to call.
+    :return: The return value of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def _blocking(buffer) -> bool:
+    """
+    Check whether reading from or writing to a buffer might block (on disk I/O).
+
+    :param buffer: The buffer.
+    :return: False if the buffer is held entirely in memory.
+    """
+    if isinstance(buffer, (SpooledArchiveFile, MappedArchiveFile)):
+        return True
+    return not isinstance(buffer, io.BytesIO)
+
+
+async def _read_exactly(reader: asyncio.StreamReader, size: int, what: str) -> bytes:
+    """
+    Read an exact number of bytes from a stream.
+
+    :param reader: The stream from which to read.
+    :param size: The number of bytes to read.
+    :param what: A description of the data (used in the error message).
+    :return: The data.
+    """
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as err:
+        raise ValueError(f"truncated {what}") from err
+
+
+class AsyncRecordReader:
+    """
+    An ``AsyncRecordReader`` is the ``asyncio`` counterpart to ``ArchiveRecordReader``:
+    a read-only stream over the contents of a single file record, which reads directly
+    from the underlying archive stream and never reads past the end of the record.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, size: int):
+        """
+        Create a new record reader.
+
+        :param reader: The archive stream, positioned at the start of the record body.
+        :param size: The size of the record body.
+        """
+        self._reader = reader
+        self._size = size
+        self._remaining = size
+
+    @property
+    def size(self) -> int:
+        """
+        Get the size of the record body.
+
+        :return: The record size.
+        """
+        return self._size
+
+    @property
+    def remaining(self) -> int:
+        """
+        Get the number of bytes which have not been read yet.
+
+        :return: The number of bytes remaining.
+        """
+        return self._remaining
+
+    async def read(self, size: int = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or the rest of the record, if ``size`` is negative).
+        Fewer bytes may be returned if less data is available from the stream, but
+        never none before the end of the record.
+
+        :param size: The maximum number of bytes to read.
+        :return: The data (empty at the end of the record).
+        :raises ValueError: If the archive ends before the record does.
+        """
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        if not size:
+            return b""
+        data = await self._reader.read(size)
+        if not data:
+            raise ValueError("truncated record")
+        self._remaining -= len(data)
+        return data
+
+    async def _skip(self):
+        """
+        Advance the underlying stream past the unread portion of the record body.
+
+        :raises ValueError: If the archive ends before the record does.
+        """
+        while self._remaining:
+            data = await self._reader.read(min(self._remaining, CHUNK_SIZE))
+            if not data:
+                raise ValueError("truncated record")
+            self._remaining -= len(data)
+
+
+AsyncRecordItem = typing.Tuple[
+    typing.List[str], ArchiveRecordHeader, typing.Optional[AsyncRecordReader]
+]
+
+
+class AsyncArchiveReader:
+    """
+    An ``AsyncArchiveReader`` is the ``asyncio`` counterpart to ``C64ArchiveReader``.
+    Iterating over it (with ``async for``) yields each record in archive order as a
+    tuple of its full path (represented as a list), its header, and a reader for its
+    contents (``None`` for directories).
+
+    Each record reader is only valid until the next record is requested; any unread
+    contents are skipped. Unlike ``C64ArchiveReader``, record readers return the
+    contents as stored in the archive: compressed contents are not decompressed.
+
+    Example: ::
+
+        reader = AsyncArchiveReader(stream)
+        print((await reader.read_header()).note)
+        async for path, header, body in reader:
+            if body is not None:
+                print('/'.join(path), len(await body.read()))
+    """
+
+    def __init__(self, reader: asyncio.StreamReader):
+        """
+        Create a new archive reader. Nothing is read until the header is requested or
+        iteration begins.
+
+        :param reader: The stream from which to read.
+        """
+        self._reader = reader
+        self._header: typing.Optional[ArchiveHeader] = None
+
+    @property
+    def header(self) -> typing.Optional[ArchiveHeader]:
+        """
+        Get the header (metadata) of the archive.
+
+        :return: The header (or None if it has not been read yet).
+        """
+        return self._header
+
+    async def read_header(self) -> ArchiveHeader:
+        """
+        Read the archive header (if it has not been read already).
+
+        :return: The header.
+        """
+        if self._header is None:
+            data = await _read_exactly(
+                self._reader, ArchiveHeader.SIZE, "archive header"
+            )
+            self._header = ArchiveHeader.unpack(data)
+        return self._header
+
+    async def __aiter__(self) -> typing.AsyncIterator[AsyncRecordItem]:
+        """
+        Iterate through each record in the archive (in order).
+
+        :return: The record's path (represented as a list), the record header, and a
+            reader for the contents (or None for directories).
+        """
+        await self.read_header()
+        layout = ArchiveLayout()
+        parents: typing.List[str] = []
+        while not layout.complete:
+            data = await _read_exactly(
+                self._reader, ArchiveRecordHeader.SIZE, "record header"
+            )
+            header = ArchiveRecordHeader.unpack(data)
+            del parents[layout.begin(ArchiveLayout.children(header)) :]
+            path = parents + [header.name]
+            if header.record_type.is_directory():
+                yield path, header, None
+                parents.append(header.name)
+                continue
+            reader = AsyncRecordReader(self._reader, header.size)
+            yield path, header, reader
+            await reader._skip()  # pylint: disable=W0212
+
+
+class AsyncArchiveWriter:
+    """
+    An ``AsyncArchiveWriter`` is the ``asyncio`` counterpart to ``C64ArchiveWriter``.
+    Records must be written in archive order (each directory header followed by all of
+    its children). The stream is drained after every chunk, so memory usage does not
+    depend on the size of the archive, and reads from files on disk are run in an
+    executor.
+
+    Example: ::
+
+        writer = AsyncArchiveWriter(stream, note='hello world')
+        await writer.write_path('build/myapp')
+        await writer.close()
+    """
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        writer: asyncio.StreamWriter,
+        archive_type: CarArchiveType = CarArchiveType.GENERAL,
+        timestamp: typing.Optional[datetime.datetime] = None,
+        note: str = "",
+        executor: Executor = None,
+    ):
+        """
+        Create a new archive writer. The archive header is queued for writing
+        immediately.
+
+        :param writer: The stream into which to write.
+        :param archive_type: The type of archive to create.
+        :param timestamp: The archive creation timestamp (defaults to now).
+        :param note: A message to store in the archive 'note' field.
+        :param executor: The executor in which to run blocking I/O (defaults to the
+            event loop's default executor).
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        self._stream = writer
+        self._executor = executor
+        self._header = ArchiveHeader(
+            archive_type=archive_type, timestamp=timestamp, note=note
+        )
+        self._layout = ArchiveLayout()
+        writer.write(self._header.pack())
+
+    @property
+    def header(self) -> ArchiveHeader:
+        """
+        Get the header (metadata) of the archive.
+
+        :return: The header.
+        """
+        return self._header
+
+    @property
+    def complete(self) -> bool:
+        """
+        Check whether every record which the archive needs has been written.
+
+        :return: True if the archive is complete.
+        """
+        return self._layout.complete
+
+    async def write_directory(self, name: str, size: int):
+        """
+        Write a directory header. The next ``size`` records written become children of
+        this directory.
+
+        :param name: The name of the directory (not full path).
+        :param size: The number of children the directory will contain.
+        """
+        header = ArchiveRecordHeader(
+            name=name, size=size, record_type=CarRecordType.DIRECTORY
+        )
+        self._stream.write(self._layout.pack(header))
+        await self._stream.drain()
+
+    async def write_file(  # pylint: disable=R0913
+        self,
+        name: str,
+        source,
+        size: int,
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+    ):
+        """
+        Write a file record, copying exactly ``size`` bytes from ``source``. The source
+        may be an ``asyncio`` stream (or anything else with a coroutine ``read``
+        method), or a regular binary buffer; buffers which are not held in memory are
+        read in the executor. Files which are compressed are read into memory and
+        compressed (in the executor) first.
+
+        :param name: The name of the file (not full path).
+        :param source: The stream or buffer from which to read the contents.
+        :param size: The number of bytes to copy (before compression).
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        if compression_type is not CarCompressionType.NONE:
+            data = bytearray()
+            while len(data) < size:
+                chunk = await self._read(source, min(size - len(data), CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError(f"{name} is shorter than {size} bytes")
+                data += chunk
+            codec = get_codec(compression_type)
+            data = await _run(self._executor, codec.compress_bytes, data)
+            source = io.BytesIO(data)
+            size = len(data)
+        await self._write_stored(name, source, size, file_type, compression_type)
+
+    async def _read(self, source, size: int) -> bytes:
+        """
+        Read up to ``size`` bytes from a stream or buffer.
+
+        :param source: The stream or buffer.
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        if asyncio.iscoroutinefunction(source.read):
+            return await source.read(size)
+        if _blocking(source):
+            return await _run(self._executor, source.read, size)
+        return source.read(size)
+
+    async def _write_stored(  # pylint: disable=R0913
+        self,
+        name: str,
+        source,
+        size: int,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+    ):
+        """
+        Write a file record whose contents are already stored in their final form.
+
+        :param name: The name of the file (not full path).
+        :param source: The stream or buffer from which to read the stored contents.
+        :param size: The number of bytes to copy.
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        header = ArchiveRecordHeader(
+            name=name,
+            size=size,
+            record_type=file_type,
+            compression_type=compression_type,
+        )
+        self._stream.write(self._layout.pack(header))
+        remaining = size
+        while remaining:
+            chunk = await self._read(source, min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise ValueError(f"{name} is shorter than {size} bytes")
+            self._stream.write(chunk)
+            remaining -= len(chunk)
+            await self._stream.drain()
+
+    async def write_record(self, record: ArchiveRecord):
+        """
+        Write an in-memory record (including all of its descendants, if it is a
+        directory).
+
+        :param record: The record to write.
+        :raises TypeError: If a record is neither a file nor a directory.
+        """
+        stack = [record]
+        while stack:
+            record = stack.pop()
+            if isinstance(record, ArchiveDirectory):
+                await self.write_directory(record.name, len(record))
+                stack.extend(reversed(record))
+                continue
+            if not isinstance(record, ArchiveFile):
+                raise TypeError(f"cannot write {type(record).__name__} as a record")
+            if record.compression_type is not CarCompressionType.NONE:
+                # the compressed contents are cached by the record
+                # pylint: disable=W0212
+                data = await _run(self._executor, record._encode)
+                await self._write_stored(
+                    record.name,
+                    io.BytesIO(data),
+                    len(data),
+                    record.record_type,
+                    record.compression_type,
+                )
+                continue
+            record.seek(0)
+            await self.write_file(
+                record.name,
+                record,
+                record.size,
+                record.record_type,
+                record.compression_type,
+            )
+
+    async def write_path(  # pylint: disable=R0913
+        self,
+        path: str,
+        name: typing.Optional[str] = None,
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        recursive: bool = True,
+        exclude: typing.Optional[str] = None,
+        sort: bool = False,
+        no_empty_dir: bool = False,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+    ) -> typing.List[str]:
+        """
+        Write a file or directory from the host filesystem. Listing the tree, opening
+        files and reading their contents are all run in the executor.
+
+        :param path: The path to the file or directory on the host.
+        :param name: The name of the record within the archive (defaults to the last
+            component of ``path``).
+        :param file_type: The record type to use for files (SEQ or PRG).
+        :param recursive: Add the contents of directories.
+        :param exclude: Skip files and directories matching this glob-style pattern.
+        :param sort: Order the children of each directory by name.
+        :param no_empty_dir: Skip directories which have no children.
+        :param compression_type: The compression type to use for files.
+        :return: The host paths of all files and directories which were written (in
+            archive order).
+        :raises ValueError: If a record cannot be stored (such as a name which is too
+            long); nothing is written in that case.
+        """
+        if name is None:
+            name = os.path.basename(os.path.normpath(path))
+        # pylint: disable=W0212
+        root = await _run(
+            self._executor,
+            C64ArchiveWriter._list_path,
+            path,
+            name,
+            recursive,
+            exclude,
+            sort,
+        )
+        if root is None or (no_empty_dir and not C64ArchiveWriter._prune(root)):
+            raise ValueError(f"nothing to add from {path}")
+        records = C64ArchiveWriter._records(root, file_type, compression_type)
+        for record in records:
+            if record.children is None:
+                source = await _run(self._executor, open, record.path, "rb")
+                try:
+                    await self.write_file(
+                        record.name,
+                        source,
+                        record.size,
+                        file_type,
+                        compression_type,
+                    )
+                finally:
+                    await _run(self._executor, source.close)
+                continue
+            await self.write_directory(record.name, len(record.children))
+        return [record.path for record in records]
+
+    async def close(self):
+        """
+        Finish writing the archive. The underlying stream is drained but not closed.
+
+        :raises ValueError: If some records have not been written yet.
+        """
+        if not self.complete:
+            raise ValueError("the archive is missing records")
+        await self._stream.drain()
+
+
+async def serialize_async(
+    archive: C64Archive, writer: asyncio.StreamWriter, executor: Executor = None
+):
+    """
+    Convert an archive into binary data and write it to a stream. This is the
+    ``asyncio`` counterpart to ``C64Archive.serialize``.
+
+    :param archive: The archive to write.
+    :param writer: The stream into which to write.
+    :param executor: The executor in which to run blocking I/O.
+    """
+    out = AsyncArchiveWriter(
+        writer,
+        archive_type=archive.header.archive_type,
+        timestamp=archive.header.timestamp.to_datetime(),
+        note=archive.header.note,
+        executor=executor,
+    )
+    if archive.root is None:
+        await writer.drain()
+        return
+    await out.write_record(archive.root)
+    await out.close()
+
+
+async def deserialize_async(
+    reader: asyncio.StreamReader,
+    memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    executor: Executor = None,
+) -> C64Archive:
+    """
+    Read binary data from a stream and parse it into an archive object. This is the
+    ``asyncio`` counterpart to ``C64Archive.deserialize``; writes to files which are
+    stored on disk (see ``memory_budget``) are run in the executor.
+
+    :param reader: The stream from which to read.
+    :param memory_budget: The memory budget, or the limit for a new memory budget
+        (defaults to the global memory budget).
+    :param executor: The executor in which to run blocking I/O.
+    :return: The parsed archive object.
+    """
+    memory_budget = MemoryBudget.resolve(memory_budget)
+    records = AsyncArchiveReader(reader)
+    header = await records.read_header()
+    archive = C64Archive(
+        archive_type=header.archive_type,
+        timestamp=header.timestamp.to_datetime(),
+        note=header.note,
+        memory_budget=memory_budget,
+    )
+    directories: typing.List[ArchiveDirectory] = []
+    async for path, record_header, body in records:
+        del directories[len(path) - 1 :]
+        record: ArchiveRecord
+        if body is None:
+            record = ArchiveDirectory(name=record_header.name)
+        elif record_header.compression_type is not CarCompressionType.NONE:
+            data = bytearray()
+            while body.remaining:
+                chunk = await body.read(CHUNK_SIZE)
+                if not chunk:
+                    raise ValueError(f"truncated record {record_header.name}")
+                data += chunk
+            record = await _run(
+                executor,
+                ArchiveFile._decode,  # pylint: disable=W0212
+                record_header,
+                bytes(data),
+                memory_budget,
+            )
+            body = None
+        else:
+            file = ArchiveFile.create(
+                name=record_header.name,
+                file_type=record_header.record_type,
+                compression_type=record_header.compression_type,
+                memory_budget=memory_budget,
+            )
+            if isinstance(file, SpooledArchiveFile) and body.size > (
+                file.memory_budget.available
+            ):
+                await _run(executor, file.rollover)
+            while body.remaining:
+                chunk = await body.read(CHUNK_SIZE)
+                if not chunk:
+                    raise ValueError(f"truncated record {record_header.name}")
+                if _blocking(file):
+                    await _run(executor, file.write, chunk)
+                else:
+                    file.write(chunk)
+            file.seek(0)
+            record = file
+        if directories:
+            directories[-1].append(record)
+        else:
+            archive.root = record
+        if isinstance(record, ArchiveDirectory):
+            directories.append(record)
+    return archive
+
+
+async def open_async(
+    path: str, mmap: bool = False, executor: Executor = None
+) -> C64Archive:
+    """
+    Read an archive file from disk (in the executor) and parse it into an archive
+    object. See ``C64Archive.open``.
+
+    :param path: The path to the archive file.
+    :param mmap: Map the archive file into memory instead of copying its contents.
+    :param executor: The executor in which to run blocking I/O.
+    :return: The parsed archive object.
+    """
+    return await _run(executor, C64Archive.open, path, mmap)
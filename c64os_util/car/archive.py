@@ -3,13 +3,22 @@ High-level API for working with C64 Archives.
 """
 
 import datetime
+import mmap as mmap_module
 import os
+import shutil
 import typing
 
 from ..util import copy_buffer
 from .common import CarArchiveType, CarCompressionType, CarRecordType
 from .header import ArchiveHeader
-from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord
+from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord, MemoryBudget
+from .record.record import PathCell
+
+if typing.TYPE_CHECKING:
+    from .blob import ArchiveBlobStore
+
+# a record found by path, and its cached path at the time
+_CachedPath = typing.Tuple[ArchiveRecord, PathCell]
 
 
 class C64Archive:
@@ -17,6 +26,11 @@ class C64Archive:
     A ``C64Archive`` represents a deserialized, in-memory, editable archive. It
     provides fields and methods for easily creating and deleting files and folders,
     and for reading and writing the contents of files.
+
+    Records found by path are cached, so repeated operations within the same
+    directories do not walk the tree from the root each time. A cached record is only
+    used while its own cached path is unchanged (it has not been renamed, moved or
+    removed, and neither have its ancestors).
     """
 
     def __init__(
@@ -24,6 +38,8 @@ class C64Archive:
         archive_type: CarArchiveType = CarArchiveType.GENERAL,
         timestamp: datetime.datetime = datetime.datetime.utcnow(),
         note: str = "",
+        blob_store: typing.Optional["ArchiveBlobStore"] = None,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
     ):
         """
         Create a new ``C64Archive`` object from scratch.
@@ -31,11 +47,19 @@ class C64Archive:
         :param archive_type: The type of archive to create.
         :param timestamp: The archive creation timestamp.
         :param note: A message to store in the archive 'note' field.
+        :param blob_store: If provided, the contents of files created with ``touch``
+            are shared with identical files through this store.
+        :param memory_budget: If provided, files created with ``touch`` share this
+            budget (or a new budget with this limit), and are moved to temporary files
+            on disk once they no longer fit within it (defaults to the global memory
+            budget; see ``set_memory_budget``).
         """
         self.header = ArchiveHeader(
             archive_type=archive_type, timestamp=timestamp, note=note
         )
         self.root = None
+        self.blob_store = blob_store
+        self.memory_budget = memory_budget
 
     @property
     def header(self) -> ArchiveHeader:
@@ -55,6 +79,46 @@ class C64Archive:
         """
         self._header = value
 
+    @property
+    def blob_store(self) -> typing.Optional["ArchiveBlobStore"]:
+        """
+        Get the store through which the contents of new files are shared.
+
+        :return: The blob store (or None).
+        """
+        return self._blob_store
+
+    @blob_store.setter
+    def blob_store(self, value: typing.Optional["ArchiveBlobStore"]):
+        """
+        Set the store through which the contents of new files are shared.
+
+        :param value: The new blob store (or None).
+        """
+        self._blob_store = value
+
+    @property
+    def memory_budget(self) -> typing.Optional[MemoryBudget]:
+        """
+        Get the memory budget which new files share.
+
+        :return: The memory budget (or None, to use the global memory budget).
+        """
+        return self._memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, value: typing.Union[None, int, MemoryBudget]):
+        """
+        Set the memory budget which new files share. This does not affect files which
+        already exist.
+
+        :param value: The new memory budget, or the limit for a new memory budget (or
+            None, to use the global memory budget).
+        """
+        if value is not None and not isinstance(value, MemoryBudget):
+            value = MemoryBudget(value)
+        self._memory_budget = value
+
     @property
     def root(self) -> typing.Optional[ArchiveRecord]:
         """
@@ -72,6 +136,26 @@ class C64Archive:
         :param value: The new root record.
         """
         self._root = value
+        self._paths: typing.Dict[typing.Tuple[str, ...], _CachedPath] = {}
+
+    def _cached_path(
+        self, key: typing.Tuple[str, ...]
+    ) -> typing.Optional[ArchiveRecord]:
+        """
+        Get a record from the cache of records found by path, if it is still there.
+
+        :param key: The path (as a tuple).
+        :return: The record (or None, if the path is not cached or is out-of-date).
+        """
+        cached = self._paths.get(key, None)
+        if cached is None:
+            return None
+        record, cell = cached
+        # pylint: disable=W0212
+        if record._path is not cell:
+            del self._paths[key]
+            return None
+        return record
 
     def _find_path(
         self,
@@ -88,19 +172,62 @@ class C64Archive:
             as directories.
         :return: The request node.
         """
-        head = path[0]
-        path = path[1:]
-        if start is None or start.name != head:
+        if start is None or start.name != path[0]:
             raise ValueError()
-        if not path:
+        if len(path) == 1:
             return start
-        if not isinstance(start, ArchiveDirectory):
-            raise ValueError()
-        head = path[0]
-        if create_directories and head not in start:
-            start += [ArchiveDirectory(name=head)]
-        start = start[head]
-        return self._find_path(start, path, create_directories=create_directories)
+        if start is not self.root:
+            return self._walk_path(start, path, 1, create_directories)
+        key = tuple(path)
+        record = self._cached_path(key)
+        if record is not None:
+            return record
+        depth = len(path) - 1
+        while depth > 1:
+            record = self._cached_path(key[:depth])
+            if record is not None:
+                break
+            depth -= 1
+        else:
+            record = start
+        return self._walk_path(record, path, depth, create_directories, key)
+
+    def _walk_path(  # pylint: disable=R0913
+        self,
+        record: ArchiveRecord,
+        path: typing.List[str],
+        depth: int,
+        create_directories: bool,
+        key: typing.Optional[typing.Tuple[str, ...]] = None,
+    ) -> ArchiveRecord:
+        """
+        Follow a path down from one of the records along it.
+
+        :param record: The record at ``path[:depth]``.
+        :param path: The full path (starting from the same record as ``_find_path``).
+        :param depth: The number of components of ``path`` which ``record`` represents.
+        :param create_directories: If true, missing entries from path will be created
+            as directories.
+        :param key: If provided, the records found along the way are cached under
+            prefixes of this path (as a tuple).
+        :return: The requested node.
+        """
+        # pylint: disable=W0212
+        for depth in range(depth, len(path)):
+            if not isinstance(record, ArchiveDirectory):
+                raise ValueError()
+            head = path[depth]
+            if create_directories and head not in record:
+                record.append(ArchiveDirectory(name=head))
+            parent_cell = record._path_cell()
+            record = record[head]
+            if key is not None:
+                cell = record._path_cell()
+                # only cache records whose own path leads through the directories
+                # which were walked (not records which are in several directories)
+                if cell.parent is parent_cell:
+                    self._paths[key[: depth + 1]] = (record, cell)
+        return record
 
     def __insert_path(
         self,
@@ -182,17 +309,17 @@ class C64Archive:
             if not missing_ok:
                 raise ValueError()
             return
-        if not missing_ok:
-            if tail not in parent:
+        if not isinstance(parent, ArchiveDirectory):
+            raise ValueError()
+        child = parent.get_child(tail)
+        if child is None:
+            if not missing_ok:
                 raise ValueError()
-        if isinstance(parent[tail], ArchiveDirectory):
-            if parent[tail].size and not recursive:
+            return
+        if isinstance(child, ArchiveDirectory):
+            if child.size and not recursive:
                 raise ValueError()
-        for i, child in enumerate(parent):
-            if child.name == tail:
-                del parent[i]
-                return
-        raise ValueError()
+        parent.remove(child)
 
     def mkdir(
         self,
@@ -244,7 +371,9 @@ class C64Archive:
         :file_type: The file type for the new file.
         :compression_type: The compression type for the new file.
         :create_directories: Create the parent directories if they do not exist.
-        :buffer: If provided, the contents of this buffer will be written to the file.
+        :buffer: If provided, the contents of this buffer will be written to the file
+            (shared through the archive's blob store, if it has one and the file is
+            kept in memory).
         :return: The newly created file record.
         """
         try:
@@ -253,11 +382,21 @@ class C64Archive:
             parts = path.split(sep)
             tail = parts[-1]
             parts = parts[:-1]
-            record = ArchiveFile(
-                name=tail, file_type=file_type, compression_type=compression_type
+            record = ArchiveFile.create(
+                name=tail,
+                file_type=file_type,
+                compression_type=compression_type,
+                memory_budget=self.memory_budget,
             )
             self.__insert_path(record, parts, create_missing=create_directories)
-            if buffer is not None:
+            if (
+                buffer is not None
+                and self.blob_store is not None
+                and type(record) is ArchiveFile  # pylint: disable=C0123
+            ):
+                data = self.blob_store.intern(buffer.read(), owner=record)
+                record._share(data)  # pylint: disable=W0212
+            elif buffer is not None:
                 copy_buffer(buffer, record)
                 record.seek(0)
             return record
@@ -285,9 +424,12 @@ class C64Archive:
         if not isinstance(self.root, ArchiveDirectory):
             yield self.root
             return
-        for path, record in self.walk():
-            for file_rec in record.files():
-                yield path + [file_rec.name], file_rec
+        names: typing.List[str] = []
+        for depth, record, _ in self.root.traverse():
+            del names[depth:]
+            names.append(record.name)
+            if isinstance(record, ArchiveFile):
+                yield list(names), record
 
     def __getitem__(self, arg):
         """
@@ -330,19 +472,98 @@ class C64Archive:
         if self.root is not None:
             self.root.serialize(buffer)
 
+    def serialized_size(self) -> int:
+        """
+        Get the number of bytes which ``serialize`` would write for this archive,
+        without serializing it (see ``ArchiveRecord.serialized_size``).
+
+        :return: The serialized size in bytes.
+        :raises ValueError: If a record is too large to be stored.
+        """
+        if self.root is None:
+            return ArchiveHeader.SIZE
+        return ArchiveHeader.SIZE + self.root.serialized_size()
+
+    def save(self, path: str):
+        """
+        Write this archive to a file on disk. The size of the archive is checked (and
+        the space for it is allocated, where the filesystem supports it) before any data
+        is written. The archive is written to a temporary file which then replaces
+        ``path``, so the archive may have been opened from ``path`` with ``mmap``.
+
+        :param path: The path to the archive file.
+        :raises ValueError: If a record is too large to be stored.
+        """
+        size = self.serialized_size()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as buffer:
+                if size and hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(buffer.fileno(), 0, size)
+                    except OSError:
+                        # not supported by this filesystem; the file grows as usual
+                        pass
+                self.serialize(buffer)
+                if buffer.tell() != size:
+                    raise ValueError("archive changed while it was being saved")
+            if os.path.exists(path):
+                shutil.copymode(path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
     @staticmethod
-    def deserialize(buffer: typing.BinaryIO) -> "C64Archive":
+    def open(path: str, mmap: bool = False) -> "C64Archive":
+        """
+        Read an archive file from disk and parse it into an archive object.
+
+        If ``mmap`` is true, the archive file is memory-mapped and the contents of each
+        file record are read-only views into the mapping (see ``MappedArchiveFile``)
+        rather than private copies. The mapping can be shared with other processes which
+        open the same archive, and it remains open for as long as any of the file
+        records refer to it.
+
+        :param path: The path to the archive file.
+        :param mmap: Map the archive file into memory instead of copying its contents.
+        :return: The parsed archive object.
+        """
+        with open(path, "rb") as buffer:
+            if not mmap:
+                return C64Archive.deserialize(buffer)
+            mapping = mmap_module.mmap(
+                buffer.fileno(), 0, access=mmap_module.ACCESS_READ
+            )
+        return C64Archive.deserialize(typing.cast(typing.BinaryIO, mapping))
+
+    @staticmethod
+    def deserialize(
+        buffer: typing.BinaryIO,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    ) -> "C64Archive":
         """
         Read binary data from a buffer and parse it into an archive object.
 
+        The buffer does not need to be seekable, so archives can be read directly from
+        pipes or sockets. If ``memory_budget`` is provided, files are stored in temporary
+        files on disk (see ``SpooledArchiveFile``) instead of in memory once the files
+        read so far fill the budget. The budget is also shared by files created later
+        with ``touch``.
+
         :param buffer: The buffer from which to read.
+        :param memory_budget: The memory budget, or the limit for a new memory budget
+            (defaults to the global memory budget).
         :return: The parsed archive object.
         """
+        memory_budget = MemoryBudget.resolve(memory_budget)
         header = ArchiveHeader.deserialize(buffer)
         archive = C64Archive(
             archive_type=header.archive_type,
             timestamp=header.timestamp.to_datetime(),
             note=header.note,
+            memory_budget=memory_budget,
         )
-        archive.root = ArchiveRecord.deserialize(buffer)
+        archive.root = ArchiveRecord.deserialize(buffer, memory_budget)
         return archive
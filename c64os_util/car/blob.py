@@ -0,0 +1,171 @@
+"""
+Classes and methods for sharing identical file contents between records.
+"""
+
+import hashlib
+import io
+import os
+import typing
+import weakref
+
+from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord
+
+
+class ArchiveBlobStore:
+    """
+    An ``ArchiveBlobStore`` holds file contents ("blobs") keyed by a hash of the data,
+    so that identical contents are only held in memory once. Records which use a blob
+    share it until they are modified (see ``ArchiveFile.copy``).
+
+    Host files read through the store are only read and hashed once, for as long as
+    their size, modification time and inode do not change, so the same asset can be
+    added to many archives cheaply.
+
+    The store keeps track of the records and buffers which it has given each blob to
+    (its "owners"), through weak references; ``prune`` removes the blobs whose owners
+    have all been garbage-collected.
+
+    Example: ::
+
+        store = ArchiveBlobStore()
+        for archive in archives:
+            archive.blob_store = store
+            archive.touch('app/icon.bin', buffer=store.open('assets/icon.bin'))
+        print(store.nbytes)
+    """
+
+    DIGEST_SIZE = 16
+
+    def __init__(self):
+        """
+        Create a new, empty blob store.
+        """
+        self._blobs: typing.Dict[bytes, bytes] = {}
+        # blobs which are already in the store are recognised by identity, without
+        # hashing them again (the store keeps them alive, so their ids are stable)
+        self._ids: typing.Dict[int, bytes] = {}
+        self._owners: typing.Dict[bytes, weakref.WeakSet] = {}
+        self._paths: typing.Dict[typing.Tuple[str, int, int, int], bytes] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Get the total size of the blobs in the store.
+
+        :return: The number of bytes.
+        """
+        return sum(len(blob) for blob in self._blobs.values())
+
+    def __len__(self) -> int:
+        """
+        Get the number of blobs in the store.
+
+        :return: The number of blobs.
+        """
+        return len(self._blobs)
+
+    @staticmethod
+    def digest(data) -> bytes:
+        """
+        Compute the key under which some data is stored.
+
+        :param data: A bytes-like object.
+        :return: The digest.
+        """
+        return hashlib.blake2b(data, digest_size=ArchiveBlobStore.DIGEST_SIZE).digest()
+
+    def intern(self, data, owner: typing.Optional[object] = None) -> bytes:
+        """
+        Add data to the store (if identical data is not there already).
+
+        :param data: A bytes-like object.
+        :param owner: The record or buffer which is going to use the stored bytes (the
+            blob is kept by ``prune`` for as long as any of its owners exist).
+        :return: The stored bytes object with the same contents.
+        """
+        key = self._ids.get(id(data), None)
+        if key is None or self._blobs[key] is not data:
+            key = ArchiveBlobStore.digest(data)
+            blob = self._blobs.get(key, None)
+            if blob is None:
+                # pylint: disable=C0123
+                blob = data if type(data) is bytes else bytes(data)
+                self._blobs[key] = blob
+                self._ids[id(blob)] = key
+                self._owners[key] = weakref.WeakSet()
+            elif blob != data:
+                # a hash collision: keep the data, but do not share it
+                return bytes(data)
+        if owner is not None:
+            self._owners[key].add(owner)
+        return self._blobs[key]
+
+    def read(self, path: str) -> bytes:
+        """
+        Read a host file into the store.
+
+        :param path: The path to the file on the host.
+        :return: The stored bytes object with the file's contents.
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        blob = self._paths.get(key, None)
+        if blob is None:
+            with open(path, "rb") as buffer:
+                blob = self.intern(buffer.read())
+            self._paths[key] = blob
+        return blob
+
+    def open(self, path: str) -> io.BytesIO:
+        """
+        Read a host file into the store, and open the stored contents as a buffer
+        (which can be passed to ``C64Archive.touch``).
+
+        :param path: The path to the file on the host.
+        :return: A buffer which shares the stored contents (and owns the blob).
+        """
+        blob = self.read(path)
+        buffer = io.BytesIO(blob)
+        self.intern(blob, owner=buffer)
+        return buffer
+
+    def dedup(self, record: ArchiveRecord) -> int:
+        """
+        Replace the contents of a file (or of every file within a directory) with the
+        stored blob which has the same contents, adding new blobs as needed. Files
+        which are backed by memory maps or temporary files are left alone.
+
+        :param record: The file or directory.
+        :return: The number of bytes which are no longer held separately.
+        """
+        saved = 0
+        stack = [record]
+        while stack:
+            record = stack.pop()
+            if isinstance(record, ArchiveDirectory):
+                stack.extend(record)
+                continue
+            if type(record) is not ArchiveFile:  # pylint: disable=C0123
+                continue
+            value = record.getvalue()
+            blob = self.intern(value, owner=record)
+            if blob is not value:
+                record._share(blob, record.tell())  # pylint: disable=W0212
+                saved += len(blob)
+        return saved
+
+    def prune(self) -> int:
+        """
+        Remove blobs which no longer have any owners (see ``intern``). An owner which
+        has been modified since (so it no longer shares the blob) still counts, until
+        it is garbage-collected.
+
+        :return: The number of blobs removed.
+        """
+        unused = [key for key, owners in self._owners.items() if not owners]
+        for key in unused:
+            blob = self._blobs.pop(key)
+            del self._ids[id(blob)]
+            del self._owners[key]
+        self._paths = {k: b for k, b in self._paths.items() if id(b) in self._ids}
+        return len(unused)
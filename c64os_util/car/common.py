@@ -39,11 +39,32 @@ class CarArchiveType(enum.Enum):
 class CarCompressionType(enum.Enum):
     """
     Each file header contains a "compression type" field, which indicates whether the
-    file's data has been compressed. This enum defines the supported compression types.
+    file's data has been compressed. This enum defines the compression types which C64
+    OS is known to use (see ``c64os_util.car.compression`` for the codecs which handle
+    them).
+
+    Any other value which fits in the field is represented by a pseudo-member named
+    ``TYPE_<value>``, so that archives which use it can still be read, and codecs can be
+    registered for it.
     """
 
     NONE = 0
 
+    @classmethod
+    def _missing_(cls, value):
+        """
+        Create (or look up) the pseudo-member for a value which is not defined.
+
+        :param value: The value.
+        :return: The pseudo-member (or None, if the value does not fit in the field).
+        """
+        if not isinstance(value, int) or not 0 <= value <= 0xFF:
+            return None
+        member = object.__new__(cls)
+        member._name_ = f"TYPE_{value}"  # pylint: disable=W0212
+        member._value_ = value  # pylint: disable=W0212
+        return cls._value2member_map_.setdefault(value, member)
+
     def serialize(self, buffer: typing.BinaryIO):
         """
         Convert this enum into binary data and write it to a buffer.
@@ -0,0 +1,277 @@
+"""
+Classes and methods for compressing and decompressing the contents of file records.
+
+Each ``CarCompressionType`` is handled by a codec: a pair of functions which compress
+or decompress data from one buffer into another, a chunk at a time. Codecs for the
+built-in compression types are registered when this module is imported; other
+implementations can be registered in their place (see ``register_codec``).
+
+This package also provides a run-length encoding codec, registered under ``RLE``: an
+extension value which is private to this package. C64 OS does not define it, and cannot
+decompress archives which use it.
+
+The ``RLE`` codec uses PackBits-style run-length encoding: each run starts with a
+control byte ``n``; ``n`` from 0 to 127 is followed by ``n + 1`` literal bytes, ``n``
+from 129 to 255 is followed by a single byte which is repeated ``257 - n`` times, and
+128 is ignored.
+"""
+
+import io
+import re
+import typing
+
+from ..util import copy_buffer
+from .common import CarCompressionType
+
+CHUNK_SIZE = 64 * 1024
+
+# the compression type under which the run-length encoding codec is registered (this is
+# not an on-disk value which C64 OS knows about)
+RLE = CarCompressionType(0xFF)
+
+CompressFunction = typing.Callable[[typing.BinaryIO, typing.BinaryIO], int]
+DecompressFunction = typing.Callable[[typing.BinaryIO, typing.BinaryIO, int], int]
+
+
+class ArchiveCodec:
+    """
+    An ``ArchiveCodec`` compresses and decompresses data for one compression type.
+    """
+
+    __slots__ = ("_compression_type", "_compress", "_decompress")
+
+    def __init__(
+        self,
+        compression_type: CarCompressionType,
+        compress: CompressFunction,
+        decompress: DecompressFunction,
+    ):
+        """
+        Create a new codec.
+
+        :param compression_type: The compression type which the codec handles.
+        :param compress: A function which reads ``src`` until it is exhausted and
+            writes the compressed data to ``dest``, returning the number of bytes
+            written.
+        :param decompress: A function which reads exactly ``size`` bytes of compressed
+            data from ``src`` and writes the decompressed data to ``dest``, returning
+            the number of bytes written.
+        """
+        self._compression_type = compression_type
+        self._compress = compress
+        self._decompress = decompress
+
+    @property
+    def compression_type(self) -> CarCompressionType:
+        """
+        Get the compression type which the codec handles.
+
+        :return: The compression type.
+        """
+        return self._compression_type
+
+    def compress(self, src: typing.BinaryIO, dest: typing.BinaryIO) -> int:
+        """
+        Compress the remaining contents of a buffer.
+
+        :param src: The buffer from which to read the data.
+        :param dest: The buffer into which to write the compressed data.
+        :return: The number of bytes written.
+        """
+        return self._compress(src, dest)
+
+    def decompress(self, src: typing.BinaryIO, dest: typing.BinaryIO, size: int) -> int:
+        """
+        Decompress data from a buffer.
+
+        :param src: The buffer from which to read the compressed data.
+        :param dest: The buffer into which to write the data.
+        :param size: The number of bytes of compressed data to read.
+        :return: The number of bytes written.
+        """
+        return self._decompress(src, dest, size)
+
+    def compress_bytes(self, data) -> bytes:
+        """
+        Compress a bytes-like object.
+
+        :param data: The data.
+        :return: The compressed data.
+        """
+        dest = io.BytesIO()
+        self.compress(io.BytesIO(data), dest)
+        return dest.getvalue()
+
+    def decompress_bytes(self, data) -> bytes:
+        """
+        Decompress a bytes-like object.
+
+        :param data: The compressed data.
+        :return: The data.
+        """
+        dest = io.BytesIO()
+        self.decompress(io.BytesIO(data), dest, len(data))
+        return dest.getvalue()
+
+
+_CODECS: typing.Dict[CarCompressionType, ArchiveCodec] = {}
+
+
+def register_codec(
+    compression_type: CarCompressionType,
+    compress: CompressFunction,
+    decompress: DecompressFunction,
+) -> ArchiveCodec:
+    """
+    Register the functions which handle a compression type, replacing the codec which
+    was registered for it before (if any).
+
+    :param compression_type: The compression type.
+    :param compress: The compression function (see ``ArchiveCodec``).
+    :param decompress: The decompression function (see ``ArchiveCodec``).
+    :return: The new codec.
+    """
+    codec = ArchiveCodec(compression_type, compress, decompress)
+    _CODECS[compression_type] = codec
+    return codec
+
+
+def get_codec(compression_type: CarCompressionType) -> ArchiveCodec:
+    """
+    Get the codec which handles a compression type.
+
+    :param compression_type: The compression type.
+    :return: The codec.
+    :raises ValueError: If no codec is registered for the compression type.
+    """
+    codec = _CODECS.get(compression_type, None)
+    if codec is None:
+        raise ValueError(f"unsupported compression type {compression_type.name}")
+    return codec
+
+
+def _store(src: typing.BinaryIO, dest: typing.BinaryIO) -> int:
+    """
+    Copy data without compressing it.
+
+    :param src: The buffer from which to read the data.
+    :param dest: The buffer into which to write the data.
+    :return: The number of bytes written.
+    """
+    return copy_buffer(src, dest)
+
+
+def _unstore(src: typing.BinaryIO, dest: typing.BinaryIO, size: int) -> int:
+    """
+    Copy data which was not compressed.
+
+    :param src: The buffer from which to read the data.
+    :param dest: The buffer into which to write the data.
+    :param size: The number of bytes to copy.
+    :return: The number of bytes written.
+    """
+    count = copy_buffer(src, dest, max_size=size)
+    if count != size:
+        raise ValueError("truncated record")
+    return count
+
+
+# runs of three or more identical bytes (shorter runs are cheaper to store as literals)
+_RUN = re.compile(rb"(.)\1{2,}", re.DOTALL)
+_MAX_RUN = 128
+
+
+def _rle_literals(data: bytes, start: int, end: int, out: bytearray):
+    """
+    Encode a range of bytes as literals.
+
+    :param data: The data.
+    :param start: The start of the range.
+    :param end: The end of the range.
+    :param out: The buffer to which to append the encoded data.
+    """
+    while start < end:
+        count = min(end - start, _MAX_RUN)
+        out.append(count - 1)
+        out += data[start : start + count]
+        start += count
+
+
+def _rle_compress(src: typing.BinaryIO, dest: typing.BinaryIO) -> int:
+    """
+    Compress data using run-length encoding. Runs are found with a regular expression,
+    so the bytes between runs are copied in bulk.
+
+    :param src: The buffer from which to read the data.
+    :param dest: The buffer into which to write the compressed data.
+    :return: The number of bytes written.
+    """
+    count = 0
+    while True:
+        data = src.read(CHUNK_SIZE)
+        if not data:
+            return count
+        out = bytearray()
+        position = 0
+        for match in _RUN.finditer(data):
+            start, end = match.span()
+            _rle_literals(data, position, start, out)
+            value = data[start]
+            length = end - start
+            while length >= 2:
+                run = min(length, _MAX_RUN)
+                out.append(257 - run)
+                out.append(value)
+                length -= run
+            position = end - length
+        _rle_literals(data, position, len(data), out)
+        dest.write(out)
+        count += len(out)
+
+
+def _rle_decompress(src: typing.BinaryIO, dest: typing.BinaryIO, size: int) -> int:
+    """
+    Decompress run-length encoded data.
+
+    :param src: The buffer from which to read the compressed data.
+    :param dest: The buffer into which to write the data.
+    :param size: The number of bytes of compressed data to read.
+    :return: The number of bytes written.
+    """
+    count = 0
+    pending = b""
+    remaining = size
+    while remaining:
+        chunk = src.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            raise ValueError("truncated record")
+        remaining -= len(chunk)
+        data = pending + chunk if pending else chunk
+        end = len(data)
+        out = bytearray()
+        position = 0
+        while position < end:
+            control = data[position]
+            if control < 128:
+                stop = position + control + 2
+                if stop > end:
+                    break
+                out += data[position + 1 : stop]
+                position = stop
+            elif control > 128:
+                if position + 2 > end:
+                    break
+                out += data[position + 1 : position + 2] * (257 - control)
+                position += 2
+            else:
+                position += 1
+        pending = data[position:]
+        dest.write(out)
+        count += len(out)
+    if pending:
+        raise ValueError("truncated run-length encoded data")
+    return count
+
+
+register_codec(CarCompressionType.NONE, _store, _unstore)
+register_codec(RLE, _rle_compress, _rle_decompress)
@@ -3,6 +3,7 @@ Classes and methods related to the archive header.
 """
 
 import datetime
+import struct
 import typing
 
 from ..util import LC_CODEC
@@ -15,6 +16,8 @@ class ArchiveTimestamp:  # pylint: disable=R0902
     represents an archive timestamp.
     """
 
+    __slots__ = ("_year", "_month", "_day", "_hour", "_minute")
+
     def __init__(  # pylint: disable=R0913
         self,
         year: int = 1900,
@@ -173,15 +176,22 @@ class ArchiveTimestamp:  # pylint: disable=R0902
         return ArchiveTimestamp(**kwargs)
 
 
+_ARCHIVE_TYPES = {archive_type.value: archive_type for archive_type in CarArchiveType}
+
+
 class ArchiveHeader:
     """
     The archive header contains some metadata about the file. This class provides
     properties to read and write that metadata.
     """
 
+    __slots__ = ("_archive_type", "_timestamp", "_note")
+
     MAX_NOTE_SIZE = 31
     CAR_MAGIC = "C64Archive"
     CAR_VERSION = 2
+    STRUCT = struct.Struct("<B10sB5B31s")
+    SIZE = STRUCT.size
 
     def __init__(
         self,
@@ -249,37 +259,68 @@ class ArchiveHeader:
         """
         self._note = value
 
+    def pack(self) -> bytes:
+        """
+        Convert this header into binary data.
+
+        :return: The binary data.
+        """
+        note_bytes = self.note.encode(LC_CODEC)
+        if len(note_bytes) > ArchiveHeader.MAX_NOTE_SIZE:
+            raise ValueError(f"archive note {self.note} is too long")
+        timestamp = self.timestamp
+        return ArchiveHeader.STRUCT.pack(
+            self.archive_type.value,
+            ArchiveHeader.CAR_MAGIC.encode(LC_CODEC),
+            ArchiveHeader.CAR_VERSION,
+            timestamp.year - 1900,
+            timestamp.month,
+            timestamp.day,
+            timestamp.hour,
+            timestamp.minute,
+            note_bytes.ljust(ArchiveHeader.MAX_NOTE_SIZE, b"\0"),
+        )
+
+    @staticmethod
+    def unpack(data, offset: int = 0) -> "ArchiveHeader":
+        """
+        Parse binary data into a header object.
+
+        :param data: A bytes-like object containing the header.
+        :param offset: The offset of the header within ``data``.
+        :return: The parsed header object.
+        """
+        fields = ArchiveHeader.STRUCT.unpack_from(data, offset)
+        type_value, magic, version, year, month, day, hour, minute, note = fields
+        assert magic.decode(LC_CODEC) == ArchiveHeader.CAR_MAGIC
+        assert version == ArchiveHeader.CAR_VERSION
+        archive_type = _ARCHIVE_TYPES.get(type_value)
+        if archive_type is None:
+            archive_type = CarArchiveType(type_value)
+        timestamp = ArchiveTimestamp(year + 1900, month, day, hour, minute)
+        return ArchiveHeader(
+            archive_type=archive_type,
+            timestamp=timestamp.to_datetime(),
+            note=note.rstrip(b"\0").decode(LC_CODEC),
+        )
+
     def serialize(self, buffer: typing.BinaryIO):
         """
         Convert this header into binary data and write it to a buffer.
 
         :param buffer: The buffer into which to write.
         """
-        self.archive_type.serialize(buffer)
-        buffer.write(ArchiveHeader.CAR_MAGIC.encode(LC_CODEC))
-        buffer.write(ArchiveHeader.CAR_VERSION.to_bytes(1, "little"))
-        self.timestamp.serialize(buffer)
-        note_bytes = self.note.encode(LC_CODEC)
-        note_bytes = note_bytes.ljust(ArchiveHeader.MAX_NOTE_SIZE, b"\0")
-        buffer.write(note_bytes)
+        buffer.write(self.pack())
 
     @staticmethod
     def deserialize(buffer: typing.BinaryIO) -> "ArchiveHeader":
         """
         Read binary data from a buffer and parse it into a header object.
 
-        :param header: The header (parsed from the buffer already).
         :param buffer: The buffer from which to read.
         :return: The parsed header object.
         """
-        archive_type = CarArchiveType.deserialize(buffer)
-        magic = buffer.read(10).decode(LC_CODEC)
-        version = int.from_bytes(buffer.read(1), "little")
-        timestamp = ArchiveTimestamp.deserialize(buffer)
-        note_buff = buffer.read(ArchiveHeader.MAX_NOTE_SIZE)
-        note = note_buff.rstrip(b"\0").decode(LC_CODEC)
-        assert magic == ArchiveHeader.CAR_MAGIC
-        assert version == ArchiveHeader.CAR_VERSION
-        return ArchiveHeader(
-            archive_type=archive_type, timestamp=timestamp.to_datetime(), note=note
-        )
+        data = buffer.read(ArchiveHeader.SIZE)
+        if len(data) != ArchiveHeader.SIZE:
+            raise ValueError("truncated archive header")
+        return ArchiveHeader.unpack(data)
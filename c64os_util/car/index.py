@@ -0,0 +1,278 @@
+"""
+Classes and methods for scanning the layout of an archive without reading the contents
+of its files.
+"""
+
+import os
+import typing
+
+from ..util import is_seekable, skip_buffer
+from .common import CarRecordType
+from .header import ArchiveHeader
+from .layout import walk_layout
+from .record.header import ArchiveRecordHeader
+
+
+class ArchiveIndexEntry:
+    """
+    An ``ArchiveIndexEntry`` describes a single record within an archive: its full path,
+    its header, and where it is located within the archive.
+    """
+
+    __slots__ = ("_path", "_header", "_header_offset", "_body_offset")
+
+    def __init__(
+        self,
+        path: typing.List[str],
+        header: ArchiveRecordHeader,
+        header_offset: int,
+        body_offset: int,
+    ):
+        """
+        Create a new index entry.
+
+        :param path: The full path of the record (represented as a list).
+        :param header: The record header.
+        :param header_offset: The offset of the record header within the archive.
+        :param body_offset: The offset of the record body within the archive.
+        """
+        self._path = path
+        self._header = header
+        self._header_offset = header_offset
+        self._body_offset = body_offset
+
+    @property
+    def path(self) -> typing.List[str]:
+        """
+        Get the full path of the record (represented as a list).
+
+        :return: The record path.
+        """
+        return self._path
+
+    @property
+    def header(self) -> ArchiveRecordHeader:
+        """
+        Get the record header.
+
+        :return: The record header.
+        """
+        return self._header
+
+    @property
+    def name(self) -> str:
+        """
+        Get the record name.
+
+        :return: The record name.
+        """
+        return self.header.name
+
+    @property
+    def record_type(self) -> CarRecordType:
+        """
+        Get the record type (file or directory).
+
+        :return: The record type.
+        """
+        return self.header.record_type
+
+    @property
+    def size(self) -> int:
+        """
+        Get the record size. (Size of file in bytes, or number of children.)
+
+        :return: The record size.
+        """
+        return self.header.size
+
+    @property
+    def header_offset(self) -> int:
+        """
+        Get the offset of the record header within the archive.
+
+        :return: The header offset.
+        """
+        return self._header_offset
+
+    @property
+    def body_offset(self) -> int:
+        """
+        Get the offset of the record body (the file contents, or the first child of a
+        directory) within the archive.
+
+        :return: The body offset.
+        """
+        return self._body_offset
+
+
+class ArchiveIndex:
+    """
+    An ``ArchiveIndex`` is a lightweight, read-only listing of the records within an
+    archive. It is built by reading only the record headers and seeking past the file
+    contents, so it is much cheaper than deserializing a ``C64Archive`` when only the
+    layout of the archive is needed.
+
+    Example: ::
+
+        with open('test.car', 'rb') as f:
+            index = ArchiveIndex.deserialize(f)
+        for entry in index.files():
+            print('/'.join(entry.path), entry.size)
+    """
+
+    def __init__(
+        self,
+        header: ArchiveHeader,
+        entries: typing.Optional[typing.List[ArchiveIndexEntry]] = None,
+    ):
+        """
+        Create a new index.
+
+        :param header: The archive header.
+        :param entries: The index entries (in archive order).
+        """
+        self._header = header
+        if entries is None:
+            entries = []
+        self._entries = entries
+        self._paths = {tuple(entry.path): entry for entry in entries}
+
+    @property
+    def header(self) -> ArchiveHeader:
+        """
+        Get the header (metadata) of the archive.
+
+        :return: The header.
+        """
+        return self._header
+
+    @property
+    def entries(self) -> typing.List[ArchiveIndexEntry]:
+        """
+        Get all entries in the index (in archive order).
+
+        :return: List of index entries.
+        """
+        return self._entries
+
+    def ls(  # pylint: disable=C0103
+        self, path: str, sep: str = os.path.sep
+    ) -> ArchiveIndexEntry:
+        """
+        Find the entry for the record (file or directory) at the given path.
+
+        :param path: A path-like string representing the record's location within the
+            archive.
+        :param sep: The character used as a path separator (usually '/' or '\\').
+        :return: The requested entry.
+        """
+        entry = self._paths.get(tuple(path.split(sep)), None)
+        if entry is None:
+            raise KeyError(f"archive does not contain {path}")
+        return entry
+
+    def files(self):
+        """
+        A generator which iterates through the entries of all files (not directories)
+        in the archive.
+        """
+        for entry in self:
+            if entry.record_type.is_directory():
+                continue
+            yield entry
+
+    def directories(self):
+        """
+        A generator which iterates through the entries of all directories in the
+        archive.
+        """
+        for entry in self:
+            if not entry.record_type.is_directory():
+                continue
+            yield entry
+
+    def __len__(self):
+        """
+        Get the number of records in the index.
+
+        :return: The number of records.
+        """
+        return len(self._entries)
+
+    def __iter__(self):
+        """
+        Iterate through each entry in the index (in archive order).
+        """
+        return iter(self._entries)
+
+    def __getitem__(self, index: int) -> ArchiveIndexEntry:
+        """
+        Get an entry by numeric index.
+
+        :return: The matching entry.
+        """
+        return self._entries[index]
+
+    @staticmethod
+    def from_headers(
+        header: ArchiveHeader,
+        record_headers: typing.Iterable[ArchiveRecordHeader],
+        offset: int = ArchiveHeader.SIZE,
+    ) -> "ArchiveIndex":
+        """
+        Build an index from a sequence of record headers (in archive order). Paths and
+        offsets are derived from the sizes recorded in the headers.
+
+        :param header: The archive header.
+        :param record_headers: The record headers.
+        :param offset: The offset of the first record header within the archive.
+        :return: The archive index.
+        """
+        entries = []
+        parents: typing.List[str] = []
+        for depth, record_header in walk_layout(record_headers):
+            del parents[depth:]
+            body_offset = offset + ArchiveRecordHeader.SIZE
+            path = parents + [record_header.name]
+            entries.append(ArchiveIndexEntry(path, record_header, offset, body_offset))
+            offset = body_offset
+            if record_header.record_type.is_directory():
+                parents.append(record_header.name)
+                continue
+            offset += record_header.size
+        return ArchiveIndex(header, entries)
+
+    @staticmethod
+    def _scan(buffer: typing.BinaryIO) -> typing.Iterator[ArchiveRecordHeader]:
+        """
+        A generator which reads record headers from a buffer, skipping over the
+        contents of each file.
+
+        :param buffer: The buffer from which to read.
+        :return: The record headers.
+        """
+        while True:
+            record_header = ArchiveRecordHeader.deserialize(buffer)
+            if not record_header.record_type.is_directory():
+                if skip_buffer(buffer, record_header.size) != record_header.size:
+                    raise ValueError(f"truncated record {record_header.name}")
+            yield record_header
+
+    @staticmethod
+    def deserialize(buffer: typing.BinaryIO) -> "ArchiveIndex":
+        """
+        Read the headers from an archive and build an index. The contents of files are
+        skipped over rather than read. If the buffer is not seekable (such as a pipe),
+        the contents are read and discarded, and offsets are relative to the position
+        at which reading started.
+
+        :param buffer: The buffer from which to read.
+        :return: The archive index.
+        """
+        offset = buffer.tell() if is_seekable(buffer) else 0
+        header = ArchiveHeader.deserialize(buffer)
+        offset += ArchiveHeader.SIZE
+        return ArchiveIndex.from_headers(
+            header, ArchiveIndex._scan(buffer), offset=offset
+        )
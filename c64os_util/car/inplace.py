@@ -0,0 +1,191 @@
+"""
+Classes and methods for modifying archive files on disk without rewriting them.
+"""
+
+import datetime
+import os
+import shutil
+import typing
+
+from .archive import C64Archive
+from .common import CarArchiveType
+from .header import ArchiveHeader, ArchiveTimestamp
+from .index import ArchiveIndex, ArchiveIndexEntry
+from .record import ArchiveDirectory, ArchiveRecord
+from .record.header import ArchiveRecordHeader
+
+
+def _fsync(buffer: typing.BinaryIO):
+    """
+    Flush a file and wait for the data to reach the disk.
+
+    :param buffer: The file.
+    """
+    buffer.flush()
+    os.fsync(buffer.fileno())
+
+
+def _rewrite(
+    path: str,
+    parent: typing.List[str],
+    records: typing.List[ArchiveRecord],
+    create_missing: bool,
+):
+    """
+    Append records by deserializing the whole archive, adding the records, and
+    atomically replacing the archive file with a re-serialized copy.
+
+    :param path: The path to the archive file.
+    :param parent: The path of the parent directory (represented as a list).
+    :param records: The records to append.
+    :param create_missing: Create the parent directories if they do not exist.
+    """
+    with open(path, "rb") as buffer:
+        archive = C64Archive.deserialize(buffer)
+    directory = archive.mkdir(
+        "/".join(parent), sep="/", create_missing=create_missing, exists_ok=True
+    )
+    directory.extend(records)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as buffer:
+            archive.serialize(buffer)
+            _fsync(buffer)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _find_parent(
+    index: ArchiveIndex, parent: typing.List[str], create_missing: bool
+) -> typing.Tuple[ArchiveIndexEntry, typing.List[str]]:
+    """
+    Find the deepest existing directory along the path to the parent directory.
+
+    :param index: The archive index.
+    :param parent: The path of the parent directory (represented as a list).
+    :param create_missing: Allow directories along the path to be missing.
+    :return: The index entry of the deepest existing directory, and the names of the
+        directories which are missing below it.
+    """
+    for depth in range(len(parent), 0, -1):
+        try:
+            entry = index.ls("/".join(parent[:depth]), sep="/")
+        except KeyError:
+            continue
+        if not entry.record_type.is_directory():
+            raise ValueError(f"{entry.name} is not a directory")
+        missing = parent[depth:]
+        if missing and not create_missing:
+            raise KeyError(f"{entry.name} does not contain {missing[0]}")
+        return entry, missing
+    raise ValueError(f"archive does not contain {parent[0]}")
+
+
+def append_in_place(  # pylint: disable=R0914
+    path: str,
+    records: typing.List[ArchiveRecord],
+    parent: typing.Optional[str] = None,
+    sep: str = os.path.sep,
+    create_missing: bool = False,
+) -> bool:
+    """
+    Append records as children of a directory within an archive file, modifying the
+    archive file directly.
+
+    Records are stored depth-first, so if the parent directory is on the "tail" of the
+    archive (it is the root, or the last child of a directory on the tail), then its
+    children end at the end of the archive. In that case the new records are written
+    at the end of the file, and then the child count in the parent's header is patched;
+    the cost depends only on the size of the new records. Until the header is patched,
+    the new records are just ignored trailing data, so an interrupted append leaves the
+    archive unchanged.
+
+    Otherwise, the archive is deserialized and a new copy (with the records added)
+    atomically replaces the original.
+
+    :param path: The path to the archive file.
+    :param records: The records to append.
+    :param parent: A path-like string representing the location of the parent
+        directory within the archive (defaults to the root).
+    :param sep: The character used as a path separator (usually '/' or '\\').
+    :param create_missing: Create the parent directories if they do not exist.
+    :return: True if the archive was modified in place, False if it was rewritten.
+    """
+    names = [record.name for record in records]
+    if len(set(names)) != len(names):
+        raise ValueError("records to be appended must have unique names")
+    with open(path, "r+b") as buffer:
+        index = ArchiveIndex.deserialize(buffer)
+        parts = [index[0].name] if parent is None else parent.split(sep)
+        entry, missing = _find_parent(index, parts, create_missing)
+        last = index[len(index) - 1]
+        if last.path[: len(entry.path)] != entry.path:
+            buffer.close()
+            _rewrite(path, parts, records, create_missing)
+            return False
+        new_records = records
+        for name in reversed(missing):
+            directory = ArchiveDirectory(name=name)
+            directory.extend(new_records)
+            new_records = [directory]
+        if not missing:
+            children = {e.name for e in index if e.path[:-1] == entry.path}
+            for name in names:
+                if name in children:
+                    raise ValueError(f"{entry.name} already contains {name}")
+        size = entry.size + len(new_records)
+        if size > ArchiveRecordHeader.MAX_SIZE:
+            raise ValueError(f"{entry.name} has too many children")
+        end = last.body_offset
+        if not last.record_type.is_directory():
+            end += last.size
+        buffer.seek(end)
+        for record in new_records:
+            record.serialize(buffer)
+        buffer.truncate()
+        _fsync(buffer)
+        buffer.seek(entry.header_offset + ArchiveRecordHeader.SIZE_OFFSET)
+        buffer.write(size.to_bytes(3, "little"))
+        _fsync(buffer)
+    return True
+
+
+def update_header(
+    path: str,
+    archive_type: typing.Optional[CarArchiveType] = None,
+    timestamp: typing.Optional[datetime.datetime] = None,
+    note: typing.Optional[str] = None,
+) -> ArchiveHeader:
+    """
+    Change the metadata of an archive file. The archive header has a fixed size and
+    location, so only the header itself is read and written (with a single write),
+    regardless of the size of the archive.
+
+    :param path: The path to the archive file.
+    :param archive_type: The new archive type (if omitted, it is not changed).
+    :param timestamp: The new archive timestamp (if omitted, it is not changed).
+    :param note: The new archive note (if omitted, it is not changed).
+    :return: The updated archive header.
+    """
+    # unbuffered, so that the header is read and written with one call each (seek
+    # and read/write work everywhere, unlike os.pread and os.pwrite)
+    with open(path, "r+b", buffering=0) as buffer:
+        data = buffer.read(ArchiveHeader.SIZE)
+        if len(data) != ArchiveHeader.SIZE:
+            raise ValueError("truncated archive header")
+        header = ArchiveHeader.unpack(data)
+        if archive_type is not None:
+            header.archive_type = archive_type
+        if timestamp is not None:
+            header.timestamp = ArchiveTimestamp.from_datetime(timestamp)
+        if note is not None:
+            header.note = note
+        data = header.pack()
+        buffer.seek(0)
+        if buffer.write(data) != len(data):
+            raise OSError(f"short write to {path}")
+    return header
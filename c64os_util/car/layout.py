@@ -0,0 +1,162 @@
+"""
+Classes and methods for following the layout of the records within an archive.
+
+Records are stored depth-first: each directory header is followed by all of its
+descendants, and the size of a directory is its number of children. So the path of a
+record can only be found by keeping track of how many children each open directory
+still has to come. Everything which reads or writes records one at a time shares this
+bookkeeping.
+"""
+
+import typing
+
+from .record.header import ArchiveRecordHeader
+
+T = typing.TypeVar("T")
+
+
+class ArchiveLayout:
+    """
+    An ``ArchiveLayout`` keeps track of where the next record belongs within an archive
+    which is being read or written one record at a time: the number of children which
+    each open directory still has to come.
+
+    Example: ::
+
+        layout = ArchiveLayout()
+        while not layout.complete:
+            header = ArchiveRecordHeader.deserialize(f)
+            depth = layout.begin(ArchiveLayout.children(header))
+    """
+
+    __slots__ = ("_remaining",)
+
+    def __init__(self):
+        """
+        Create a new layout, positioned before the root record.
+        """
+        # the number of records still to come at each depth (the root is the only
+        # record at depth 0)
+        self._remaining = [1]
+
+    @staticmethod
+    def children(header: ArchiveRecordHeader) -> typing.Optional[int]:
+        """
+        Get the number of children which follow a record header.
+
+        :param header: The record header.
+        :return: The number of children (or None, if the record is a file).
+        """
+        if header.record_type.is_directory():
+            return header.size
+        return None
+
+    @property
+    def complete(self) -> bool:
+        """
+        Check whether every record which the archive needs has been accounted for.
+
+        :return: True if the archive is complete.
+        """
+        remaining = self._remaining
+        while remaining and not remaining[-1]:
+            remaining.pop()
+        return not remaining
+
+    def begin(self, children: typing.Optional[int] = None) -> int:
+        """
+        Account for the next record.
+
+        :param children: The number of children of the record (or None, if the record
+            is a file).
+        :return: The depth of the record (0 for the root).
+        :raises ValueError: If the archive is already complete.
+        """
+        if self.complete:
+            raise ValueError("the archive is already complete")
+        remaining = self._remaining
+        remaining[-1] -= 1
+        depth = len(remaining) - 1
+        if children is not None:
+            remaining.append(children)
+        return depth
+
+    def pack(self, header: ArchiveRecordHeader) -> bytes:
+        """
+        Account for a record which is about to be written, and convert its header into
+        binary data.
+
+        :param header: The record header.
+        :return: The binary data.
+        :raises ValueError: If the archive is already complete, or the header cannot be
+            stored.
+        """
+        data = header.pack()
+        self.begin(ArchiveLayout.children(header))
+        return data
+
+
+@typing.overload
+def walk_layout(
+    records: typing.Iterable[ArchiveRecordHeader],
+) -> typing.Iterator[typing.Tuple[int, ArchiveRecordHeader]]:
+    ...
+
+
+@typing.overload
+def walk_layout(
+    records: typing.Iterable[T],
+    children: typing.Callable[[T], typing.Optional[int]],
+) -> typing.Iterator[typing.Tuple[int, T]]:
+    ...
+
+
+def walk_layout(
+    records: typing.Iterable[typing.Any],
+    children: typing.Callable[[typing.Any], typing.Optional[int]] = (
+        ArchiveLayout.children
+    ),
+) -> typing.Iterator[typing.Tuple[int, typing.Any]]:
+    """
+    A generator which follows the layout of an archive through a sequence of records
+    (in archive order), stopping after the last record of the archive. The next record
+    is only requested from ``records`` once the previous one has been yielded, so it
+    can be an iterator which reads from the archive as it goes.
+
+    :param records: The records (usually record headers).
+    :param children: A function which gets the number of children of a record (or
+        None, if the record is a file); required unless the records are record
+        headers.
+    :return: The depth of each record (0 for the root), and the record itself.
+    :raises ValueError: If ``records`` ends before the archive is complete.
+    """
+    iterator = iter(records)
+    # the same bookkeeping as ``ArchiveLayout``, inlined (this runs once per record,
+    # and the method calls would make bulk scans noticeably slower)
+    remaining = [1]
+    while True:
+        while remaining and not remaining[-1]:
+            remaining.pop()
+        if not remaining:
+            return
+        record = next(iterator, None)
+        if record is None:
+            raise ValueError("archive is missing records")
+        remaining[-1] -= 1
+        depth = len(remaining) - 1
+        count = children(record)
+        if count is not None:
+            remaining.append(count)
+        yield depth, record
+
+
+def read_headers(buffer: typing.BinaryIO) -> typing.Iterator[ArchiveRecordHeader]:
+    """
+    A generator which reads consecutive record headers from a buffer (without skipping
+    anything in between), for use with ``walk_layout``.
+
+    :param buffer: The buffer from which to read.
+    :return: The record headers.
+    """
+    while True:
+        yield ArchiveRecordHeader.deserialize(buffer)
@@ -8,4 +8,8 @@ can have children). There are some requirements; mostly, you can't have more tha
 record of the same name in a single place.
 """
 
-from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord
+from .budget import MemoryBudget, get_memory_budget, set_memory_budget
+from .file import ArchiveFile
+from .mapped import MappedArchiveFile
+from .record import ArchiveDirectory, ArchiveRecord, TraversalOrder
+from .spooled import SpooledArchiveFile
@@ -0,0 +1,132 @@
+"""
+A memory budget limits how much memory the contents of a group of files may use, before
+further contents are moved to temporary files on disk.
+"""
+
+import typing
+
+
+class MemoryBudget:
+    """
+    A ``MemoryBudget`` limits the total number of bytes which a group of
+    ``SpooledArchiveFile`` records keep in memory. Each file is charged for its contents
+    while they are in memory; a file which would take the total over the limit moves its
+    contents to disk instead (and no longer counts against the budget).
+
+    Example: ::
+
+        budget = MemoryBudget(64 * 1024 * 1024)
+        archive = C64Archive.deserialize(f, memory_budget=budget)
+        print(budget.used)
+    """
+
+    __slots__ = ("_limit", "_used")
+
+    def __init__(self, limit: int):
+        """
+        Create a new memory budget.
+
+        :param limit: The maximum number of bytes to keep in memory.
+        """
+        if limit < 0:
+            raise ValueError(f"invalid memory budget {limit}")
+        self._limit = limit
+        self._used = 0
+
+    @property
+    def limit(self) -> int:
+        """
+        Get the maximum number of bytes to keep in memory.
+
+        :return: The limit.
+        """
+        return self._limit
+
+    @property
+    def used(self) -> int:
+        """
+        Get the number of bytes which are currently charged to the budget.
+
+        :return: The number of bytes.
+        """
+        return self._used
+
+    @property
+    def available(self) -> int:
+        """
+        Get the number of bytes which can still be charged to the budget.
+
+        :return: The number of bytes.
+        """
+        return max(self._limit - self._used, 0)
+
+    def _reserve(self, count: int) -> bool:
+        """
+        Charge some bytes to the budget, if they fit.
+
+        :param count: The number of bytes.
+        :return: True if the bytes were charged.
+        """
+        if self._used + count > self._limit:
+            return False
+        self._used += count
+        return True
+
+    def _release(self, count: int):
+        """
+        Return some bytes to the budget.
+
+        :param count: The number of bytes.
+        """
+        self._used -= count
+
+    def __reduce__(self):
+        """
+        Pickle this budget by its limit. The files which are restored along with it
+        charge it again.
+        """
+        return MemoryBudget, (self._limit,)
+
+    @staticmethod
+    def resolve(
+        value: typing.Union[None, int, "MemoryBudget"]
+    ) -> typing.Optional["MemoryBudget"]:
+        """
+        Get the budget which a ``memory_budget`` parameter refers to.
+
+        :param value: A memory budget, the limit for a new memory budget, or None (for
+            the global memory budget; see ``set_memory_budget``).
+        :return: The memory budget (or None, if file contents are always kept in
+            memory).
+        """
+        if value is None:
+            return _memory_budget
+        if isinstance(value, MemoryBudget):
+            return value
+        return MemoryBudget(value)
+
+
+_memory_budget: typing.Optional[MemoryBudget] = None
+
+
+def get_memory_budget() -> typing.Optional[MemoryBudget]:
+    """
+    Get the global memory budget (used wherever a memory budget is not given).
+
+    :return: The memory budget shared by all files which use it (or None, if file
+        contents are always kept in memory).
+    """
+    return _memory_budget
+
+
+def set_memory_budget(value: typing.Optional[int]):
+    """
+    Set the global memory budget (used wherever a memory budget is not given). Once the
+    files which use it hold this many bytes in memory altogether, further contents are
+    moved to temporary files on disk.
+
+    :param value: The maximum number of bytes to keep in memory (or None, to always
+        keep file contents in memory).
+    """
+    global _memory_budget  # pylint: disable=W0603
+    _memory_budget = None if value is None else MemoryBudget(value)
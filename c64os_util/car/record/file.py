@@ -0,0 +1,470 @@
+"""
+File records hold their contents in memory, and can be read and written like any other
+binary stream.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import typing
+
+from ...util import copy_buffer
+from ..common import CarCompressionType, CarRecordType
+from ..compression import get_codec
+from .budget import MemoryBudget
+from .header import ArchiveRecordHeader
+from .record import ArchiveRecord
+
+
+class ArchiveFile(ArchiveRecord, io.BytesIO):  # type: ignore
+    """
+    An ``ArchiveFile`` represents a single file within the archive.
+    """
+
+    __slots__ = (
+        "_name",
+        "_file_type",
+        "_compression_type",
+        "_encoded",
+        "_digest",
+        "_exported",
+        "_header",
+        "_parent",
+        "_path",
+        "_shared",
+    )
+
+    def __init__(
+        self,
+        name: str = "",
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+    ):
+        """
+        Create a new file record.
+
+        :param name: The name of this file (not full path).
+        :param buffer: The underlying buffer for this file.
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        self._encoded: typing.Optional[bytes] = None
+        self._digest: typing.Optional[bytes] = None
+        self._exported = False
+        self._init_record(name)
+        self.file_type = file_type
+        self.compression_type = compression_type
+        super().__init__()
+
+    def __copy__(self) -> "ArchiveFile":
+        """
+        Copy this file with ``copy.copy`` (see ``copy``).
+
+        :return: The new file record.
+        """
+        return self.copy()
+
+    def __deepcopy__(self, memo) -> "ArchiveFile":
+        """
+        Copy this file with ``copy.deepcopy`` (see ``copy``).
+
+        :param memo: The objects which have been copied so far.
+        :return: The new file record.
+        """
+        return self.copy()
+
+    def __reduce__(self):
+        """
+        Pickle this file as an ``ArchiveFile`` with the same contents (without the link
+        to the parent directory). A ``MappedArchiveFile`` is pickled this way too, as a
+        plain ``ArchiveFile``, because the memory it views cannot be pickled.
+        """
+        return (
+            ArchiveFile._restore,
+            (
+                self.name,
+                self.file_type,
+                self.compression_type,
+                self.getvalue(),
+                self.tell(),
+            ),
+        )
+
+    @staticmethod
+    def _restore(  # pylint: disable=R0913
+        name: str,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+        value: bytes,
+        position: int,
+    ) -> "ArchiveFile":
+        """
+        Re-create a file which was copied or pickled.
+
+        :return: The new file record.
+        """
+        record = ArchiveFile(
+            name=name, file_type=file_type, compression_type=compression_type
+        )
+        record._share(value, position)
+        return record
+
+    def _share(self, value: bytes, position: int = 0):
+        """
+        Replace the contents of this file with a bytes object. The bytes object is not
+        copied until the file is modified.
+
+        :param value: The new contents.
+        :param position: The new stream position.
+        """
+        io.BytesIO.__init__(self, value)
+        self.seek(position)
+        self._resized()
+
+    def copy(self) -> "ArchiveFile":
+        """
+        Create a copy of this file. Both files share the same contents until one of
+        them is modified. The copy is not contained in any directory.
+
+        :return: The new file record.
+        """
+        record = ArchiveFile(
+            name=self.name,
+            file_type=self.file_type,
+            compression_type=self.compression_type,
+        )
+        record._share(self.getvalue(), self.tell())
+        if not self._exported:
+            record._encoded = self._encoded
+        return record
+
+    @property
+    def size(self) -> int:
+        """
+        Get the record size. (Size of file in bytes.)
+
+        :return: The record size.
+        """
+        # unlike getbuffer(), seeking does not force shared contents to be copied
+        position = self.tell()
+        size = self.seek(0, os.SEEK_END)
+        self.seek(position)
+        return size
+
+    @property
+    def stored_size(self) -> int:
+        """
+        Get the size of the contents as stored in the archive (after compression).
+
+        :return: The stored size.
+        """
+        if self.compression_type is CarCompressionType.NONE:
+            return self.size
+        return len(self._encode())
+
+    def _encode(self) -> bytes:
+        """
+        Get the contents as stored in the archive (after compression). The compressed
+        contents are cached until the file is modified. Once a view of the contents has
+        been handed out (see ``getbuffer``), the file can be modified without notice, so
+        the cache is only reused while the contents still have the same digest.
+
+        :return: The compressed contents.
+        """
+        if self._encoded is not None and self._exported:
+            if self._digest != self._hash():
+                self._encoded = None
+        if self._encoded is None:
+            position = self.tell()
+            self.seek(0)
+            dest = io.BytesIO()
+            get_codec(self.compression_type).compress(self, dest)
+            self.seek(position)
+            self._encoded = dest.getvalue()
+            self._digest = self._hash() if self._exported else None
+        return self._encoded
+
+    def _hash(self) -> bytes:
+        """
+        Get a digest of the contents.
+
+        :return: The digest.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        position = self.tell()
+        self.seek(0)
+        chunk = bytearray(64 * 1024)
+        with memoryview(chunk) as view:
+            while True:
+                count = self.readinto(view)
+                if not count:
+                    break
+                digest.update(view[:count])
+        self.seek(position)
+        return digest.digest()
+
+    def _volatile(self) -> bool:
+        """
+        Check whether the stored size of this file can change without notice: a view
+        of the contents has been handed out, and the contents are compressed (so writing
+        through the view can change the compressed size).
+
+        :return: True if the stored size must not be cached.
+        """
+        return self._exported and self.compression_type is not CarCompressionType.NONE
+
+    def getbuffer(self) -> memoryview:
+        """
+        Get a writable view of the contents of the file. Writing through the view does
+        not notify the file, so from then on the compressed contents are only reused
+        while the contents are unchanged, and the serialized size of the directories
+        which contain a compressed file is not cached.
+
+        :return: The view.
+        """
+        self._exported = True
+        self._resized()
+        return super().getbuffer()
+
+    def _contents_view(self) -> typing.Optional[memoryview]:
+        """
+        Get a read-only view of the contents, for copying them (see ``copy_buffer``).
+        Unlike ``getbuffer``, this has no side effects: the file is not marked as
+        exported, and shared contents are not copied.
+
+        :return: The view (or None, if the contents are not held in memory).
+        """
+        return memoryview(io.BytesIO.getvalue(self))
+
+    def _resized(self):
+        """
+        Discard the cached compressed contents, and the cached serialized size of this
+        file's ancestors (the contents of this file have changed).
+        """
+        self._encoded = None
+        super()._resized()
+
+    def serialized_size(self) -> int:
+        """
+        Get the number of bytes which ``serialize`` would write for this file: the
+        record header and the (compressed) contents.
+
+        :return: The serialized size in bytes.
+        :raises ValueError: If the file is too large to be stored.
+        """
+        size = self.stored_size
+        if size > ArchiveRecordHeader.MAX_SIZE:
+            raise ValueError(f"record {self.name} is too large ({size})")
+        return ArchiveRecordHeader.SIZE + size
+
+    def write(self, buffer) -> int:
+        """
+        Write data to the file.
+
+        :param buffer: The data to write.
+        :return: The number of bytes written.
+        """
+        count = super().write(buffer)
+        self._resized()
+        return count
+
+    def writelines(self, lines):
+        """
+        Write lines to the file.
+
+        :param lines: The lines to write.
+        """
+        super().writelines(lines)
+        self._resized()
+
+    def truncate(self, size: typing.Optional[int] = None) -> int:
+        """
+        Resize the file.
+
+        :param size: The new size (defaults to the current position).
+        :return: The new size.
+        """
+        size = super().truncate(size)
+        self._resized()
+        return size
+
+    @property
+    def record_type(self):
+        """
+        Get the file type (SEQ or PRG).
+
+        :return: The file type.
+        """
+        return self.file_type
+
+    @property
+    def file_type(self) -> CarRecordType:
+        """
+        Get the file type (SEQ or PRG).
+
+        :return: The file type.
+        """
+        return self._file_type
+
+    @file_type.setter
+    def file_type(self, value: CarRecordType):
+        """
+        Set the file type (SEQ or PRG).
+
+        :param value: The new file type.
+        """
+        self._file_type = value
+        self._header = None
+
+    @property
+    def compression_type(self) -> CarCompressionType:
+        """
+        Get the file compression type.
+
+        :return: The file compression type.
+        """
+        return self._compression_type
+
+    @compression_type.setter
+    def compression_type(self, value: CarCompressionType):
+        """
+        Set the file compression type. The contents are compressed when the file is
+        serialized (the contents of the file object itself are never compressed).
+
+        :param value: The new file compression type.
+        """
+        self._compression_type = value
+        self._header = None
+        self._resized()
+
+    def serialize(self, buffer: typing.BinaryIO):
+        """
+        Convert this record into binary data and write it to a buffer.
+
+        :param buffer: The buffer into which to write.
+        """
+        if self.compression_type is not CarCompressionType.NONE:
+            data = self._encode()
+            self.header.serialize(buffer)
+            buffer.write(data)
+            return
+        self.header.serialize(buffer)
+        self.seek(0)
+        copy_buffer(self, buffer)
+
+    @staticmethod
+    def create(
+        name: str = "",
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    ) -> "ArchiveFile":
+        """
+        Create a new, empty file record which respects a memory budget: if there is a
+        budget, the file is a ``SpooledArchiveFile`` which moves its contents to disk
+        once they no longer fit within the budget.
+
+        :param name: The name of this file (not full path).
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        :param memory_budget: The budget (or the limit for a new budget) to which the
+            contents are charged (defaults to the global memory budget; see
+            ``set_memory_budget``).
+        :return: The new file record.
+        """
+        # pylint: disable=C0415,R0401
+        from .spooled import SpooledArchiveFile
+
+        memory_budget = MemoryBudget.resolve(memory_budget)
+        if memory_budget is None:
+            return ArchiveFile(
+                name=name, file_type=file_type, compression_type=compression_type
+            )
+        return SpooledArchiveFile(
+            name=name,
+            file_type=file_type,
+            compression_type=compression_type,
+            memory_budget=memory_budget,
+        )
+
+    @staticmethod
+    def _deserialize(
+        header: ArchiveRecordHeader,
+        buffer: typing.BinaryIO,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    ) -> "ArchiveFile":
+        """
+        Read binary data from a buffer and parse it into a record object.
+
+        :param header: The header (parsed from the buffer already).
+        :param buffer: The buffer from which to read.
+        :param memory_budget: The budget to which the contents are charged; if they
+            do not fit, they are stored in a temporary file on disk rather than in
+            memory (defaults to the global memory budget).
+        :return: The parsed file record object.
+        """
+        # pylint: disable=C0415,R0401
+        from .mapped import MappedArchiveFile
+        from .spooled import SpooledArchiveFile
+
+        memory_budget = MemoryBudget.resolve(memory_budget)
+        if header.compression_type is not CarCompressionType.NONE:
+            data = io.BytesIO()
+            if copy_buffer(buffer, data, max_size=header.size) != header.size:
+                raise ValueError(f"truncated record {header.name}")
+            return ArchiveFile._decode(header, data.getvalue(), memory_budget)
+        if isinstance(buffer, mmap.mmap):
+            start = buffer.tell()
+            view = memoryview(buffer)[start : start + header.size]
+            buffer.seek(len(view), os.SEEK_CUR)
+            return MappedArchiveFile(
+                view,
+                name=header.name,
+                file_type=header.record_type,
+                compression_type=header.compression_type,
+            )
+        record = ArchiveFile.create(
+            name=header.name,
+            file_type=header.record_type,
+            compression_type=header.compression_type,
+            memory_budget=memory_budget,
+        )
+        if isinstance(record, SpooledArchiveFile) and header.size > (
+            record.memory_budget.available
+        ):
+            # go straight to disk, rather than filling memory first
+            record.rollover()
+        copy_buffer(buffer, record, max_size=header.size)
+        record.seek(0)
+        return record
+
+    @staticmethod
+    def _decode(
+        header: ArchiveRecordHeader,
+        data: bytes,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    ) -> "ArchiveFile":
+        """
+        Create a file record from compressed contents. The compressed contents are kept,
+        so that the file can be serialized again without compressing it again (unless
+        it is modified).
+
+        :param header: The record header.
+        :param data: The contents as stored in the archive.
+        :param memory_budget: The budget to which the contents are charged (defaults to
+            the global memory budget).
+        :return: The file record object.
+        """
+        record = ArchiveFile.create(
+            name=header.name,
+            file_type=header.record_type,
+            compression_type=header.compression_type,
+            memory_budget=memory_budget,
+        )
+        get_codec(header.compression_type).decompress(
+            io.BytesIO(data), record, len(data)
+        )
+        record.seek(0)
+        record._encoded = data
+        return record
@@ -3,19 +3,41 @@ Each record within the archive contains a record header. This module provides ut
 for parsing or generating that header.
 """
 
+import struct
 import typing
 
 from ...util import LC_CODEC
 from ..common import CarCompressionType, CarRecordType
 
+_RECORD_TYPES = {record_type.value: record_type for record_type in CarRecordType}
+_COMPRESSION_TYPES = {
+    compression_type.value: compression_type for compression_type in CarCompressionType
+}
+
 
 class ArchiveRecordHeader:
     """
     An ``ArchiveRecordHeader`` represents a de-serialized record header. It provides
     properties to access the underlying fields.
+
+    Headers which are parsed from binary data keep the record name as raw bytes; it is
+    only decoded the first time the ``name`` property is accessed.
     """
 
+    __slots__ = (
+        "_record_type",
+        "_size",
+        "_name",
+        "_name_bytes",
+        "_compression_type",
+    )
+
     MAX_NAME_SIZE = 15
+    MAX_SIZE = 0xFFFFFF
+    STRUCT = struct.Struct("<BBHB15sBB")
+    SIZE = STRUCT.size
+    # offset of the 3-byte size field within a packed header
+    SIZE_OFFSET = 2
 
     def __init__(
         self,
@@ -30,11 +52,12 @@ class ArchiveRecordHeader:
         :param name: The name of this record (not full path).
         :param size: The size of this record.
         :param record_type: The record type (file or directory).
-        :param compression_type: The compression type. (Only NONE is supported.)
+        :param compression_type: The compression type.
         """
         self._record_type = record_type
         self._size = size
-        self._name = name
+        self._name: typing.Optional[str] = name
+        self._name_bytes: typing.Optional[bytes] = None
         self._compression_type = compression_type
 
     @property
@@ -62,31 +85,116 @@ class ArchiveRecordHeader:
 
         :return: The record name.
         """
+        if self._name is None:
+            self._name = self.name_bytes.decode(LC_CODEC)
         return self._name
 
+    @property
+    def name_bytes(self) -> bytes:
+        """
+        Get the record name, encoded (without padding).
+
+        :return: The encoded record name.
+        """
+        if self._name_bytes is None:
+            self._name_bytes = self.name.encode(LC_CODEC)
+        return self._name_bytes
+
     @property
     def compression_type(self) -> CarCompressionType:
         """
-        Get the record compression type. (Only NONE is supported.)
+        Get the record compression type.
 
         :return: The record compression type.
         """
         return self._compression_type
 
+    def pack(self) -> bytes:
+        """
+        Convert this header into binary data.
+
+        :return: The binary data.
+        """
+        name_bytes = self.name_bytes
+        if len(name_bytes) > ArchiveRecordHeader.MAX_NAME_SIZE:
+            raise ValueError(f"record name {self.name} is too long")
+        if not 0 <= self.size <= ArchiveRecordHeader.MAX_SIZE:
+            raise ValueError(f"record {self.name} is too large ({self.size})")
+        return ArchiveRecordHeader.STRUCT.pack(
+            self.record_type.value,
+            0,  # lock byte?
+            self.size & 0xFFFF,
+            self.size >> 16,
+            name_bytes.ljust(ArchiveRecordHeader.MAX_NAME_SIZE, b"\xA0"),
+            0,  # ???
+            self.compression_type.value,
+        )
+
+    @staticmethod
+    def unpack(data, offset: int = 0) -> "ArchiveRecordHeader":
+        """
+        Parse binary data into a record header.
+
+        :param data: A bytes-like object containing the header.
+        :param offset: The offset of the header within ``data``.
+        :return: The parsed record header object.
+        """
+        fields = ArchiveRecordHeader.STRUCT.unpack_from(data, offset)
+        return ArchiveRecordHeader._from_fields(fields)
+
+    @staticmethod
+    def unpack_many(
+        data, offset: int = 0, count: int = -1
+    ) -> typing.List["ArchiveRecordHeader"]:
+        """
+        Parse binary data containing several consecutive record headers.
+
+        :param data: A bytes-like object containing the headers.
+        :param offset: The offset of the first header within ``data``.
+        :param count: The number of headers to parse (or -1 to parse as many as
+            ``data`` contains).
+        :return: The parsed record header objects.
+        """
+        view = memoryview(data).cast("B")[offset:]
+        if count < 0:
+            count = view.nbytes // ArchiveRecordHeader.SIZE
+        view = view[: count * ArchiveRecordHeader.SIZE]
+        if view.nbytes != count * ArchiveRecordHeader.SIZE:
+            raise ValueError("truncated record header")
+        from_fields = ArchiveRecordHeader._from_fields
+        return [from_fields(f) for f in ArchiveRecordHeader.STRUCT.iter_unpack(view)]
+
+    @staticmethod
+    def _from_fields(fields: typing.Tuple) -> "ArchiveRecordHeader":
+        """
+        Create a record header from the fields unpacked by ``STRUCT``.
+
+        :param fields: The unpacked fields.
+        :return: The record header object.
+        """
+        type_value, _, size_low, size_high, name_bytes, _, compression_value = fields
+        record_type = _RECORD_TYPES.get(type_value)
+        if record_type is None:
+            record_type = CarRecordType(type_value)
+        compression_type = _COMPRESSION_TYPES.get(compression_value)
+        if compression_type is None:
+            compression_type = CarCompressionType(compression_value)
+        header = ArchiveRecordHeader(
+            size=size_low | (size_high << 16),
+            record_type=record_type,
+            compression_type=compression_type,
+        )
+        header._name = None
+        header._name_bytes = name_bytes.rstrip(b"\xA0")
+        return header
+
     def serialize(self, buffer: typing.BinaryIO):
         """
         Convert this header into binary data and write it to a buffer.
 
         :param buffer: The buffer into which to write.
         """
-        self.record_type.serialize(buffer)
-        buffer.write(b"\0")  # lock byte?
-        buffer.write(self.size.to_bytes(3, "little"))
-        name_bytes = self.name.encode(LC_CODEC)
-        name_bytes = name_bytes.ljust(ArchiveRecordHeader.MAX_NAME_SIZE, b"\xA0")
-        buffer.write(name_bytes)
-        buffer.write(b"\0")  # ???
-        self.compression_type.serialize(buffer)
+        buffer.write(self.pack())
 
     @staticmethod
     def deserialize(buffer: typing.BinaryIO) -> "ArchiveRecordHeader":
@@ -96,16 +204,7 @@ class ArchiveRecordHeader:
         :param buffer: The buffer from which to read.
         :return: The parsed record header object.
         """
-        record_type = CarRecordType.deserialize(buffer)
-        buffer.read(1)  # lock byte?
-        size = int.from_bytes(buffer.read(3), "little")
-        name_bytes = buffer.read(ArchiveRecordHeader.MAX_NAME_SIZE)
-        name = name_bytes.rstrip(b"\xA0").decode(LC_CODEC)
-        buffer.read(1)  # ???
-        compression_type = CarCompressionType.deserialize(buffer)
-        return ArchiveRecordHeader(
-            name=name,
-            size=size,
-            record_type=record_type,
-            compression_type=compression_type,
-        )
+        data = buffer.read(ArchiveRecordHeader.SIZE)
+        if len(data) != ArchiveRecordHeader.SIZE:
+            raise ValueError("truncated record header")
+        return ArchiveRecordHeader.unpack(data)
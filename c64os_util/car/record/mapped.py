@@ -0,0 +1,265 @@
+"""
+File records whose contents are a read-only view into memory owned by another object
+(usually a memory-mapped ``.car`` file).
+"""
+
+import os
+import typing
+
+from ..common import CarCompressionType, CarRecordType
+from .file import ArchiveFile
+
+
+class MappedArchiveFile(ArchiveFile):
+    """
+    A ``MappedArchiveFile`` is an ``ArchiveFile`` whose contents are a read-only view
+    into memory owned by some other object (usually a memory-mapped ``.car`` file), so
+    reading it does not require a private copy of the data. The contents are copied
+    into a private buffer the first time the file is modified. (Copies are mapped too,
+    but a pickled ``MappedArchiveFile`` is restored as a plain ``ArchiveFile``.)
+    """
+
+    __slots__ = ("_view", "_position")
+
+    def __init__(
+        self,
+        view: memoryview,
+        name: str = "",
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+    ):
+        """
+        Create a new file record backed by a view into existing memory.
+
+        :param view: The memory containing the file contents.
+        :param name: The name of this file (not full path).
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        self._view: typing.Optional[memoryview] = view.toreadonly()
+        self._position = 0
+        super().__init__(
+            name=name, file_type=file_type, compression_type=compression_type
+        )
+
+    def copy(self) -> "ArchiveFile":
+        """
+        Create a copy of this file. While this file is still mapped, the copy is
+        another view into the same memory.
+
+        :return: The new file record.
+        """
+        if self._view is None:
+            return super().copy()
+        record = MappedArchiveFile(
+            self._view,
+            name=self.name,
+            file_type=self.file_type,
+            compression_type=self.compression_type,
+        )
+        record.seek(self.tell())
+        return record
+
+    @property
+    def mapped(self) -> bool:
+        """
+        Check whether the contents are still backed by the shared memory (that is, the
+        file has not been modified yet).
+
+        :return: True if the contents have not been copied.
+        """
+        return self._view is not None
+
+    @property
+    def size(self) -> int:
+        """
+        Get the record size. (Size of file in bytes.)
+
+        :return: The record size.
+        """
+        if self._view is None:
+            return super().size
+        return self._view.nbytes
+
+    def _materialize(self):
+        """
+        Copy the shared contents into the private buffer, so that it can be modified.
+        """
+        if self._view is None:
+            return
+        view, self._view = self._view, None
+        super().write(view)
+        super().seek(self._position)
+
+    def read(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or all remaining bytes, if ``size`` is negative).
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        if self._view is None:
+            return super().read(size)
+        start = min(self._position, self._view.nbytes)
+        end = self._view.nbytes
+        if size is not None and size >= 0:
+            end = min(start + size, end)
+        self._position = end
+        return self._view[start:end].tobytes()
+
+    def read1(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or all remaining bytes, if ``size`` is negative).
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        return self.read(size)
+
+    def readinto(self, buffer) -> int:
+        """
+        Read bytes into a pre-allocated, writable buffer.
+
+        :param buffer: The buffer into which to read.
+        :return: The number of bytes read.
+        """
+        if self._view is None:
+            return super().readinto(buffer)
+        dest = memoryview(buffer).cast("B")
+        start = min(self._position, self._view.nbytes)
+        end = min(start + dest.nbytes, self._view.nbytes)
+        dest[: end - start] = self._view[start:end]
+        self._position = end
+        return end - start
+
+    def readline(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to the next newline. (This copies the contents into a private buffer.)
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        self._materialize()
+        return super().readline(size)
+
+    def readlines(self, hint: typing.Optional[int] = -1) -> typing.List[bytes]:
+        """
+        Read a list of lines. (This copies the contents into a private buffer.)
+
+        :param hint: Stop reading lines after this many bytes have been read.
+        :return: The lines.
+        """
+        self._materialize()
+        return super().readlines(hint)
+
+    def __next__(self) -> bytes:
+        """
+        Read the next line. (This copies the contents into a private buffer.)
+
+        :return: The line.
+        """
+        self._materialize()
+        return super().__next__()
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Change the stream position.
+
+        :param pos: The offset.
+        :param whence: What the offset is relative to.
+        :return: The new absolute position.
+        """
+        if self._view is None:
+            return super().seek(pos, whence)
+        if whence == os.SEEK_CUR:
+            pos += self._position
+        elif whence == os.SEEK_END:
+            pos += self._view.nbytes
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek value {pos}")
+        self._position = pos
+        return pos
+
+    def tell(self) -> int:
+        """
+        Get the current stream position.
+
+        :return: The position.
+        """
+        if self._view is None:
+            return super().tell()
+        return self._position
+
+    def getvalue(self) -> bytes:
+        """
+        Get the entire contents of the file.
+
+        :return: The data.
+        """
+        if self._view is None:
+            return super().getvalue()
+        return self._view.tobytes()
+
+    def getbuffer(self) -> memoryview:
+        """
+        Get a view of the contents of the file. While the file is still mapped, this
+        view is read-only (and releasing it does not affect the file).
+
+        :return: The view.
+        """
+        if self._view is None:
+            return super().getbuffer()
+        return self._view[:]
+
+    def _contents_view(self) -> typing.Optional[memoryview]:
+        """
+        Get a read-only view of the contents, for copying them (see ``copy_buffer``).
+
+        :return: The view.
+        """
+        if self._view is None:
+            return super()._contents_view()
+        return self._view[:]
+
+    def write(self, buffer) -> int:
+        """
+        Write data to the file. (This copies the contents into a private buffer.)
+
+        :param buffer: The data to write.
+        :return: The number of bytes written.
+        """
+        self._materialize()
+        return super().write(buffer)
+
+    def writelines(self, lines):
+        """
+        Write lines to the file. (This copies the contents into a private buffer.)
+
+        :param lines: The lines to write.
+        """
+        self._materialize()
+        super().writelines(lines)
+
+    def truncate(self, size: typing.Optional[int] = None) -> int:
+        """
+        Resize the file. (This copies the contents into a private buffer.)
+
+        :param size: The new size (defaults to the current position).
+        :return: The new size.
+        """
+        self._materialize()
+        return super().truncate(size)
+
+    def serialize(self, buffer: typing.BinaryIO):
+        """
+        Convert this record into binary data and write it to a buffer.
+
+        :param buffer: The buffer into which to write.
+        """
+        if self._view is None or self.compression_type is not CarCompressionType.NONE:
+            super().serialize(buffer)
+            return
+        self.header.serialize(buffer)
+        buffer.write(self._view)
@@ -3,15 +3,50 @@ Classes and methods relating to archive records.
 """
 
 import abc
-import copy
-import io
+import enum
+import itertools
 import typing
 
-from ...util import copy_buffer
 from ..common import CarCompressionType, CarRecordType
+from ..layout import read_headers, walk_layout
+from .budget import MemoryBudget
 from .header import ArchiveRecordHeader
 
 
+class TraversalOrder(enum.Flag):
+    """
+    When ``ArchiveRecord.traverse`` visits a record: before its descendants (PRE),
+    after its descendants (POST), or both.
+    """
+
+    PRE = 1
+    POST = 2
+    BOTH = PRE | POST
+
+
+TraversalItem = typing.Tuple[int, "ArchiveRecord", TraversalOrder]
+
+
+class PathCell:
+    """
+    A ``PathCell`` is a cached path: the cached path of the parent directory (or None,
+    at the top) and the name of the record. The cells of sibling records share the cell
+    of their parent, so caching the paths of a whole tree stores each name only once.
+    """
+
+    __slots__ = ("parent", "name")
+
+    def __init__(self, parent: typing.Optional["PathCell"], name: str):
+        """
+        Create a new path cell.
+
+        :param parent: The cached path of the parent directory (or None).
+        :param name: The name of the record.
+        """
+        self.parent = parent
+        self.name = name
+
+
 class ArchiveRecord(abc.ABC):
     """
     ``ArchiveRecord`` is the base class for all records (files and directories) within
@@ -20,19 +55,52 @@ class ArchiveRecord(abc.ABC):
     should be created.
     """
 
+    # incremented whenever a record which is contained in more than one directory is
+    # renamed; only the index of its parent directory is updated, so the other
+    # directories use this to detect that their name index may be out-of-date
+    _shared_renames = 0
+
+    # the attributes which are common to all records; they are stored in slots, which
+    # are declared by each derived class (slots here would conflict with the layout of
+    # ``io.BytesIO`` and ``list``)
+    _header: typing.Optional[ArchiveRecordHeader]
+    _parent: typing.Optional["ArchiveDirectory"]
+    _path: typing.Optional[PathCell]
+    _shared: bool
+    _name: str
+
+    def _init_record(self, name: str):
+        """
+        Initialize the attributes which are common to all records.
+
+        :param name: The name of this record (not full path).
+        """
+        self._header = None
+        self._parent = None
+        self._path = None
+        self._shared = False
+        self._name = name
+        self.name = name
+
     @property
     def header(self) -> ArchiveRecordHeader:
         """
-        Get this record's header.
+        Get this record's header. The header is cached until the record is renamed,
+        resized or changes type.
 
         :return: The record header.
         """
-        return ArchiveRecordHeader(
-            name=self.name,
-            size=self.size,
-            record_type=self.record_type,
-            compression_type=self.compression_type,
-        )
+        size = self.stored_size
+        header = self._header
+        if header is None or header.size != size:
+            header = ArchiveRecordHeader(
+                name=self.name,
+                size=size,
+                record_type=self.record_type,
+                compression_type=self.compression_type,
+            )
+            self._header = header
+        return header
 
     @property
     def name(self) -> str:
@@ -46,144 +114,234 @@ class ArchiveRecord(abc.ABC):
     @name.setter
     def name(self, value: str):
         """
-        Set the record name.
+        Set the record name. The name index of the parent directory is updated in
+        place.
 
         :param value: The new record name.
+        :raises ValueError: If the parent directory already contains a record with the
+            new name.
         """
         assert len(value) <= ArchiveRecordHeader.MAX_NAME_SIZE
-        self._name = value
+        old = self._name
+        self._header = None
+        if old == value:
+            return
+        parent = self._parent
+        if parent is None:
+            self._name = value
+        else:
+            children = parent._index()
+            other = children.get(value, None)
+            if other is not None and other is not self:
+                raise ValueError(
+                    "a directory or file already exists in "
+                    f"{parent.name} with name {value}"
+                )
+            self._name = value
+            if children.get(old, None) is self:
+                del children[old]
+            children[value] = self
+        if self._shared:
+            ArchiveRecord._shared_renames += 1
+        self._invalidate_paths()
 
     @property
-    def size(self) -> int:
+    def parent(self) -> typing.Optional["ArchiveDirectory"]:
         """
-        Get the record size.
+        Get the directory which contains this record. (If a record has been added to
+        more than one directory, this is the one it was added to most recently.)
 
-        :return: The record size.
+        :return: The parent directory (or None if this record is not in a directory).
         """
-        # must be implemented in derived class
-        raise NotImplementedError()
+        return self._parent
 
     @property
-    def record_type(self) -> CarRecordType:
-        """
-        Get the record type (file or directory).
-
-        :return: The record type.
-        """
-        # must be implemented in derived class
-        raise NotImplementedError()
-
-    @property
-    def compression_type(self) -> CarCompressionType:
-        """
-        Get the record compression type.
-
-        :return: The record compression type.
-        """
-        # must be implemented in derived class
-        raise NotImplementedError()
-
-    def serialize(self, buffer: typing.BinaryIO):
-        """
-        Convert this record into binary data and write it to a buffer.
-
-        :param buffer: The buffer into which to write.
-        """
-        # must be implemented in derived class
-        raise NotImplementedError()
+    def path(self) -> typing.List[str]:
+        """
+        Get the full path of this record (represented as a list), following the parent
+        directories up to the top. The path is cached until this record or one of its
+        ancestors is renamed, moved or removed.
+
+        :return: The record path.
+        """
+        names = []
+        cell: typing.Optional[PathCell] = self._path_cell()
+        while cell is not None:
+            names.append(cell.name)
+            cell = cell.parent
+        names.reverse()
+        return names
+
+    def _path_cell(self) -> PathCell:
+        """
+        Get the cached path of this record, filling in the cached paths of its
+        ancestors as needed. A new cell is only created when the path changes, so the
+        cell also identifies the location of the record.
+
+        :return: The path cell.
+        """
+        cell = self._path
+        if cell is not None:
+            return cell
+        # walk up to the nearest ancestor whose path is still cached (iteratively, as
+        # archives may be nested too deeply for recursion)
+        uncached = []
+        record: typing.Optional[ArchiveRecord] = self
+        while record is not None and record._path is None:
+            uncached.append(record)
+            record = record._parent
+        parent = None if record is None else record._path
+        for record in reversed(uncached):
+            parent = PathCell(parent, record.name)
+            record._path = parent
+        return typing.cast(PathCell, parent)
+
+    def _invalidate_paths(self):
+        """
+        Discard the cached paths of this record and of its descendants (this record
+        has been renamed or moved). A record's path is only cached if its parent's is,
+        so the walk stops wherever the paths are not cached.
+        """
+        stack: typing.List[ArchiveRecord] = [self]
+        while stack:
+            record = stack.pop()
+            if record._path is None:
+                continue
+            record._path = None
+            if isinstance(record, ArchiveDirectory):
+                stack.extend(
+                    child for child in list.__iter__(record) if child._parent is record
+                )
 
-    @staticmethod
-    def deserialize(buffer: typing.BinaryIO) -> "ArchiveRecord":
+    def _set_parent(self, parent: typing.Optional["ArchiveDirectory"]):
         """
-        Read binary data from a buffer and parse it into a record object.
+        Update the link to the directory which contains this record.
 
-        :param buffer: The buffer from which to read.
-        :return: The parsed record object.
+        :param parent: The new parent directory (or None).
         """
-        header = ArchiveRecordHeader.deserialize(buffer)
-        if header.record_type.is_directory():
-            # pylint: disable=W0212
-            return ArchiveDirectory._deserialize(header, buffer)
-        return ArchiveFile._deserialize(header, buffer)  # pylint: disable=W0212
-
+        old = self._parent
+        if old is not None and old is not parent:
+            # the record stays in its old directory too, which can no longer rely on
+            # its name index being updated when the record is renamed
+            self._shared = True
+            old._foreign = True
+        self._parent = parent
+        self._invalidate_paths()
+        if parent is not None:
+            parent._changed()
 
-class ArchiveFile(ArchiveRecord, io.BytesIO):  # type: ignore
-    """
-    An ``ArchiveFile`` represents a single file within the archive.
-    """
-
-    def __init__(
-        self,
-        name: str = "",
-        file_type: CarRecordType = CarRecordType.SEQFILE,
-        compression_type: CarCompressionType = CarCompressionType.NONE,
-    ):
+    def _resized(self):
         """
-        Create a new file record.
-
-        :param name: The name of this file (not full path).
-        :param buffer: The underlying buffer for this file.
-        :param file_type: The record type (SEQ or PRG).
-        :param compression_type: The compression type. (Only NONE is supported.)
+        Discard the cached serialized size of this record's ancestors (the contents of
+        this record have changed size).
         """
-        self.name = name
-        self.file_type = file_type
-        self.compression_type = compression_type
-        super().__init__()
+        directory = self._parent
+        while directory is not None and directory._serialized_size is not None:
+            directory._serialized_size = None
+            directory = directory._parent
 
     @property
     def size(self) -> int:
         """
-        Get the record size. (Size of file in bytes.)
+        Get the record size.
 
         :return: The record size.
         """
-        return self.getbuffer().nbytes
+        # must be implemented in derived class
+        raise NotImplementedError()
 
     @property
-    def record_type(self):
+    def stored_size(self) -> int:
         """
-        Get the file type (SEQ or PRG).
+        Get the size which is recorded in the record header: the size of the contents
+        as stored in the archive (after compression), or the number of children.
 
-        :return: The file type.
+        :return: The stored size.
         """
-        return self.file_type
+        return self.size
 
     @property
-    def file_type(self) -> CarRecordType:
+    def record_type(self) -> CarRecordType:
         """
-        Get the file type (SEQ or PRG).
+        Get the record type (file or directory).
 
-        :return: The file type.
+        :return: The record type.
         """
-        return self._file_type
+        # must be implemented in derived class
+        raise NotImplementedError()
 
-    @file_type.setter
-    def file_type(self, value: CarRecordType):
+    @property
+    def compression_type(self) -> CarCompressionType:
         """
-        Set the file type (SEQ or PRG).
+        Get the record compression type.
 
-        :param value: The new file type.
+        :return: The record compression type.
         """
-        self._file_type = value
+        # must be implemented in derived class
+        raise NotImplementedError()
 
-    @property
-    def compression_type(self) -> CarCompressionType:
+    def copy(self) -> "ArchiveRecord":
         """
-        Get the file compression type. (Only NONE is supported.)
+        Create a copy of this record (and of all of its descendants, if it is a
+        directory). The contents of files are shared between the copies until one of
+        them is modified. The copy is not contained in any directory.
 
-        :return: The file compression type.
+        :return: The new record.
         """
-        return self._compression_type
+        # must be implemented in derived class
+        raise NotImplementedError()
 
-    @compression_type.setter
-    def compression_type(self, value: CarCompressionType):
+    def serialized_size(self) -> int:
         """
-        Set the file compression type. (Only NONE is supported.)
+        Get the number of bytes which ``serialize`` would write for this record
+        (including all of its descendants, if it is a directory), without serializing
+        it. Directories keep track of their size as their contents change, so this only
+        has to add up the parts of the tree which have changed since it was last
+        called.
 
-        :param value: The new file compression type.
+        :return: The serialized size in bytes.
+        :raises ValueError: If the record (or a descendant) is too large to be stored.
         """
-        self._compression_type = value
+        # must be implemented in derived class
+        raise NotImplementedError()
+
+    def traverse(
+        self, order: TraversalOrder = TraversalOrder.PRE
+    ) -> typing.Iterator[TraversalItem]:
+        """
+        A generator which visits this record and each of its descendants, depth-first
+        and in archive order. The tree is walked with an explicit stack (rather than by
+        recursion), so the cost is linear in the number of records regardless of how
+        deeply they are nested.
+
+        The tree must not be modified while it is being traversed, except that the
+        children of a directory may be changed when it is visited before them.
+
+        :param order: Visit each record before its descendants, after them, or both
+            (files are visited in the same way, for consistency).
+        :return: The record's depth (0 for this record), the record itself, and
+            whether it is being visited before or after its descendants.
+        """
+        pre = bool(order & TraversalOrder.PRE)
+        post = bool(order & TraversalOrder.POST)
+        stack: typing.List[
+            typing.Tuple[typing.Optional[ArchiveRecord], typing.Iterator[ArchiveRecord]]
+        ] = [(None, iter((self,)))]
+        while stack:
+            parent, children = stack[-1]
+            record = next(children, None)
+            if record is None:
+                stack.pop()
+                if post and parent is not None:
+                    yield len(stack) - 1, parent, TraversalOrder.POST
+                continue
+            depth = len(stack) - 1
+            if pre:
+                yield depth, record, TraversalOrder.PRE
+            if isinstance(record, ArchiveDirectory):
+                stack.append((record, iter(record)))
+            elif post:
+                yield depth, record, TraversalOrder.POST
 
     def serialize(self, buffer: typing.BinaryIO):
         """
@@ -191,28 +349,34 @@ class ArchiveFile(ArchiveRecord, io.BytesIO):  # type: ignore
 
         :param buffer: The buffer into which to write.
         """
-        self.header.serialize(buffer)
-        self.seek(0)
-        copy_buffer(self, buffer)
+        # must be implemented in derived class
+        raise NotImplementedError()
 
     @staticmethod
-    def _deserialize(
-        header: ArchiveRecordHeader, buffer: typing.BinaryIO
-    ) -> "ArchiveFile":
+    def deserialize(
+        buffer: typing.BinaryIO,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
+    ) -> "ArchiveRecord":
         """
         Read binary data from a buffer and parse it into a record object.
 
-        :param header: The header (parsed from the buffer already).
         :param buffer: The buffer from which to read.
-        :return: The parsed file record object.
-        """
-        record = ArchiveFile(
-            name=header.name,
-            file_type=header.record_type,
-            compression_type=header.compression_type,
-        )
-        copy_buffer(buffer, record, max_size=header.size)
-        return record
+        :param memory_budget: The budget (or the limit for a new budget) which all of
+            the files share: once their contents no longer fit, they are stored in
+            temporary files on disk rather than in memory (defaults to the global
+            memory budget; see ``set_memory_budget``).
+        :return: The parsed record object.
+        """
+        # pylint: disable=C0415,R0401
+        from .file import ArchiveFile
+
+        memory_budget = MemoryBudget.resolve(memory_budget)
+        header = ArchiveRecordHeader.deserialize(buffer)
+        if header.record_type.is_directory():
+            # pylint: disable=W0212
+            return ArchiveDirectory._deserialize(header, buffer, memory_budget)
+        # pylint: disable=W0212
+        return ArchiveFile._deserialize(header, buffer, memory_budget)
 
 
 class ArchiveDirectory(ArchiveRecord, list):
@@ -228,7 +392,9 @@ class ArchiveDirectory(ArchiveRecord, list):
     a child of the same name.
 
     ArchiveDirectory also support dict-style indexing to look up children by
-    name. This syntax only supports read operations.
+    name. This syntax only supports read operations. Children are indexed by name, so
+    looking up a child (or checking for a name collision) does not depend on the
+    number of children.
 
     Example: ::
 
@@ -241,6 +407,18 @@ class ArchiveDirectory(ArchiveRecord, list):
         print(d['bar'].file_type)
     """
 
+    __slots__ = (
+        "_name",
+        "_header",
+        "_parent",
+        "_path",
+        "_shared",
+        "_children",
+        "_foreign",
+        "_renames_seen",
+        "_serialized_size",
+    )
+
     def __init__(
         self, name: str = "", iterable: typing.Optional[list[ArchiveRecord]] = None
     ):
@@ -250,10 +428,14 @@ class ArchiveDirectory(ArchiveRecord, list):
         :param name: The name of this file (not full path).
         :param iterable: Collection of records which should be added to the directory.
         """
-        self.name = name
-        if iterable is None:
-            iterable = []
-        super().__init__(self._validate(item) for item in iterable)
+        self._children: typing.Optional[typing.Dict[str, ArchiveRecord]] = None
+        self._foreign = False
+        self._renames_seen = -1
+        self._init_record(name)
+        self._serialized_size: typing.Optional[int] = None
+        super().__init__()
+        if iterable is not None:
+            self.extend(iterable)
 
     @property
     def size(self) -> int:
@@ -282,16 +464,57 @@ class ArchiveDirectory(ArchiveRecord, list):
         """
         return CarCompressionType.NONE
 
+    def _index(self) -> typing.Dict[str, ArchiveRecord]:
+        """
+        Get the index of children by name, building it if needed. Renaming a child
+        updates the index of its parent in place; so the index only needs to be
+        rebuilt if this directory contains records whose parent is another directory,
+        and one of those may have been renamed.
+
+        :return: A dict mapping each child's name to the child.
+        """
+        children = self._children
+        if children is None or (
+            self._foreign and self._renames_seen != ArchiveRecord._shared_renames
+        ):
+            children = {child.name: child for child in list.__iter__(self)}
+            self._children = children
+            self._renames_seen = ArchiveRecord._shared_renames
+        return children
+
+    def __reduce__(self):
+        """
+        Copy or pickle this directory by re-creating it from its name and children
+        (without the name index, or the link to the parent directory).
+        """
+        return ArchiveDirectory, (self.name, list(list.__iter__(self)))
+
+    def __copy__(self) -> "ArchiveDirectory":
+        """
+        Copy this directory with ``copy.copy`` (see ``copy``). Even a shallow copy has
+        its own children: a record can only have one parent, so the children of the
+        original cannot be shared.
+
+        :return: The new directory record.
+        """
+        return self.copy()
+
+    def __deepcopy__(self, memo) -> "ArchiveDirectory":
+        """
+        Copy this directory with ``copy.deepcopy`` (see ``copy``).
+
+        :param memo: The objects which have been copied so far.
+        :return: The new directory record.
+        """
+        return self.copy()
+
     def get_child(self, name: str) -> typing.Optional[ArchiveRecord]:
         """
         Get a child record by name.
 
         :return: The child record, or None if no children exist by that name.
         """
-        for child in self:
-            if child.name == name:
-                return child
-        return None
+        return self._index().get(name, None)
 
     def keys(self):
         """
@@ -324,7 +547,7 @@ class ArchiveDirectory(ArchiveRecord, list):
 
         :return: The matching record.
         """
-        if isinstance(arg, int):
+        if isinstance(arg, (int, slice)):
             return super().__getitem__(arg)
         child = self.get_child(arg)
         if child is not None:
@@ -333,26 +556,104 @@ class ArchiveDirectory(ArchiveRecord, list):
 
     def __setitem__(self, index, item):
         """
-        Set the child record at the specified numeric index.
+        Set the child record at the specified numeric index (or the child records in
+        the specified slice).
+
+        :param index: The list index (or slice) to override.
+        :param item: The new list item (or an iterable of items, for a slice).
+        """
+        if isinstance(index, slice):
+            items = list(item)
+            replaced = {child.name for child in super().__getitem__(index)}
+            names = set()
+            for child in items:
+                self._validate(child, replaced)
+                if child.name in names:
+                    raise ValueError(f"duplicate name {child.name}")
+                names.add(child.name)
+            old = super().__getitem__(index)
+            super().__setitem__(index, items)
+            self._children = None
+            self._release(*old)
+            for child in items:
+                child._set_parent(self)
+            return
+        old = super().__getitem__(index)
+        self._validate(item, {old.name})
+        # get the index before changing the list, in case it needs to be rebuilt
+        children = self._index()
+        super().__setitem__(index, item)
+        del children[old.name]
+        children[item.name] = item
+        self._release(old)
+        item._set_parent(self)
+
+    def __delitem__(self, index):
+        """
+        Remove the child record at the specified numeric index (or the child records in
+        the specified slice).
+
+        :param index: The list index (or slice) to remove.
+        """
+        removed = super().__getitem__(index)
+        if not isinstance(index, slice):
+            removed = [removed]
+        # get the index before changing the list, in case it needs to be rebuilt
+        children = self._index()
+        super().__delitem__(index)
+        for child in removed:
+            del children[child.name]
+        self._release(*removed)
+
+    def __iadd__(self, other):
+        """
+        Append all the items in the given list as children of this directory.
 
-        :param index: The list index to override.
-        :param item: The new list item.
+        :param other: List to be appended.
+        :return: This directory.
         """
-        super().__setitem__(index, self._validate(item))
+        self.extend(other)
+        return self
 
     def __add__(self, other):
         """
         Concatenate this directory's children with the provided list.
         If the provided list is another directory, it will be merged with this.
 
+        The result is a new tree, so changing it never changes either operand. The
+        directories which exist in both trees are merged, and every other record is
+        copied (see ``copy``), so the contents of files are shared with the operands
+        until one of them is modified.
+
         :param other: List to be concatenated.
         :return: A directory with the list concatenated.
         """
-        if isinstance(other, ArchiveDirectory):
-            dup = copy.deepcopy(self)
-            dup.merge(other)
-            return dup
-        return super().__add__(other)
+        if not isinstance(other, ArchiveDirectory):
+            return super().__add__(other)
+        if other.name != self.name:
+            raise ValueError("directories must have the same name to be merged")
+        result = ArchiveDirectory(name=self.name)
+        triples = [(result, self, other)]
+        while triples:
+            target, left, right = triples.pop()
+            for child in left:
+                match = right.get_child(child.name)
+                if match is None:
+                    target.append(child.copy())
+                    continue
+                if not isinstance(child, ArchiveDirectory) or not isinstance(
+                    match, ArchiveDirectory
+                ):
+                    raise ValueError(
+                        f"both directories contain a record named {child.name}"
+                    )
+                merged = ArchiveDirectory(name=child.name)
+                target.append(merged)
+                triples.append((merged, child, match))
+            for child in right:
+                if left.get_child(child.name) is None:
+                    target.append(child.copy())
+        return result
 
     def __contains__(self, other):
         """
@@ -369,36 +670,171 @@ class ArchiveDirectory(ArchiveRecord, list):
         Insert the given record as a child of this directory at the given index.
         """
         super().insert(index, self._validate(item))
+        self._index()[item.name] = item
+        item._set_parent(self)
 
     def append(self, item):
         """
         Append the given record as a child of this directory.
         """
         super().append(self._validate(item))
+        self._index()[item.name] = item
+        item._set_parent(self)
 
     def extend(self, other):
         """
         Append all the items in the given list as children of this directory.
         """
-        super().extend(self._validate(item) for item in other)
+        for item in other:
+            self.append(item)
+
+    def pop(self, index=-1):
+        """
+        Remove and return the child record at the given index (the last child by
+        default).
+
+        :return: The removed record.
+        """
+        children = self._index()
+        item = super().pop(index)
+        del children[item.name]
+        self._release(item)
+        return item
+
+    def remove(self, item):
+        """
+        Remove the given record from this directory. Unlike ``list.remove``, the record
+        is found by identity (not equality).
+
+        :param item: The record to remove.
+        """
+        if not isinstance(item, ArchiveRecord) or self.get_child(item.name) is not item:
+            raise ValueError(f"{self.name} does not contain the given record")
+        for i, child in enumerate(list.__iter__(self)):
+            if child is item:
+                del self[i]
+                return
+
+    def clear(self):
+        """
+        Remove all children from this directory.
+        """
+        removed = list(list.__iter__(self))
+        super().clear()
+        self._children = None
+        self._release(*removed)
+
+    def _release(self, *records: ArchiveRecord):
+        """
+        Clear the parent links of records which have been removed from this directory.
+
+        :param records: The removed records.
+        """
+        for record in records:
+            if record._parent is self:
+                record._parent = None
+                record._invalidate_paths()
+        self._changed()
+
+    def _changed(self):
+        """
+        Discard the cached serialized size of this directory and of its ancestors (the
+        children of this directory have changed).
+        """
+        if self._serialized_size is not None:
+            self._serialized_size = None
+            self._resized()
+
+    def serialized_size(self) -> int:
+        """
+        Get the number of bytes which ``serialize`` would write for this directory and
+        all of its descendants. The size of each directory is cached until its children
+        change, so only the directories which have changed are added up again.
+
+        Changes are only reported to the parent directory of a record, so the size of
+        a directory which contains records from another directory (see ``merge``) is
+        not cached, and neither are the sizes of its ancestors.
+
+        :return: The serialized size in bytes.
+        :raises ValueError: If a record is too large to be stored.
+        """
+        if self._serialized_size is not None:
+            return self._serialized_size
+        # each directory whose size is being added up, the children which remain, the
+        # running total, and whether the total can be cached
+        stack: typing.List[typing.List[typing.Any]] = [
+            [self, iter(self), ArchiveRecordHeader.SIZE, not self._foreign]
+        ]
+        while stack:
+            entry = stack[-1]
+            directory, children, total, cacheable = entry
+            for child in children:
+                if isinstance(child, ArchiveDirectory):
+                    if child._serialized_size is None:
+                        break
+                    total += child._serialized_size
+                else:
+                    total += child.serialized_size()
+                    cacheable = cacheable and not child._volatile()
+            else:
+                if len(directory) > ArchiveRecordHeader.MAX_SIZE:
+                    raise ValueError(f"record {directory.name} is too large")
+                if cacheable:
+                    directory._serialized_size = total
+                stack.pop()
+                if stack:
+                    stack[-1][2] += total
+                    stack[-1][3] = stack[-1][3] and cacheable
+                continue
+            entry[2] = total
+            entry[3] = cacheable
+            stack.append(
+                [child, iter(child), ArchiveRecordHeader.SIZE, not child._foreign]
+            )
+        return total
 
-    def _validate(self, record: ArchiveRecord) -> ArchiveRecord:
+    def _validate(
+        self, record: ArchiveRecord, replaced: typing.Collection[str] = ()
+    ) -> ArchiveRecord:
         """
         Pre-process a record before inserting it.
         This checks to be sure there are no name collisions, and updates the parent.
 
         :param record: The record to be inserted.
+        :param replaced: The names of children which are being replaced.
         """
         if not isinstance(record, ArchiveRecord):
             raise ValueError("a directory can only contain files or other directories")
         child = self.get_child(record.name)
-        if child is not None:
+        if child is not None and child.name not in replaced:
             raise ValueError(
                 "a directory or file already exists in "
                 f"{self.name} with name {child.name}"
             )
         return record
 
+    def copy(self) -> "ArchiveDirectory":
+        """
+        Create a copy of this directory and all of its descendants. The contents of
+        files are shared between the copies until one of them is modified. The copy is
+        not contained in any directory.
+
+        :return: The new directory record.
+        """
+        copies: typing.List[ArchiveDirectory] = []
+        for depth, record, _ in self.traverse():
+            del copies[depth:]
+            copy: ArchiveRecord
+            if isinstance(record, ArchiveDirectory):
+                directory = ArchiveDirectory(record.name)
+                copies.append(directory)
+                copy = directory
+            else:
+                copy = record.copy()
+            if depth:
+                copies[depth - 1].append(copy)
+        return copies[0]
+
     def merge(self, other: "ArchiveDirectory"):
         """
         Merge the contents of another directory into this directory.
@@ -407,21 +843,21 @@ class ArchiveDirectory(ArchiveRecord, list):
         """
         if other.name != self.name:
             raise ValueError("directories must have the same name to be merged")
-        for child in other:
-            try:
-                self_child = self[child.name]
-            except KeyError:
-                self.append(child)
-                continue
-            if not isinstance(child, ArchiveDirectory):
-                raise ValueError(
-                    f"both directories contain a record named {child.name}"
-                )
-            if not isinstance(self_child, ArchiveDirectory):
-                raise ValueError(
-                    f"both directories contain a record named {child.name}"
-                )
-            self_child.merge(child)
+        pairs = [(self, other)]
+        while pairs:
+            target, source = pairs.pop()
+            for child in list(source):
+                target_child = target.get_child(child.name)
+                if target_child is None:
+                    target.append(child)
+                    continue
+                if not isinstance(child, ArchiveDirectory) or not isinstance(
+                    target_child, ArchiveDirectory
+                ):
+                    raise ValueError(
+                        f"both directories contain a record named {child.name}"
+                    )
+                pairs.append((target_child, child))
 
     def directories(self):
         """
@@ -439,7 +875,7 @@ class ArchiveDirectory(ArchiveRecord, list):
         directory.
         """
         for child in self:
-            if not isinstance(child, ArchiveFile):
+            if isinstance(child, ArchiveDirectory):
                 continue
             yield child
 
@@ -451,10 +887,13 @@ class ArchiveDirectory(ArchiveRecord, list):
         :return: The directory's path (represented as a list) and the directory record
             itself.
         """
-        path.append(self.name)
-        yield path, self
-        for record in self.directories():
-            yield from record._walk(path)  # pylint: disable=W0212
+        names = list(path)
+        start = len(names)
+        for depth, record, _ in self.traverse():
+            if isinstance(record, ArchiveDirectory):
+                del names[start + depth :]
+                names.append(record.name)
+                yield list(names), record
 
     def serialize(self, buffer: typing.BinaryIO):
         """
@@ -462,23 +901,43 @@ class ArchiveDirectory(ArchiveRecord, list):
 
         :param buffer: The buffer into which to write.
         """
-        self.header.serialize(buffer)
-        for child in self:
-            child.serialize(buffer)
+        for _, record, _ in self.traverse():
+            if isinstance(record, ArchiveDirectory):
+                record.header.serialize(buffer)
+            else:
+                record.serialize(buffer)
 
     @staticmethod
     def _deserialize(
-        header: ArchiveRecordHeader, buffer: typing.BinaryIO
+        header: ArchiveRecordHeader,
+        buffer: typing.BinaryIO,
+        memory_budget: typing.Union[None, int, MemoryBudget] = None,
     ) -> "ArchiveDirectory":
         """
         Read binary data from a buffer and parse it into a record object.
 
         :param header: The header (parsed from the buffer already).
         :param buffer: The buffer from which to read.
+        :param memory_budget: The budget which all of the files share (defaults to the
+            global memory budget).
         :return: The parsed directory record object.
         """
-        directory = ArchiveDirectory(name=header.name)
-        for _ in range(header.size):
-            child = ArchiveRecord.deserialize(buffer)
-            directory.append(child)
-        return directory
+        # pylint: disable=C0415,R0401
+        from .file import ArchiveFile
+
+        memory_budget = MemoryBudget.resolve(memory_budget)
+        # the open directories (by depth)
+        directories: typing.List[ArchiveDirectory] = []
+        headers = itertools.chain((header,), read_headers(buffer))
+        for depth, header in walk_layout(headers):
+            del directories[depth:]
+            child: ArchiveRecord
+            if header.record_type.is_directory():
+                child = ArchiveDirectory(name=header.name)
+            else:
+                child = ArchiveFile._deserialize(header, buffer, memory_budget)
+            if directories:
+                directories[-1].append(child)
+            if isinstance(child, ArchiveDirectory):
+                directories.append(child)
+        return typing.cast(ArchiveDirectory, directories[0])
@@ -0,0 +1,391 @@
+"""
+File records whose contents are kept in memory while they fit within a memory budget,
+and moved to a temporary file on disk once they do not.
+"""
+
+import io
+import mmap
+import os
+import tempfile
+import typing
+
+from ...util import copy_buffer
+from ..common import CarCompressionType, CarRecordType
+from .budget import MemoryBudget
+from .file import ArchiveFile
+
+
+class SpooledArchiveFile(ArchiveFile):
+    """
+    A ``SpooledArchiveFile`` is an ``ArchiveFile`` whose contents are kept in memory
+    only for as long as they fit within a ``MemoryBudget``; beyond that, the contents
+    are moved to a temporary file on disk. The budget may be shared by many files (for
+    example, all the files of an archive), so it limits the total amount of memory
+    which they use. The file can be read, written and serialized in the same way as any
+    other ``ArchiveFile``.
+    """
+
+    __slots__ = ("_budget", "_charged", "_file")
+
+    def __init__(
+        self,
+        name: str = "",
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+        memory_budget: typing.Union[int, MemoryBudget] = 0,
+    ):
+        """
+        Create a new file record which is kept in memory until it no longer fits
+        within a memory budget.
+
+        :param name: The name of this file (not full path).
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        :param memory_budget: The budget to which the contents are charged while they
+            are kept in memory (or the maximum number of bytes to keep in memory, for a
+            budget of this file's own).
+        """
+        if not isinstance(memory_budget, MemoryBudget):
+            memory_budget = MemoryBudget(memory_budget)
+        self._budget = memory_budget
+        self._charged = 0
+        self._file: typing.Optional[io.BufferedRandom] = None
+        super().__init__(
+            name=name, file_type=file_type, compression_type=compression_type
+        )
+
+    @property
+    def memory_budget(self) -> MemoryBudget:
+        """
+        Get the budget to which the contents are charged while they are kept in memory.
+
+        :return: The memory budget.
+        """
+        return self._budget
+
+    def copy(self) -> "ArchiveFile":
+        """
+        Create a copy of this file. The contents are copied into a new spooled file,
+        which is charged to the same memory budget (temporary files on disk cannot be
+        shared).
+
+        :return: The new file record.
+        """
+        record = SpooledArchiveFile(
+            name=self.name,
+            file_type=self.file_type,
+            compression_type=self.compression_type,
+            memory_budget=self._budget,
+        )
+        if self._file is not None or self.size > self._budget.available:
+            record.rollover()
+        position = self.tell()
+        self.seek(0)
+        copy_buffer(self, record)
+        self.seek(position)
+        record.seek(position)
+        return record
+
+    def __reduce__(self):
+        """
+        Pickle this file as a ``SpooledArchiveFile`` with the same contents (without
+        the link to the parent directory). The memory budget is pickled along with it,
+        so files which shared a budget share the restored budget too.
+        """
+        return (
+            SpooledArchiveFile._restore_spooled,
+            (
+                self.name,
+                self.file_type,
+                self.compression_type,
+                self._budget,
+                self.getvalue(),
+                self.tell(),
+            ),
+        )
+
+    @staticmethod
+    def _restore_spooled(  # pylint: disable=R0913
+        name: str,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+        memory_budget: MemoryBudget,
+        value: bytes,
+        position: int,
+    ) -> "SpooledArchiveFile":
+        """
+        Re-create a spooled file which was pickled.
+
+        :return: The new file record.
+        """
+        record = SpooledArchiveFile(
+            name=name,
+            file_type=file_type,
+            compression_type=compression_type,
+            memory_budget=memory_budget,
+        )
+        if len(value) > memory_budget.available:
+            record.rollover()
+        record.write(value)
+        record.seek(position)
+        return record
+
+    @property
+    def spilled(self) -> bool:
+        """
+        Check whether the contents have been moved to disk.
+
+        :return: True if the contents are stored in a temporary file.
+        """
+        return self._file is not None
+
+    def rollover(self):
+        """
+        Move the contents to disk, regardless of their size. This has no effect if
+        views of the contents (see ``getbuffer``) are still in use.
+        """
+        if self._file is not None:
+            return
+        temp = tempfile.TemporaryFile()  # pylint: disable=R1732
+        position = super().tell()
+        try:
+            with io.BytesIO.getbuffer(self) as view:
+                temp.write(view)
+            # empty the in-memory buffer (this fails while it is being viewed)
+            io.BytesIO.__init__(self)
+        except BufferError:
+            temp.close()
+            return
+        temp.seek(position)
+        self._file = temp
+        self._budget._release(self._charged)  # pylint: disable=W0212
+        self._charged = 0
+
+    def _reserve(self, end: int):
+        """
+        Make sure that the contents can grow to ``end`` bytes, moving them to disk if
+        they would no longer fit within the memory budget.
+
+        :param end: The size to which the contents may grow.
+        """
+        if self._file is not None or end <= self._charged:
+            return
+        if self._budget._reserve(end - self._charged):  # pylint: disable=W0212
+            self._charged = end
+        else:
+            self.rollover()
+
+    @property
+    def size(self) -> int:
+        """
+        Get the record size. (Size of file in bytes.)
+
+        :return: The record size.
+        """
+        if self._file is None:
+            return super().size
+        position = self._file.tell()
+        size = self._file.seek(0, os.SEEK_END)
+        self._file.seek(position)
+        return size
+
+    def read(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or all remaining bytes, if ``size`` is negative).
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        if self._file is None:
+            return super().read(size)
+        if size is None:
+            size = -1
+        return self._file.read(size)
+
+    def read1(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or all remaining bytes, if ``size`` is negative).
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        return self.read(size)
+
+    def readinto(self, buffer) -> int:
+        """
+        Read bytes into a pre-allocated, writable buffer.
+
+        :param buffer: The buffer into which to read.
+        :return: The number of bytes read.
+        """
+        if self._file is None:
+            return super().readinto(buffer)
+        return self._file.readinto(buffer)
+
+    def readinto1(self, buffer) -> int:
+        """
+        Read bytes into a pre-allocated, writable buffer.
+
+        :param buffer: The buffer into which to read.
+        :return: The number of bytes read.
+        """
+        return self.readinto(buffer)
+
+    def readline(self, size: typing.Optional[int] = -1) -> bytes:
+        """
+        Read up to the next newline.
+
+        :param size: The maximum number of bytes to read.
+        :return: The data.
+        """
+        if self._file is None:
+            return super().readline(size)
+        if size is None:
+            size = -1
+        return self._file.readline(size)
+
+    def readlines(self, hint: typing.Optional[int] = -1) -> typing.List[bytes]:
+        """
+        Read a list of lines.
+
+        :param hint: Stop reading lines after this many bytes have been read.
+        :return: The lines.
+        """
+        if self._file is None:
+            return super().readlines(hint)
+        if hint is None:
+            hint = -1
+        return self._file.readlines(hint)
+
+    def __next__(self) -> bytes:
+        """
+        Read the next line.
+
+        :return: The line.
+        """
+        if self._file is None:
+            return super().__next__()
+        line = self._file.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Change the stream position.
+
+        :param pos: The offset.
+        :param whence: What the offset is relative to.
+        :return: The new absolute position.
+        """
+        if self._file is None:
+            return super().seek(pos, whence)
+        return self._file.seek(pos, whence)
+
+    def tell(self) -> int:
+        """
+        Get the current stream position.
+
+        :return: The position.
+        """
+        if self._file is None:
+            return super().tell()
+        return self._file.tell()
+
+    def getvalue(self) -> bytes:
+        """
+        Get the entire contents of the file. (If the contents are on disk, this reads
+        the whole file into memory.)
+
+        :return: The data.
+        """
+        if self._file is None:
+            return super().getvalue()
+        position = self._file.tell()
+        self._file.seek(0)
+        data = self._file.read()
+        self._file.seek(position)
+        return data
+
+    def getbuffer(self) -> memoryview:
+        """
+        Get a writable view of the contents of the file. If the contents are on disk,
+        the view is a memory map of the temporary file. The file cannot be resized
+        while the view is in use.
+
+        :return: The view.
+        """
+        if self._file is None:
+            return super().getbuffer()
+        self._exported = True
+        self._resized()
+        self._file.flush()
+        size = self.size
+        if not size:
+            return memoryview(bytearray())
+        return memoryview(mmap.mmap(self._file.fileno(), size))
+
+    def _contents_view(self) -> typing.Optional[memoryview]:
+        """
+        Get a read-only view of the contents, for copying them (see ``copy_buffer``).
+        Contents which are on disk are not mapped; they are copied in chunks instead.
+
+        :return: The view (or None, if the contents are on disk).
+        """
+        if self._file is None:
+            return super()._contents_view()
+        return None
+
+    def write(self, buffer) -> int:
+        """
+        Write data to the file. The contents are moved to disk if they no longer fit
+        within the memory budget.
+
+        :param buffer: The data to write.
+        :return: The number of bytes written.
+        """
+        if self._file is None:
+            with memoryview(buffer) as view:
+                self._reserve(super().tell() + view.nbytes)
+        if self._file is None:
+            return super().write(buffer)
+        count = self._file.write(buffer)
+        self._resized()
+        return count
+
+    def writelines(self, lines):
+        """
+        Write lines to the file.
+
+        :param lines: The lines to write.
+        """
+        for line in lines:
+            self.write(line)
+
+    def truncate(self, size: typing.Optional[int] = None) -> int:
+        """
+        Resize the file.
+
+        :param size: The new size (defaults to the current position).
+        :return: The new size.
+        """
+        if self._file is not None:
+            size = self._file.truncate(size)
+            self._resized()
+            return size
+        size = super().truncate(size)
+        if size < self._charged:
+            self._budget._release(self._charged - size)  # pylint: disable=W0212
+            self._charged = size
+        return size
+
+    def close(self):
+        """
+        Close the file, releasing its share of the memory budget and discarding the
+        temporary file backing it (if any).
+        """
+        self._budget._release(self._charged)  # pylint: disable=W0212
+        self._charged = 0
+        if self._file is not None:
+            self._file.close()
+        super().close()
@@ -0,0 +1,268 @@
+"""
+Classes and methods for reading archives one record at a time, without building the
+record tree in memory.
+"""
+
+import io
+import os
+import tempfile
+import typing
+
+from ..util import LC_CODEC, skip_buffer
+from .common import CarCompressionType
+from .compression import get_codec
+from .header import ArchiveHeader
+from .layout import read_headers, walk_layout
+from .record import ArchiveDirectory, ArchiveFile, ArchiveRecord, MemoryBudget
+from .record.header import ArchiveRecordHeader
+
+# decompressed contents larger than this are kept in a temporary file on disk
+SPOOL_SIZE = 1024 * 1024
+
+
+class ArchiveRecordReader(io.RawIOBase):
+    """
+    An ``ArchiveRecordReader`` is a read-only stream over the contents of a single file
+    record. It reads directly from the underlying archive buffer and never reads past
+    the end of the record.
+    """
+
+    def __init__(self, buffer: typing.BinaryIO, size: int):
+        """
+        Create a new record reader.
+
+        :param buffer: The archive buffer, positioned at the start of the record body.
+        :param size: The size of the record body.
+        """
+        super().__init__()
+        self._buffer = buffer
+        self._size = size
+        self._remaining = size
+
+    @property
+    def size(self) -> int:
+        """
+        Get the size of the record body.
+
+        :return: The record size.
+        """
+        return self._size
+
+    @property
+    def remaining(self) -> int:
+        """
+        Get the number of bytes which have not been read yet.
+
+        :return: The number of bytes remaining.
+        """
+        return self._remaining
+
+    def readable(self) -> bool:
+        """
+        Check whether the stream is readable. (It always is.)
+
+        :return: True.
+        """
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        Read bytes into a pre-allocated, writable buffer. Fewer bytes may be read than
+        requested (if less data is available from the archive buffer), but never none
+        before the end of the record.
+
+        :param buffer: The buffer into which to read.
+        :return: The number of bytes read.
+        :raises ValueError: If the archive ends before the record does.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed record reader")
+        dest = memoryview(buffer).cast("B")
+        size = min(dest.nbytes, self._remaining)
+        if not size:
+            return 0
+        readinto = getattr(self._buffer, "readinto", None)
+        if readinto is not None:
+            count = readinto(dest[:size]) or 0
+        else:
+            chunk = self._buffer.read(size)
+            count = len(chunk)
+            dest[:count] = chunk
+        if not count:
+            raise ValueError("truncated record")
+        self._remaining -= count
+        return count
+
+    def _skip(self):
+        """
+        Advance the underlying buffer past the unread portion of the record body.
+
+        :raises ValueError: If the archive ends before the record does.
+        """
+        self._remaining -= skip_buffer(self._buffer, self._remaining)
+        if self._remaining:
+            raise ValueError("truncated record")
+
+
+RecordItem = typing.Tuple[
+    typing.List[str], ArchiveRecordHeader, typing.Optional[ArchiveRecordReader]
+]
+
+
+class C64ArchiveReader:
+    """
+    A ``C64ArchiveReader`` reads an archive one record at a time. The archive header is
+    read when the reader is created; iterating over the reader yields each record in
+    archive order as a tuple of its full path (represented as a list), its header, and
+    a reader for its contents (``None`` for directories).
+
+    Memory usage does not depend on the number or size of records. Each record reader
+    is only valid until the next record is requested; any unread contents are skipped.
+    Compressed contents are decompressed (into a temporary file, if they are large)
+    before the record is yielded, so record readers always return the original
+    contents; the header still describes the contents as stored in the archive.
+
+    Example: ::
+
+        with open('test.car', 'rb') as f:
+            reader = C64ArchiveReader(f)
+            print(reader.header.note)
+            for path, header, body in reader:
+                if body is not None:
+                    print('/'.join(path), len(body.read()))
+    """
+
+    def __init__(self, buffer: typing.BinaryIO):
+        """
+        Create a new archive reader. The archive header is read immediately.
+
+        :param buffer: The buffer from which to read.
+        """
+        self._buffer = buffer
+        self._header = ArchiveHeader.deserialize(buffer)
+
+    @property
+    def header(self) -> ArchiveHeader:
+        """
+        Get the header (metadata) of the archive.
+
+        :return: The header.
+        """
+        return self._header
+
+    def __iter__(self) -> typing.Iterator[RecordItem]:
+        """
+        Iterate through each record in the archive (in order).
+
+        :return: The record's path (represented as a list), the record header, and a
+            reader for the contents (or None for directories).
+        """
+        parents: typing.List[str] = []
+        for depth, header in walk_layout(read_headers(self._buffer)):
+            del parents[depth:]
+            path = parents + [header.name]
+            if header.record_type.is_directory():
+                yield path, header, None
+                parents.append(header.name)
+                continue
+            reader = ArchiveRecordReader(self._buffer, header.size)
+            decoded = None
+            try:
+                if header.compression_type is not CarCompressionType.NONE:
+                    decoded = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                    size = get_codec(header.compression_type).decompress(
+                        reader, decoded, header.size
+                    )
+                    reader._skip()  # pylint: disable=W0212
+                    reader.close()
+                    decoded.seek(0)
+                    reader = ArchiveRecordReader(decoded, size)
+                yield path, header, reader
+                reader._skip()  # pylint: disable=W0212
+            finally:
+                reader.close()
+                if decoded is not None:
+                    decoded.close()
+
+
+def iter_records(buffer: typing.BinaryIO) -> typing.Iterator[RecordItem]:
+    """
+    Iterate through each record in an archive (in order) without building the record
+    tree in memory. This is a shorthand for iterating over a ``C64ArchiveReader``.
+
+    :param buffer: The buffer from which to read.
+    :return: The record's path (represented as a list), the record header, and a
+        reader for the contents (or None for directories).
+    """
+    return iter(C64ArchiveReader(buffer))
+
+
+def _skip_record(buffer: typing.BinaryIO, header: ArchiveRecordHeader):
+    """
+    Advance a buffer past a record (including all of its descendants, if it is a
+    directory). Only headers are read; the contents of files are skipped.
+
+    :param buffer: The buffer, positioned just after the record header.
+    :param header: The record header.
+    """
+    pending = 0
+    while True:
+        if header.record_type.is_directory():
+            pending += header.size
+        elif skip_buffer(buffer, header.size) != header.size:
+            raise ValueError(f"truncated record {header.name}")
+        if not pending:
+            return
+        header = ArchiveRecordHeader.deserialize(buffer)
+        pending -= 1
+
+
+def extract_record(
+    buffer: typing.BinaryIO,
+    path: str,
+    sep: str = os.path.sep,
+    memory_budget: typing.Union[None, int, MemoryBudget] = None,
+) -> ArchiveRecord:
+    """
+    Read a single record (file or directory) from an archive, without deserializing the
+    rest of the archive. This is the streaming counterpart to ``C64Archive.ls``.
+
+    Records which are not on the requested path are skipped over: only their headers
+    are read, and the contents of files are never read (or, for non-seekable buffers,
+    are discarded as they are read). Reading stops as soon as the record is found, or
+    as soon as its parent directory has been searched.
+
+    :param buffer: The buffer from which to read.
+    :param path: A path-like string representing the record's location within the
+        archive.
+    :param sep: The character used as a path separator (usually '/' or '\\').
+    :param memory_budget: The budget (or the limit for a new budget) which the files
+        share: once their contents no longer fit, they are stored in temporary files on
+        disk rather than in memory (defaults to the global memory budget).
+    :return: The requested record (including all of its descendants, if it is a
+        directory).
+    """
+    ArchiveHeader.deserialize(buffer)
+    parts = path.split(sep)
+    try:
+        targets = [part.encode(LC_CODEC) for part in parts]
+    except UnicodeEncodeError as err:
+        raise KeyError(f"archive does not contain {path}") from err
+    count = 1
+    for depth, target in enumerate(targets):
+        for _ in range(count):
+            header = ArchiveRecordHeader.deserialize(buffer)
+            if header.name_bytes == target:
+                break
+            _skip_record(buffer, header)
+        else:
+            raise KeyError(f"archive does not contain {path}")
+        if depth == len(targets) - 1:
+            break
+        if not header.record_type.is_directory():
+            raise KeyError(f"archive does not contain {path}")
+        count = header.size
+    # pylint: disable=W0212
+    if header.record_type.is_directory():
+        return ArchiveDirectory._deserialize(header, buffer, memory_budget)
+    return ArchiveFile._deserialize(header, buffer, memory_budget)
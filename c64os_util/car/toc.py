@@ -0,0 +1,191 @@
+"""
+Classes and methods for caching the index of an archive on disk, so that the archive
+does not need to be scanned again unless it changes.
+"""
+
+import hashlib
+import os
+import struct
+import typing
+
+from .header import ArchiveHeader
+from .index import ArchiveIndex
+from .record.header import ArchiveRecordHeader
+
+
+class ArchiveTocCache:
+    """
+    An ``ArchiveTocCache`` stores the index of each archive it loads in a small
+    table-of-contents (TOC) file. The TOC file contains the archive header, every record
+    header, and the size, modification time and inode of the archive at the time it was
+    scanned. As long as those still match, loading the index again reads only the TOC
+    file, which is much smaller than the archive.
+
+    By default, the TOC file is stored next to the archive (``foo.car.toc``). If a cache
+    directory is provided, TOC files are stored there instead (named after a hash of the
+    archive's absolute path).
+
+    Example: ::
+
+        cache = ArchiveTocCache()
+        index = cache.load('foo.car')  # scans foo.car, writes foo.car.toc
+        index = cache.load('foo.car')  # reads foo.car.toc only
+    """
+
+    SUFFIX = ".toc"
+    TOC_MAGIC = b"C64ATOC\0"
+    TOC_VERSION = 1
+    STRUCT = struct.Struct("<8sBQqQQI")
+
+    def __init__(self, cache_dir: typing.Optional[str] = None):
+        """
+        Create a new TOC cache.
+
+        :param cache_dir: The directory in which to store TOC files (if omitted, they
+            are stored next to each archive).
+        """
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> typing.Optional[str]:
+        """
+        Get the directory in which TOC files are stored.
+
+        :return: The cache directory (or None if TOC files are stored next to each
+            archive).
+        """
+        return self._cache_dir
+
+    def toc_path(self, path: str) -> str:
+        """
+        Get the location of the TOC file for an archive.
+
+        :param path: The path to the archive file.
+        :return: The path to the TOC file.
+        """
+        if self.cache_dir is None:
+            return path + ArchiveTocCache.SUFFIX
+        digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest + ArchiveTocCache.SUFFIX)
+
+    @staticmethod
+    def _stat_key(path: str) -> typing.Tuple[int, int, int]:
+        """
+        Get the values used to decide whether an archive has changed.
+
+        :param path: The path to the archive file.
+        :return: The size, modification time (in nanoseconds), and inode.
+        """
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def load(self, path: str) -> ArchiveIndex:
+        """
+        Load the index of an archive, using the TOC file if it is up-to-date, or
+        scanning the archive (and writing a new TOC file) if not.
+
+        :param path: The path to the archive file.
+        :return: The archive index.
+        """
+        key = ArchiveTocCache._stat_key(path)
+        index = self._read(path, key)
+        if index is not None:
+            return index
+        with open(path, "rb") as buffer:
+            index = ArchiveIndex.deserialize(buffer)
+        # the archive may have changed while it was being scanned
+        if ArchiveTocCache._stat_key(path) == key:
+            self._write(path, key, index)
+        return index
+
+    def invalidate(self, path: str):
+        """
+        Remove the TOC file for an archive (if there is one).
+
+        :param path: The path to the archive file.
+        """
+        try:
+            os.remove(self.toc_path(path))
+        except FileNotFoundError:
+            pass
+
+    def _read(
+        self, path: str, key: typing.Tuple[int, int, int]
+    ) -> typing.Optional[ArchiveIndex]:
+        """
+        Read the TOC file for an archive.
+
+        :param path: The path to the archive file.
+        :param key: The current size, modification time and inode of the archive.
+        :return: The archive index (or None if there is no valid TOC file).
+        """
+        try:
+            with open(self.toc_path(path), "rb") as buffer:
+                data = buffer.read()
+        except OSError:
+            return None
+        try:
+            fields = ArchiveTocCache.STRUCT.unpack_from(data)
+            magic, version, size, mtime, inode, offset, count = fields
+            if magic != ArchiveTocCache.TOC_MAGIC:
+                return None
+            if version != ArchiveTocCache.TOC_VERSION:
+                return None
+            if (size, mtime, inode) != key:
+                return None
+            position = ArchiveTocCache.STRUCT.size
+            header = ArchiveHeader.unpack(data, position)
+            position += ArchiveHeader.SIZE
+            record_headers = ArchiveRecordHeader.unpack_many(data, position, count)
+            return ArchiveIndex.from_headers(header, record_headers, offset=offset)
+        except (struct.error, ValueError, AssertionError):
+            return None
+
+    def _write(self, path: str, key: typing.Tuple[int, int, int], index: ArchiveIndex):
+        """
+        Write the TOC file for an archive. The file is replaced atomically, and failure
+        to write it (for example, in a read-only directory) is not an error.
+
+        :param path: The path to the archive file.
+        :param key: The size, modification time and inode of the archive.
+        :param index: The archive index.
+        """
+        offset = index[0].header_offset if len(index) else ArchiveHeader.SIZE
+        chunks = [
+            ArchiveTocCache.STRUCT.pack(
+                ArchiveTocCache.TOC_MAGIC,
+                ArchiveTocCache.TOC_VERSION,
+                *key,
+                offset,
+                len(index),
+            ),
+            index.header.pack(),
+        ]
+        chunks.extend(entry.header.pack() for entry in index)
+        toc_path = self.toc_path(path)
+        try:
+            if self.cache_dir is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{toc_path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "wb") as buffer:
+                    buffer.write(b"".join(chunks))
+                os.replace(temp_path, toc_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError:
+            pass
+
+
+def load_index(path: str, cache_dir: typing.Optional[str] = None) -> ArchiveIndex:
+    """
+    Load the index of an archive, using (and maintaining) a TOC cache file. This is a
+    shorthand for ``ArchiveTocCache(cache_dir).load(path)``.
+
+    :param path: The path to the archive file.
+    :param cache_dir: The directory in which to store TOC files (if omitted, they are
+        stored next to each archive).
+    :return: The archive index.
+    """
+    return ArchiveTocCache(cache_dir).load(path)
@@ -0,0 +1,520 @@
+"""
+Classes and methods for writing archives one record at a time, without building the
+record tree in memory.
+"""
+
+import collections
+import concurrent.futures
+import datetime
+import fnmatch
+import io
+import os
+import pickle
+import stat
+import typing
+
+from ..util import copy_buffer, transfer_buffer
+from .common import CarArchiveType, CarCompressionType, CarRecordType
+from .compression import ArchiveCodec, get_codec
+from .header import ArchiveHeader
+from .layout import ArchiveLayout
+from .record import ArchiveRecord
+from .record.header import ArchiveRecordHeader
+
+
+def compress_file(
+    name: str,
+    source: typing.BinaryIO,
+    size: int,
+    compression_type: CarCompressionType,
+) -> bytes:
+    """
+    Read exactly ``size`` bytes from a buffer and compress them.
+
+    :param name: The name of the file (for error messages).
+    :param source: The buffer from which to read the contents of the file.
+    :param size: The number of bytes to read.
+    :param compression_type: The compression type.
+    :return: The compressed contents.
+    """
+    return _compress(name, source, size, get_codec(compression_type))
+
+
+def _compress(
+    name: str, source: typing.BinaryIO, size: int, codec: ArchiveCodec
+) -> bytes:
+    """
+    Read exactly ``size`` bytes from a buffer and compress them with a codec.
+
+    :param name: The name of the file (for error messages).
+    :param source: The buffer from which to read the contents of the file.
+    :param size: The number of bytes to read.
+    :param codec: The codec.
+    :return: The compressed contents.
+    """
+    data = io.BytesIO()
+    if copy_buffer(source, data, max_size=size) != size:
+        raise ValueError(f"{name} is shorter than {size} bytes")
+    data.seek(0)
+    dest = io.BytesIO()
+    codec.compress(data, dest)
+    return dest.getvalue()
+
+
+def _compress_path(path: str, size: int, codec: ArchiveCodec) -> bytes:
+    """
+    Read a file from the host filesystem and compress it (in a worker process). The
+    codec is passed in, rather than looked up in the worker, because worker processes
+    which are spawned (rather than forked) only see the codecs which are registered
+    when this module is imported.
+
+    :param path: The path to the file on the host.
+    :param size: The number of bytes to read.
+    :param codec: The codec.
+    :return: The compressed contents.
+    """
+    with open(path, "rb") as source:
+        return _compress(path, source, size, codec)
+
+
+def _picklable(codec: ArchiveCodec) -> bool:
+    """
+    Check whether a codec can be sent to a worker process (its functions must be
+    defined at the top level of a module).
+
+    :param codec: The codec.
+    :return: True if the codec can be pickled.
+    """
+    try:
+        pickle.dumps(codec)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+class _HostRecord:  # pylint: disable=R0903
+    """
+    A file or directory on the host filesystem which is going to be written to an
+    archive.
+    """
+
+    def __init__(self, path: str, name: str, size: int = 0):
+        """
+        Create a new host record.
+
+        :param path: The path to the file or directory on the host.
+        :param name: The name of the record within the archive.
+        :param size: The size of the file (ignored for directories).
+        """
+        self.path = path
+        self.name = name
+        self.size = size
+        self.children: typing.Optional[typing.List["_HostRecord"]] = None
+
+
+class C64ArchiveWriter:
+    """
+    A ``C64ArchiveWriter`` writes an archive one record at a time. The archive header
+    is written when the writer is created; records must then be written in archive
+    order (each directory header followed by all of its children).
+
+    Every record header only needs the size of a file or the number of children of a
+    directory, so file contents can be streamed directly from their source to the
+    output without ever being held in memory.
+
+    Example: ::
+
+        with open('test.car', 'wb') as f:
+            writer = C64ArchiveWriter(f, note='hello world')
+            writer.write_path('build/myapp')
+            writer.close()
+    """
+
+    def __init__(
+        self,
+        buffer: typing.BinaryIO,
+        archive_type: CarArchiveType = CarArchiveType.GENERAL,
+        timestamp: typing.Optional[datetime.datetime] = None,
+        note: str = "",
+    ):
+        """
+        Create a new archive writer. The archive header is written immediately.
+
+        :param buffer: The buffer into which to write.
+        :param archive_type: The type of archive to create.
+        :param timestamp: The archive creation timestamp (defaults to now).
+        :param note: A message to store in the archive 'note' field.
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        self._buffer = buffer
+        self._header = ArchiveHeader(
+            archive_type=archive_type, timestamp=timestamp, note=note
+        )
+        self._layout = ArchiveLayout()
+        self._header.serialize(buffer)
+
+    @property
+    def header(self) -> ArchiveHeader:
+        """
+        Get the header (metadata) of the archive.
+
+        :return: The header.
+        """
+        return self._header
+
+    @property
+    def complete(self) -> bool:
+        """
+        Check whether every record which the archive needs has been written.
+
+        :return: True if the archive is complete.
+        """
+        return self._layout.complete
+
+    def write_directory(self, name: str, size: int):
+        """
+        Write a directory header. The next ``size`` records written become children of
+        this directory.
+
+        :param name: The name of the directory (not full path).
+        :param size: The number of children the directory will contain.
+        """
+        header = ArchiveRecordHeader(
+            name=name, size=size, record_type=CarRecordType.DIRECTORY
+        )
+        self._buffer.write(self._layout.pack(header))
+
+    def write_file(  # pylint: disable=R0913
+        self,
+        name: str,
+        source: typing.BinaryIO,
+        size: int,
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+    ):
+        """
+        Write a file record, copying exactly ``size`` bytes from ``source``. If both
+        ``source`` and the output are real files, the data is copied by the kernel.
+        Files which are compressed are compressed in memory first (because the header,
+        which comes first, contains the compressed size).
+
+        :param name: The name of the file (not full path).
+        :param source: The buffer from which to read the contents of the file.
+        :param size: The number of bytes to copy (before compression).
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        if compression_type is not CarCompressionType.NONE:
+            source = io.BytesIO(compress_file(name, source, size, compression_type))
+            size = len(source.getbuffer())
+        self._write_stored(name, source, size, file_type, compression_type)
+
+    def _write_stored(  # pylint: disable=R0913
+        self,
+        name: str,
+        source: typing.BinaryIO,
+        size: int,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+    ):
+        """
+        Write a file record whose contents are already stored in their final form.
+
+        :param name: The name of the file (not full path).
+        :param source: The buffer from which to read the stored contents.
+        :param size: The number of bytes to copy.
+        :param file_type: The record type (SEQ or PRG).
+        :param compression_type: The compression type.
+        """
+        header = ArchiveRecordHeader(
+            name=name,
+            size=size,
+            record_type=file_type,
+            compression_type=compression_type,
+        )
+        self._buffer.write(self._layout.pack(header))
+        if transfer_buffer(source, self._buffer, size) != size:
+            raise ValueError(f"{name} is shorter than {size} bytes")
+
+    def write_record(self, record: ArchiveRecord):
+        """
+        Write an in-memory record (including all of its descendants, if it is a
+        directory).
+
+        :param record: The record to write.
+        """
+        self._layout.begin()
+        record.serialize(self._buffer)
+
+    def write_path(  # pylint: disable=R0913
+        self,
+        path: str,
+        name: typing.Optional[str] = None,
+        file_type: CarRecordType = CarRecordType.SEQFILE,
+        recursive: bool = True,
+        exclude: typing.Optional[str] = None,
+        sort: bool = False,
+        no_empty_dir: bool = False,
+        compression_type: CarCompressionType = CarCompressionType.NONE,
+        workers: typing.Optional[int] = None,
+    ) -> typing.List[str]:
+        """
+        Write a file or directory from the host filesystem. The whole tree is listed
+        (and each file is stat'ed) first, and every header is checked, so that nothing
+        is written if any record cannot be stored; then the headers are written and the
+        contents of each file are copied directly from disk.
+
+        Files which are compressed are compressed in a pool of worker processes, a few
+        files ahead of the one being written; records are still written in archive
+        order, so the output does not depend on the number of workers. The codec is
+        sent to the workers, so a codec whose functions cannot be pickled (such as
+        lambdas or nested functions) is run in this process instead.
+
+        :param path: The path to the file or directory on the host.
+        :param name: The name of the record within the archive (defaults to the last
+            component of ``path``).
+        :param file_type: The record type to use for files (SEQ or PRG).
+        :param recursive: Add the contents of directories.
+        :param exclude: Skip files and directories matching this glob-style pattern.
+        :param sort: Order the children of each directory by name.
+        :param no_empty_dir: Skip directories which have no children.
+        :param compression_type: The compression type to use for files.
+        :param workers: The number of processes to use for compression (defaults to
+            the number of CPUs; 1 compresses each file in this process, as it is
+            written).
+        :return: The host paths of all files and directories which were written (in
+            archive order).
+        :raises ValueError: If a record cannot be stored (such as a name which is too
+            long); nothing is written in that case.
+        """
+        if workers is not None and workers < 1:
+            raise ValueError("the number of workers must be at least 1")
+        if name is None:
+            name = os.path.basename(os.path.normpath(path))
+        root = C64ArchiveWriter._list_path(path, name, recursive, exclude, sort)
+        if root is None or (no_empty_dir and not C64ArchiveWriter._prune(root)):
+            raise ValueError(f"nothing to add from {path}")
+        records = C64ArchiveWriter._records(root, file_type, compression_type)
+        files = [record for record in records if record.children is None]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        codec = get_codec(compression_type)
+        if (
+            compression_type is CarCompressionType.NONE
+            or min(workers, len(files)) < 2
+            or not _picklable(codec)
+        ):
+            for record in records:
+                if record.children is None:
+                    with open(record.path, "rb") as source:
+                        self.write_file(
+                            record.name,
+                            source,
+                            record.size,
+                            file_type,
+                            compression_type,
+                        )
+                else:
+                    self.write_directory(record.name, len(record.children))
+        else:
+            self._write_parallel(records, files, file_type, codec, workers)
+        return [record.path for record in records]
+
+    def _write_parallel(  # pylint: disable=R0913
+        self,
+        records: typing.List[_HostRecord],
+        files: typing.List[_HostRecord],
+        file_type: CarRecordType,
+        codec: ArchiveCodec,
+        workers: int,
+    ):
+        """
+        Write host records in order, compressing files in a pool of worker processes.
+        Only a bounded number of files are compressed ahead of the one being written,
+        so at most that many compressed files are held in memory at once.
+
+        :param records: The host records (in archive order).
+        :param files: The host records which are files (in archive order).
+        :param file_type: The record type to use for files (SEQ or PRG).
+        :param codec: The codec for the compression type.
+        :param workers: The number of worker processes.
+        """
+        pending: typing.Deque[concurrent.futures.Future] = collections.deque()
+        queued = iter(files)
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            try:
+                for record in records:
+                    while len(pending) < 2 * workers:
+                        item = next(queued, None)
+                        if item is None:
+                            break
+                        pending.append(
+                            pool.submit(_compress_path, item.path, item.size, codec)
+                        )
+                    if record.children is not None:
+                        self.write_directory(record.name, len(record.children))
+                        continue
+                    data = pending.popleft().result()
+                    self._write_stored(
+                        record.name,
+                        io.BytesIO(data),
+                        len(data),
+                        file_type,
+                        codec.compression_type,
+                    )
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def _list_path(
+        path: str,
+        name: str,
+        recursive: bool,
+        exclude: typing.Optional[str],
+        sort: bool,
+    ) -> typing.Optional[_HostRecord]:
+        """
+        List a file or directory on the host filesystem. Directories are listed with an
+        explicit stack, so deeply nested trees do not hit the recursion limit.
+
+        :param path: The path to the file or directory on the host.
+        :param name: The name of the record within the archive.
+        :param recursive: List the contents of directories.
+        :param exclude: Skip files and directories matching this glob-style pattern.
+        :param sort: Order the children of each directory by name.
+        :return: The host record (or None, if it should be skipped).
+        """
+        root = C64ArchiveWriter._stat_path(path, name)
+        if root is None or root.children is None or not recursive:
+            return root
+        stack = [(root, root.children)]
+        while stack:
+            record, children = stack.pop()
+            with os.scandir(record.path) as entries:
+                names = [entry.name for entry in entries]
+            if sort:
+                names.sort()
+            for child_name in names:
+                if exclude is not None and fnmatch.fnmatch(child_name, exclude):
+                    continue
+                child = C64ArchiveWriter._stat_path(
+                    os.path.join(record.path, child_name), child_name
+                )
+                if child is not None:
+                    children.append(child)
+                    if child.children is not None:
+                        stack.append((child, child.children))
+        return root
+
+    @staticmethod
+    def _stat_path(path: str, name: str) -> typing.Optional[_HostRecord]:
+        """
+        Create the host record for a file or directory on the host filesystem (without
+        listing the contents of a directory).
+
+        :param path: The path to the file or directory on the host.
+        :param name: The name of the record within the archive.
+        :return: The host record (or None, if it is neither a file nor a directory).
+        """
+        info = os.stat(path)
+        if stat.S_ISREG(info.st_mode):
+            return _HostRecord(path, name, info.st_size)
+        if not stat.S_ISDIR(info.st_mode):
+            return None
+        record = _HostRecord(path, name)
+        record.children = []
+        return record
+
+    @staticmethod
+    def _records(
+        root: _HostRecord,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+    ) -> typing.List[_HostRecord]:
+        """
+        Put a listing into archive order, checking that every header can be stored.
+
+        :param root: The host record at the root of the listing.
+        :param file_type: The record type to use for files (SEQ or PRG).
+        :param compression_type: The compression type to use for files.
+        :return: The host records (in archive order).
+        :raises ValueError: If a header cannot be stored.
+        """
+        records = []
+        stack = [root]
+        while stack:
+            record = stack.pop()
+            C64ArchiveWriter._check(record, file_type, compression_type)
+            records.append(record)
+            if record.children is not None:
+                stack.extend(reversed(record.children))
+        return records
+
+    @staticmethod
+    def _check(
+        record: _HostRecord,
+        file_type: CarRecordType,
+        compression_type: CarCompressionType,
+    ):
+        """
+        Check that the header of a host record can be stored (the size of a file which
+        is going to be compressed can only be checked once it has been compressed).
+
+        :param record: The host record.
+        :param file_type: The record type to use for files (SEQ or PRG).
+        :param compression_type: The compression type to use for files.
+        :raises ValueError: If the header cannot be stored.
+        """
+        if record.children is not None:
+            header = ArchiveRecordHeader(
+                name=record.name,
+                size=len(record.children),
+                record_type=CarRecordType.DIRECTORY,
+            )
+        elif compression_type is CarCompressionType.NONE:
+            header = ArchiveRecordHeader(
+                name=record.name, size=record.size, record_type=file_type
+            )
+        else:
+            header = ArchiveRecordHeader(
+                name=record.name,
+                record_type=file_type,
+                compression_type=compression_type,
+            )
+        header.pack()
+
+    @staticmethod
+    def _prune(record: _HostRecord) -> bool:
+        """
+        Remove empty directories (including directories which only contain empty
+        directories) from a listing.
+
+        :param record: The host record.
+        :return: False if the record itself is an empty directory.
+        """
+        if record.children is None:
+            return True
+        directories = []
+        stack = [record]
+        while stack:
+            directory = stack.pop()
+            directories.append(directory)
+            stack.extend(c for c in directory.children or () if c.children is not None)
+        # every directory comes after its parent, so prune in reverse order
+        for directory in reversed(directories):
+            directory.children = [
+                c for c in directory.children or () if c.children is None or c.children
+            ]
+        return bool(record.children)
+
+    def close(self):
+        """
+        Finish writing the archive. The underlying buffer is not closed.
+
+        :raises ValueError: If some records have not been written yet.
+        """
+        if not self.complete:
+            raise ValueError("the archive is missing records")
+        self._buffer.flush()
@@ -2,4 +2,4 @@
 CLI argparse definitions used in scripts.
 """
 
-from .car import car_parser
+from .car import COMPRESSION_TYPES, car_parser
@@ -6,7 +6,35 @@ import argparse
 import os
 import sys
 
-from ..car import CarArchiveType, CarRecordType
+from ..car import CarArchiveType, CarCompressionType, CarRecordType
+from ..car.compression import RLE
+
+# the compression types which can be chosen on the command line (by name)
+COMPRESSION_TYPES = {"none": CarCompressionType.NONE, "rle": RLE}
+
+
+def _jobs_argument(
+    subparser,
+    help_text="number of archives to process in parallel (default: number of CPUs)",
+):
+    subparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help=help_text,
+    )
+
+
+def _compression_argument(subparser):
+    subparser.add_argument(
+        "-z",
+        "--compression",
+        type=str,
+        choices=list(COMPRESSION_TYPES),
+        default="none",
+        help="compress added files (default: none; C64 OS cannot read rle)",
+    )
 
 
 def _create_parser(subparsers):
@@ -81,6 +109,11 @@ def _create_parser(subparsers):
         help="when creating an archive, sort directory "
         "and file entries according to their name",
     )
+    _compression_argument(subparser)
+    _jobs_argument(
+        subparser,
+        help_text="number of files to compress in parallel (default: number of CPUs)",
+    )
     subparser.set_defaults(
         subcmd="create",
         type="general",
@@ -93,7 +126,7 @@ def _create_parser(subparsers):
 
 def _append_parser(subparsers):
     subparser = subparsers.add_parser(
-        "apppend", aliases=["a"], help="append files to the end of an archive"
+        "append", aliases=["a"], help="append files to the end of an archive"
     )
     subparser.add_argument("archive", type=str, help="path to archive file")
     subparser.add_argument(
@@ -169,8 +202,15 @@ def _append_parser(subparsers):
         "--sort",
         action="store_true",
         help="after appending, re-sort directory and "
-        "file entries according to their name",
+        "file entries according to their name (not with --in-place)",
+    )
+    subparser.add_argument(
+        "--memory-budget",
+        type=int,
+        help="keep at most this many bytes of file contents in memory; "
+        "move the rest to temporary files on disk",
     )
+    _compression_argument(subparser)
     subparser.set_defaults(
         subcmd="append",
         file_type=CarRecordType.SEQFILE,
@@ -183,13 +223,19 @@ def _extract_parser(subparsers):
     subparser = subparsers.add_parser(
         "extract", aliases=["e"], help="extract files from an archive"
     )
-    subparser.add_argument("archive", type=str, nargs="+", help="path to archive file")
+    subparser.add_argument(
+        "archive",
+        type=str,
+        nargs="+",
+        help="path to archive file, glob-style wildcard pattern, or '-' for stdin",
+    )
     subparser.add_argument(
         "-o",
         "--output",
         type=str,
         help="create files in the specified directory (instead of current directory)",
     )
+    _jobs_argument(subparser)
     group = subparser.add_mutually_exclusive_group()
     group.add_argument(
         "--no-seq", action="store_true", help="do not extract files of type SEQ"
@@ -242,24 +288,53 @@ def _list_parser(subparsers):
     subparser = subparsers.add_parser(
         "list", aliases=["l"], help="list the files and directories within an archive"
     )
-    subparser.add_argument("archive", type=str, help="path to archive file")
+    subparser.add_argument(
+        "archive",
+        type=str,
+        help="path to archive file, glob-style wildcard pattern, or '-' for stdin",
+    )
     subparser.add_argument(
         "base",
         type=str,
+        nargs="?",
         default="",
         help="base starting path within the archive (defaults to root)",
     )
     subparser.add_argument(
         "-n", "--depth", type=int, default=-1, help="limit list to n directories deep"
     )
+    _jobs_argument(subparser)
     subparser.set_defaults(subcmd="list")
 
 
+def _cat_parser(subparsers):
+    subparser = subparsers.add_parser(
+        "cat", help="write the contents of a single file within an archive"
+    )
+    subparser.add_argument(
+        "archive", type=str, help="path to archive file (or '-' for stdin)"
+    )
+    subparser.add_argument(
+        "path", type=str, help="path to the file within the archive (e.g. root/foo.t)"
+    )
+    subparser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="write output to specified file (instead of stdout)",
+    )
+    subparser.set_defaults(subcmd="cat", output=sys.stdout.buffer)
+
+
 def _info_parser(subparsers):
     subparser = subparsers.add_parser(
         "info", aliases=["i"], help="read or write metadata on an archive"
     )
-    subparser.add_argument("archive", type=str, help="path to archive file")
+    subparser.add_argument(
+        "archive",
+        type=str,
+        help="path to archive file, glob-style wildcard pattern, or '-' for stdin",
+    )
     subparser.add_argument(
         "field",
         type=str,
@@ -273,6 +348,7 @@ def _info_parser(subparsers):
         default=None,
         help="new value to write (omit for read)",
     )
+    _jobs_argument(subparser)
     subparser.set_defaults(subcmd="info")
 
 
@@ -294,4 +370,5 @@ def car_parser():
     _merge_parser(subparsers)
     _list_parser(subparsers)
     _info_parser(subparsers)
+    _cat_parser(subparsers)
     return parser
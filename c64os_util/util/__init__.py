@@ -6,7 +6,7 @@ import codecs
 import typing
 
 from .codec import CODEC_INFOS, LC_CODEC, UC_CODEC
-from .functions import copy_buffer
+from .functions import copy_buffer, is_seekable, skip_buffer, transfer_buffer
 
 
 def petscii_search_fn(encoding: str) -> typing.Optional[codecs.CodecInfo]:
@@ -2,27 +2,238 @@
 Utility functions (used throughout the project).
 """
 
+import io
+import os
+import stat
+
+MIN_CHUNK_SIZE = io.DEFAULT_BUFFER_SIZE
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def _chunk_size(dest):
+    """
+    Choose the initial chunk size for copying into a buffer: the block size of the
+    underlying file, if there is one.
+    :param dest: The destination buffer.
+    :return: The chunk size.
+    """
+    fd = _fileno(dest)
+    if fd is not None:
+        try:
+            return max(os.fstat(fd).st_blksize, MIN_CHUNK_SIZE)
+        except OSError:
+            pass
+    return MIN_CHUNK_SIZE
+
+
+def _copy_memory(src, dest, max_size):
+    """
+    Copy from a buffer which is held in memory (such as ``io.BytesIO``) by writing a
+    slice of its contents directly, without reading it in chunks.
+    :param src: The source buffer.
+    :param dest: The destination buffer.
+    :param max_size: The maximum number of bytes to copy from ``src``.
+    :return: The number of bytes copied (or None, if ``src`` is not held in memory).
+    """
+    contents_view = getattr(src, "_contents_view", None)
+    if contents_view is not None:
+        # archive files provide a view which (unlike getbuffer()) does not mark their
+        # contents as exported
+        view = contents_view()
+        if view is None:
+            return None
+    elif isinstance(src, io.BytesIO) and type(src).getvalue is io.BytesIO.getvalue:
+        # getvalue() returns the underlying bytes object without copying it, whereas
+        # getbuffer() would force a BytesIO which shares its bytes to copy them
+        view = memoryview(src.getvalue())
+    else:
+        try:
+            view = src.getbuffer()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+    # only release a view created here: the source may keep using the view which
+    # getbuffer() returned
+    with memoryview(view) as data:
+        start = src.tell()
+        end = data.nbytes if max_size < 0 else min(data.nbytes, start + max_size)
+        if end <= start:
+            return 0
+        with data[start:end] as chunk:
+            dest.write(chunk)
+    src.seek(end)
+    return end - start
+
 
 def copy_buffer(
     src,
     dest,
     max_size=-1,
-    chunk_size=1024,
+    chunk_size=None,
 ):
     """
     Copy the contents of the ``src`` buffer into the ``dest`` buffer.
+
+    If ``src`` is held in memory (it provides ``getbuffer``, like ``io.BytesIO``), its
+    contents are written to ``dest`` directly. Archive files provide a private view of
+    their contents instead, because ``getbuffer`` lets the caller modify them. Otherwise, data is read into a single
+    reusable buffer with ``readinto`` (if ``src`` supports it). Unless ``chunk_size`` is
+    given, the chunk size starts at the block size of ``dest`` and doubles (up to 1 MiB)
+    for as long as ``src`` keeps filling it.
     :param src: The source buffer.
     :param dest: The destination buffer.
     :param max_size: The maximum number of bytes to copy from ``src``.
-    :param chunk_size: The maximum number of bytes to copy at once.
+    :param chunk_size: The maximum number of bytes to copy at once (fixed).
+    :return: The number of bytes copied.
+    """
+    count = _copy_memory(src, dest, max_size)
+    if count is not None:
+        return count
+    readinto = getattr(src, "readinto", None)
+    adaptive = chunk_size is None
+    if adaptive:
+        chunk_size = _chunk_size(dest)
+    if max_size >= 0:
+        chunk_size = min(chunk_size, max_size)
+    data = bytearray(chunk_size)
+    view = memoryview(data)
+    count = 0
+    while max_size < 0 or count < max_size:
+        size = len(data)
+        if max_size >= 0 and max_size - count < size:
+            size = max_size - count
+        if readinto is None:
+            chunk = src.read(size)
+            size = len(chunk)
+            if size:
+                dest.write(chunk)
+        else:
+            size = readinto(view[:size]) or 0
+            if size:
+                dest.write(view[:size])
+        if not size:
+            break
+        count += size
+        if adaptive and size == len(data) and size < MAX_CHUNK_SIZE:
+            remaining = MAX_CHUNK_SIZE if max_size < 0 else max_size - count
+            if remaining > size:
+                view.release()
+                data = bytearray(min(size * 2, MAX_CHUNK_SIZE, remaining))
+                view = memoryview(data)
+    view.release()
+    return count
+
+
+def is_seekable(buffer) -> bool:
+    """
+    Check whether a buffer supports seeking. Objects which provide ``seek`` but not
+    ``seekable`` (such as ``mmap``) are assumed to be seekable.
+    :param buffer: The buffer in question.
+    :return: True if the buffer is seekable.
     """
+    seekable = getattr(buffer, "seekable", None)
+    if seekable is None:
+        return hasattr(buffer, "seek")
+    return seekable()
+
+
+def skip_buffer(buffer, size, chunk_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Advance a buffer by ``size`` bytes. Seekable buffers are seeked; other buffers
+    (such as pipes) are read and the data is discarded.
+    :param buffer: The buffer.
+    :param size: The number of bytes to skip.
+    :param chunk_size: The maximum number of bytes to discard at once.
+    :return: The number of bytes skipped (less than ``size`` if the end of a
+        non-seekable buffer was reached).
+    """
+    if is_seekable(buffer):
+        buffer.seek(size, os.SEEK_CUR)
+        return size
     count = 0
-    while True:
-        size = chunk_size
-        if max_size >= 0:
-            size = min(max_size - count, size)
-        chunk = src.read(size)
+    while count < size:
+        chunk = buffer.read(min(size - count, chunk_size))
         if not chunk:
             break
-        dest.write(chunk)
         count += len(chunk)
+    return count
+
+
+def _fileno(buffer):
+    """
+    Get the file descriptor underlying a buffer.
+    :param buffer: The buffer.
+    :return: The file descriptor (or None, if the buffer is not backed by one).
+    """
+    try:
+        return buffer.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _transfer_fds(src, dest, src_fd, dest_fd, size):
+    """
+    Copy data between two file descriptors using ``os.copy_file_range`` (if both are
+    regular files) or ``os.sendfile``. The positions of ``src`` and ``dest`` are
+    updated to match.
+    :param src: The source buffer (must be a regular file).
+    :param dest: The destination buffer.
+    :param src_fd: The file descriptor of ``src``.
+    :param dest_fd: The file descriptor of ``dest``.
+    :param size: The maximum number of bytes to copy.
+    :return: The number of bytes copied.
+    """
+    dest.flush()
+    src_pos = src.tell()
+    dest_pos = None
+    use_copy_file_range = False
+    if is_seekable(dest):
+        dest_pos = dest.seek(0, os.SEEK_CUR)
+        use_copy_file_range = hasattr(os, "copy_file_range") and stat.S_ISREG(
+            os.fstat(dest_fd).st_mode
+        )
+    if not use_copy_file_range and not hasattr(os, "sendfile"):
+        return 0
+    count = 0
+    try:
+        while count < size:
+            if use_copy_file_range and dest_pos is not None:
+                copied = os.copy_file_range(
+                    src_fd, dest_fd, size - count, src_pos + count, dest_pos + count
+                )
+            else:
+                copied = os.sendfile(dest_fd, src_fd, src_pos + count, size - count)
+            if not copied:
+                break
+            count += copied
+    except OSError:
+        # not supported for this pair of files (or by this kernel); the caller falls
+        # back to copying through userspace
+        pass
+    finally:
+        src.seek(src_pos + count)
+        if dest_pos is not None:
+            dest.seek(dest_pos + count)
+    return count
+
+
+def transfer_buffer(src, dest, size):
+    """
+    Copy up to ``size`` bytes from the ``src`` buffer into the ``dest`` buffer. When
+    ``src`` is a regular file and ``dest`` is backed by a file descriptor, the data is
+    copied by the kernel (``os.copy_file_range`` or ``os.sendfile``) without passing
+    through userspace. Otherwise (or if the kernel refuses), this falls back to
+    ``copy_buffer``.
+    :param src: The source buffer.
+    :param dest: The destination buffer.
+    :param size: The maximum number of bytes to copy.
+    :return: The number of bytes copied (less than ``size`` if ``src`` ended first).
+    """
+    count = 0
+    src_fd = _fileno(src)
+    dest_fd = _fileno(dest)
+    if src_fd is not None and dest_fd is not None:
+        if stat.S_ISREG(os.fstat(src_fd).st_mode):
+            count = _transfer_fds(src, dest, src_fd, dest_fd, size)
+    if count < size:
+        count += copy_buffer(src, dest, max_size=size - count)
+    return count
@@ -1,19 +1,320 @@
 #!/bin/env python
+import concurrent.futures
+import contextlib
+import datetime
+import fnmatch
+import glob
+import os
+import sys
 from importlib import metadata
 
-from c64os_util.cli import car_parser
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    ArchiveIndex,
+    C64Archive,
+    C64ArchiveReader,
+    C64ArchiveWriter,
+    CarArchiveType,
+    CarRecordType,
+    MemoryBudget,
+    append_in_place,
+    extract_record,
+    update_header,
+)
+from c64os_util.car.header import ArchiveHeader
+from c64os_util.cli import COMPRESSION_TYPES, car_parser
+from c64os_util.util import copy_buffer
+
+ERRORS = (OSError, ValueError, KeyError, AssertionError)
+
+
+def _open_input(path):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin.buffer)
+    return open(path, "rb")
+
+
+def _open_output(path):
+    if not isinstance(path, str):
+        return contextlib.nullcontext(path)
+    return open(path, "wb")
+
+
+def _error(err):
+    if isinstance(err, KeyError) and err.args:
+        return err.args[0]
+    return err
+
+
+def _expand(patterns):
+    archives = []
+    for pattern in patterns:
+        if pattern == "-" or not glob.has_magic(pattern):
+            archives.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            sys.exit(f"car: {pattern}: no matching archives")
+        archives.extend(matches)
+    return archives
+
+
+def _run_jobs(fn, archives, jobs, *args):
+    """
+    Call ``fn(archive, *args)`` for each archive, in a process pool if there is more
+    than one archive. Results are yielded in order, as soon as they are available, as
+    (archive, result, error) tuples.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(archives))
+    if jobs <= 1 or "-" in archives:
+        for archive in archives:
+            try:
+                yield archive, fn(archive, *args), None
+            except ERRORS as err:
+                yield archive, None, err
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(fn, archive, *args) for archive in archives]
+        for archive, future in zip(archives, futures):
+            try:
+                yield archive, future.result(), None
+            except ERRORS as err:
+                yield archive, None, err
+
+
+def _host_path(output, path):
+    for part in path:
+        if part in ("", ".", "..") or os.sep in part or (os.altsep or os.sep) in part:
+            raise ValueError(f"refusing to extract unsafe path: {'/'.join(path)}")
+    return os.path.join(output, *path)
+
+
+def _extract_archive(archive, output, skip_types, no_empty_dir, force, skip):
+    with _open_input(archive) as f:
+        for path, header, body in C64ArchiveReader(f):
+            target = _host_path(output, path)
+            if body is None:
+                if not no_empty_dir:
+                    os.makedirs(target, exist_ok=True)
+                continue
+            if header.record_type in skip_types:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # create the file exclusively (unless overwriting), so that archives which
+            # are extracted in parallel cannot silently overwrite each other's files
+            try:
+                out = open(  # pylint: disable=R1732
+                    target, "wb" if force and not skip else "xb"
+                )
+            except FileExistsError as err:
+                if skip:
+                    continue
+                raise FileExistsError(f"{target} already exists") from err
+            with out:
+                copy_buffer(body, out)
+
+
+def _list_archive(archive, base, depth):
+    with _open_input(archive) as f:
+        index = ArchiveIndex.deserialize(f)
+    prefix = base.strip("/").split("/") if base.strip("/") else []
+    lines = []
+    for entry in index:
+        level = len(entry.path) - len(prefix)
+        if entry.path[: len(prefix)] != prefix or 0 <= depth < level:
+            continue
+        name = "/".join(entry.path)
+        if entry.record_type.is_directory():
+            name += "/"
+        lines.append(name)
+    if not lines:
+        raise KeyError(f"no such path: {base}")
+    return lines
+
+
+def _format_info(header, field):
+    if field == "type":
+        return header.archive_type.name.lower()
+    if field == "note":
+        return header.note
+    return header.timestamp.to_datetime().strftime("%Y-%m-%d %H:%M")
+
+
+def _header_fields(field, value):
+    if field == "type":
+        return {"archive_type": CarArchiveType[value.upper()]}
+    if field == "note":
+        if len(value) > ArchiveHeader.MAX_NOTE_SIZE:
+            raise ValueError(f"note is too long: {value}")
+        return {"note": value}
+    return {"timestamp": datetime.datetime.fromisoformat(value)}
+
+
+def _info_archive(archive, field, value):
+    if value is None:
+        with _open_input(archive) as f:
+            return _format_info(ArchiveHeader.deserialize(f), field)
+    if archive == "-":
+        raise ValueError("cannot modify an archive read from stdin")
+    update_header(archive, **_header_fields(field, value))
+    return None
+
+
+def _remove_files(paths):
+    for path in reversed(paths):
+        if os.path.isdir(path):
+            with contextlib.suppress(OSError):
+                os.rmdir(path)
+        else:
+            os.remove(path)
 
 
 def do_create(args):
-    print(args)
+    if len(args.file) != 1:
+        sys.exit("car: an archive has a single root; provide one file or directory")
+    try:
+        with _open_output(args.output) as f:
+            writer = C64ArchiveWriter(
+                f, archive_type=CarArchiveType[args.type.upper()], note=args.note
+            )
+            written = writer.write_path(
+                args.file[0],
+                file_type=args.file_type,
+                recursive=args.recursive,
+                exclude=args.exclude,
+                sort=args.sort,
+                no_empty_dir=args.no_empty_dir,
+                compression_type=COMPRESSION_TYPES[args.compression],
+                workers=args.jobs,
+            )
+            writer.close()
+    except ERRORS as err:
+        if isinstance(args.output, str):
+            with contextlib.suppress(OSError):
+                os.remove(args.output)
+        sys.exit(f"car: {_error(err)}")
+    if args.remove_files:
+        _remove_files(written)
+
+
+def _load_path(path, args, written, memory_budget=None):
+    name = os.path.basename(os.path.normpath(path))
+    if os.path.isfile(path):
+        record = ArchiveFile.create(
+            name=name,
+            file_type=args.file_type,
+            compression_type=COMPRESSION_TYPES[args.compression],
+            memory_budget=memory_budget,
+        )
+        with open(path, "rb") as f:
+            copy_buffer(f, record)
+        record.seek(0)
+        written.append(path)
+        return record
+    if not os.path.isdir(path):
+        return None
+    record = ArchiveDirectory(name=name)
+    written.append(path)
+    if args.recursive:
+        names = os.listdir(path)
+        if args.sort:
+            names.sort()
+        for child_name in names:
+            if args.exclude is not None and fnmatch.fnmatch(child_name, args.exclude):
+                continue
+            child = _load_path(
+                os.path.join(path, child_name), args, written, memory_budget
+            )
+            if child is not None:
+                record.append(child)
+    if args.no_empty_dir and not record:
+        written.remove(path)
+        return None
+    return record
+
+
+def _sort_tree(root):
+    directories = [
+        record
+        for _, record, _ in root.traverse()
+        if isinstance(record, ArchiveDirectory)
+    ]
+    for directory in directories:
+        directory.sort(key=lambda record: record.name)
+
+
+def _append_fields(args):
+    fields = {}
+    if args.type is not None:
+        fields.update(_header_fields("type", args.type))
+    if args.note is not None:
+        fields.update(_header_fields("note", args.note))
+    return fields
 
 
 def do_append(args):
-    print(args)
+    written = []
+    try:
+        memory_budget = None
+        if args.memory_budget is not None:
+            memory_budget = MemoryBudget(args.memory_budget)
+        records = [_load_path(path, args, written, memory_budget) for path in args.file]
+        records = [record for record in records if record is not None]
+        if args.in_place:
+            if args.archive == "-":
+                raise ValueError("cannot modify an archive read from stdin")
+            if args.sort:
+                raise ValueError("cannot re-sort an archive in place")
+            append_in_place(args.archive, records)
+            fields = _append_fields(args)
+            if fields:
+                update_header(args.archive, **fields)
+        else:
+            with _open_input(args.archive) as f:
+                archive = C64Archive.deserialize(f, memory_budget=memory_budget)
+            if not isinstance(archive.root, ArchiveDirectory):
+                raise ValueError("archive root is not a directory")
+            archive.root.extend(records)
+            if args.sort:
+                _sort_tree(archive.root)
+            for key, value in _append_fields(args).items():
+                setattr(archive.header, key, value)
+            if isinstance(args.output, str):
+                archive.save(args.output)
+            else:
+                archive.serialize(args.output)
+    except ERRORS as err:
+        sys.exit(f"car: {_error(err)}")
+    if args.remove_files:
+        _remove_files(written)
 
 
 def do_extract(args):
-    print(args)
+    archives = _expand(args.archive)
+    skip_types = set()
+    if args.no_seq:
+        skip_types.add(CarRecordType.SEQFILE)
+    if args.no_prg:
+        skip_types.add(CarRecordType.PRGFILE)
+    status = 0
+    results = _run_jobs(
+        _extract_archive,
+        archives,
+        args.jobs,
+        args.output,
+        skip_types,
+        args.no_empty_dir,
+        args.force,
+        args.skip,
+    )
+    for archive, _, err in results:
+        if err is not None:
+            print(f"car: {archive}: {_error(err)}", file=sys.stderr)
+            status = 1
+    sys.exit(status)
 
 
 def do_merge(args):
@@ -21,11 +322,50 @@ def do_merge(args):
 
 
 def do_list(args):
-    print(args)
+    archives = _expand([args.archive])
+    status = 0
+    results = _run_jobs(_list_archive, archives, args.jobs, args.base, args.depth)
+    for i, (archive, lines, err) in enumerate(results):
+        if err is not None:
+            print(f"car: {archive}: {_error(err)}", file=sys.stderr)
+            status = 1
+            continue
+        if len(archives) > 1:
+            if i:
+                print()
+            print(f"{archive}:")
+        for line in lines:
+            print(line)
+    sys.exit(status)
 
 
 def do_info(args):
-    print(args)
+    archives = _expand([args.archive])
+    status = 0
+    results = _run_jobs(_info_archive, archives, args.jobs, args.field, args.value)
+    for archive, value, err in results:
+        if err is not None:
+            print(f"car: {archive}: {_error(err)}", file=sys.stderr)
+            status = 1
+        elif value is None:
+            continue
+        elif len(archives) > 1:
+            print(f"{archive}: {value}")
+        else:
+            print(value)
+    sys.exit(status)
+
+
+def do_cat(args):
+    with _open_input(args.archive) as f:
+        try:
+            record = extract_record(f, args.path, sep="/")
+        except KeyError:
+            sys.exit(f"car: {args.archive}: no such file: {args.path}")
+    if not isinstance(record, ArchiveFile):
+        sys.exit(f"car: {args.archive}: not a file: {args.path}")
+    with _open_output(args.output) as f:
+        copy_buffer(record, f)
 
 
 def main():
@@ -36,6 +376,7 @@ def main():
         "merge": do_merge,
         "list": do_list,
         "info": do_info,
+        "cat": do_cat,
     }
     parser = car_parser()
     version = metadata.version("c64os_util")
@@ -0,0 +1,16 @@
+import io
+
+
+class Pipe(io.RawIOBase):
+    """
+    A readable stream which is not seekable (like a pipe or a socket).
+    """
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
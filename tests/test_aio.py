@@ -0,0 +1,159 @@
+import asyncio
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    AsyncArchiveReader,
+    AsyncArchiveWriter,
+    C64Archive,
+    SpooledArchiveFile,
+    deserialize_async,
+    open_async,
+    serialize_async,
+)
+
+
+class _StreamWriter:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.drained = 0
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    async def drain(self):
+        self.drained += 1
+
+
+def _archive():
+    archive = C64Archive(timestamp=datetime.datetime(2022, 5, 13, 3, 27), note="hi")
+    archive.root = ArchiveDirectory(name="root")
+    archive.root.append(ArchiveDirectory(name="inner"))
+    archive.root["inner"].append(ArchiveFile(name="foo.t"))
+    archive.root["inner"]["foo.t"].write(b"foo")
+    archive.root.append(ArchiveFile(name="bar.t"))
+    archive.root["bar.t"].write(100000 * b"x")
+    return archive
+
+
+def _stream_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class TestAio(unittest.TestCase):
+    def test_serialize(self):
+        archive = _archive()
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            expected = f.getvalue()
+        writer = _StreamWriter()
+        asyncio.run(serialize_async(archive, writer))
+        assert writer.buffer.getvalue() == expected
+        assert writer.drained > 2
+
+    def test_deserialize(self):
+        with io.BytesIO() as f:
+            _archive().serialize(f)
+            data = f.getvalue()
+
+        async def run(data):
+            return await deserialize_async(_stream_reader(data), memory_budget=1000)
+
+        archive = asyncio.run(run(data))
+        assert archive.header.note == "hi"
+        assert archive.root["inner"]["foo.t"].getvalue() == b"foo"
+        assert isinstance(archive.root["bar.t"], SpooledArchiveFile)
+        assert archive.root["bar.t"].spilled
+        assert not archive.root["inner"]["foo.t"].spilled
+        assert archive.root["bar.t"].getvalue() == 100000 * b"x"
+        with self.assertRaises(ValueError):
+            asyncio.run(run(data[:-1]))
+
+    def test_reader(self):
+        with io.BytesIO() as f:
+            _archive().serialize(f)
+            data = f.getvalue()
+
+        async def run():
+            reader = AsyncArchiveReader(_stream_reader(data))
+            contents = {}
+            async for path, _, body in reader:
+                if body is not None:
+                    contents["/".join(path)] = await body.read(3)
+            return reader.header, contents
+
+        header, contents = asyncio.run(run())
+        assert header.note == "hi"
+        assert contents == {"root/inner/foo.t": b"foo", "root/bar.t": b"xxx"}
+
+    def test_reader_truncated(self):
+        with io.BytesIO() as f:
+            _archive().serialize(f)
+            data = f.getvalue()
+
+        async def run(data, read):
+            async for _, _, body in AsyncArchiveReader(_stream_reader(data)):
+                if body is not None and read:
+                    while await body.read():
+                        pass
+
+        for read in (False, True):
+            with self.assertRaises(ValueError):
+                asyncio.run(run(data[:-1], read))
+
+    def test_write_path(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, "src", "sub"))
+            with open(os.path.join(tmpdir, "src", "a.t"), "wb") as f:
+                f.write(b"aaa")
+            writer = _StreamWriter()
+
+            async def run():
+                out = AsyncArchiveWriter(writer, note="hi")
+                await out.write_path(os.path.join(tmpdir, "src"), sort=True)
+                await out.close()
+
+            asyncio.run(run())
+            writer.buffer.seek(0)
+            archive = C64Archive.deserialize(writer.buffer)
+            assert archive.root.keys() == ["a.t", "sub"]
+            assert archive.root["a.t"].getvalue() == b"aaa"
+            path = os.path.join(tmpdir, "test.car")
+            with open(path, "wb") as f:
+                f.write(writer.buffer.getvalue())
+            archive = asyncio.run(open_async(path))
+            assert archive.root["a.t"].getvalue() == b"aaa"
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_write_invalid(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, "src"))
+            with open(os.path.join(tmpdir, "src", "a-long-filename.t"), "wb"):
+                pass
+            writer = _StreamWriter()
+
+            async def run(fn, *args):
+                out = AsyncArchiveWriter(writer)
+                await fn(out, *args)
+
+            with self.assertRaises(ValueError):
+                asyncio.run(
+                    run(AsyncArchiveWriter.write_path, os.path.join(tmpdir, "src"))
+                )
+            assert len(writer.buffer.getvalue()) == 48
+            with self.assertRaises(TypeError):
+                asyncio.run(run(AsyncArchiveWriter.write_record, C64Archive()))
+        finally:
+            shutil.rmtree(tmpdir)
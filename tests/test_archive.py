@@ -1,7 +1,12 @@
+import copy
 import datetime
 import io
+import itertools
 import os
+import pickle
+import tempfile
 import unittest
+from unittest import mock
 
 from c64os_util.car import (
     ArchiveDirectory,
@@ -10,7 +15,16 @@ from c64os_util.car import (
     CarArchiveType,
     CarCompressionType,
     CarRecordType,
+    MappedArchiveFile,
+    MemoryBudget,
+    SpooledArchiveFile,
+    TraversalOrder,
+    get_memory_budget,
+    set_memory_budget,
 )
+from c64os_util.util import copy_buffer
+
+from .pipe import Pipe
 
 
 class TestArchive(unittest.TestCase):
@@ -35,6 +49,262 @@ class TestArchive(unittest.TestCase):
         with self.assertRaises(ValueError):
             root.append(ArchiveDirectory("bar"))
 
+    def test_directory_index(self):
+        root = ArchiveDirectory(name="root")
+        root.extend(ArchiveFile(name=f"f{i}") for i in range(5))
+        with self.assertRaises(ValueError):
+            root += [ArchiveFile(name="f1")]
+        root[0].name = "renamed"
+        assert "f0" not in root
+        assert root["renamed"] is root[0]
+        del root[1]
+        assert "f1" not in root
+        assert root.pop().name == "f4"
+        assert "f4" not in root
+        root[0] = ArchiveFile(name="renamed")
+        root[1:] = [ArchiveFile(name="f2"), ArchiveDirectory(name="d")]
+        assert root.keys() == ["renamed", "f2", "d"]
+        assert "f3" not in root
+        with self.assertRaises(ValueError):
+            root[:1] = [ArchiveFile(name="d")]
+        root.insert(0, ArchiveFile(name="first"))
+        root.remove(root["d"])
+        assert root.keys() == ["first", "renamed", "f2"]
+        assert root["f2"] is root[2]
+        dup = root + ArchiveDirectory(name="root")
+        assert dup.keys() == root.keys()
+        assert dup["f2"] is dup[2]
+        root.clear()
+        assert "first" not in root
+
+    def test_directory_index_stale(self):
+        # an index which needs to be rebuilt (after a rename elsewhere) must not be
+        # rebuilt between changing the list and updating the index
+        root = ArchiveDirectory(name="root")
+        first, second = ArchiveFile(name="a"), ArchiveFile(name="b")
+        root.append(first)
+        root.append(second)
+        ArchiveFile(name="x").name = "y"
+        assert root.pop() is second and second.parent is None
+        root[0:0] = [ArchiveFile(name="h")]
+        ArchiveFile(name="x").name = "y"
+        del root[0]
+        assert root.keys() == ["a"] and "h" not in root
+        ArchiveFile(name="x").name = "y"
+        root[0] = ArchiveFile(name="c")
+        assert root.keys() == ["c"] and first.parent is None
+
+    def test_parent(self):
+        archive = self._create_archive()
+        archive.root = ArchiveDirectory(name="root")
+        foo = archive.touch("root/a/foo.t", sep="/", create_directories=True)
+        assert foo.parent is archive.ls("root/a", sep="/")
+        assert foo.path == ["root", "a", "foo.t"]
+        foo.parent.name = "b"
+        assert foo.path == ["root", "b", "foo.t"]
+        assert archive.ls("root/b/foo.t", sep="/") is foo
+        with self.assertRaises(KeyError):
+            archive.ls("root/a/foo.t", sep="/")
+        archive.rm("root/b/foo.t", sep="/")
+        assert foo.parent is None
+        with self.assertRaises(KeyError):
+            archive.ls("root/b/foo.t", sep="/")
+        inner = ArchiveDirectory(name="inner")
+        inner.append(foo)
+        assert foo.path == ["inner", "foo.t"]
+        archive["root"]["b"].append(inner)
+        assert foo.path == ["root", "b", "inner", "foo.t"]
+        assert archive.ls("root/b/inner/foo.t", sep="/") is foo
+        archive["root"]["b"].pop()
+        with self.assertRaises(KeyError):
+            archive.ls("root/b/inner/foo.t", sep="/")
+        archive.root = ArchiveDirectory(name="root")
+        with self.assertRaises(KeyError):
+            archive.ls("root/b", sep="/")
+
+    def test_path_cache(self):
+        root = directory = ArchiveDirectory("d")
+        for _ in range(3000):
+            child = ArchiveDirectory("d")
+            directory.append(child)
+            directory = child
+        leaf = ArchiveFile("leaf")
+        directory.append(leaf)
+        assert leaf.path == ["d"] * 3001 + ["leaf"]
+        root.name = "top"
+        assert leaf.path == ["top"] + ["d"] * 3000 + ["leaf"]
+        files = ArchiveDirectory("files", [ArchiveFile(f"f{i}") for i in range(3)])
+        with self.assertRaises(ValueError):
+            files[0].name = "f1"
+        files[0].name = "renamed"
+        assert files.keys() == ["renamed", "f1", "f2"]
+        assert files["renamed"] is files[0] and "f0" not in files
+        # a record in two directories is found by its new name in both
+        other = ArchiveDirectory("other")
+        other.append(files[1])
+        files[1].name = "moved"
+        assert files["moved"] is other["moved"] and "f1" not in files
+        assert files[1].path == ["other", "moved"]
+
+    def test_header_cache(self):
+        root = ArchiveDirectory(name="root")
+        f = ArchiveFile(name="foo.t")
+        root.append(f)
+        assert root.header is root.header
+        assert f.header is f.header
+        assert f.header.size == 0
+        f.write(b"foo")
+        assert f.header.size == 3
+        f.name = "bar.t"
+        assert f.header.name == "bar.t"
+        f.file_type = CarRecordType.PRGFILE
+        assert f.header.record_type == CarRecordType.PRGFILE
+        assert root.header.size == 1
+        dup = pickle.loads(pickle.dumps(root))
+        assert dup["bar.t"].getvalue() == b"foo"
+        assert dup["bar.t"].parent is dup
+
+    def test_pickle_files(self):
+        budget = MemoryBudget(8)
+        root = ArchiveDirectory(
+            "root",
+            [
+                SpooledArchiveFile("a.t", memory_budget=budget),
+                SpooledArchiveFile("b.t", memory_budget=budget),
+            ],
+        )
+        root["a.t"].write(b"aaaa")
+        root["b.t"].write(16 * b"b")
+        root["b.t"].seek(2)
+        dup = pickle.loads(pickle.dumps(root))
+        a, b = dup["a.t"], dup["b.t"]
+        assert isinstance(a, SpooledArchiveFile) and not a.spilled
+        assert isinstance(b, SpooledArchiveFile) and b.spilled
+        assert a.memory_budget is b.memory_budget is not budget
+        assert a.memory_budget.limit == 8 and a.memory_budget.used == 4
+        assert b.getvalue() == 16 * b"b" and b.tell() == 2
+        for fn in (copy.copy, copy.deepcopy):
+            dup = fn(root["a.t"])
+            assert isinstance(dup, SpooledArchiveFile) and dup.getvalue() == b"aaaa"
+            assert dup.memory_budget is budget
+            dup = fn(root)
+            assert dup.keys() == ["a.t", "b.t"] and dup["a.t"] is not root["a.t"]
+            assert dup["a.t"].parent is dup and root["a.t"].parent is root
+            assert dup["b.t"].getvalue() == 16 * b"b"
+        path = os.path.join("tests", "data", "test.car")
+        archive = C64Archive.open(path, mmap=True)
+        record = archive.root["untitled.t"]
+        assert isinstance(copy.copy(record), MappedArchiveFile)
+        dup = pickle.loads(pickle.dumps(record))
+        assert type(dup) is ArchiveFile and dup.getvalue() == b"  "
+
+    def test_traverse(self):
+        root = ArchiveDirectory(
+            "r",
+            [
+                ArchiveDirectory("a", [ArchiveFile("x")]),
+                ArchiveDirectory("b", [ArchiveFile("y")]),
+            ],
+        )
+        events = [
+            (depth, record.name, order.name)
+            for depth, record, order in root.traverse(TraversalOrder.BOTH)
+        ]
+        assert events == [
+            (0, "r", "PRE"),
+            (1, "a", "PRE"),
+            (2, "x", "PRE"),
+            (2, "x", "POST"),
+            (1, "a", "POST"),
+            (1, "b", "PRE"),
+            (2, "y", "PRE"),
+            (2, "y", "POST"),
+            (1, "b", "POST"),
+            (0, "r", "POST"),
+        ]
+        archive = C64Archive()
+        archive.root = root
+        assert [path for path, _ in archive.walk()] == [["r"], ["r", "a"], ["r", "b"]]
+        assert [path for path, _ in archive] == [["r", "a", "x"], ["r", "b", "y"]]
+
+    def test_deep(self):
+        depth = 2000
+        root = directory = ArchiveDirectory("d")
+        for _ in range(depth):
+            child = ArchiveDirectory("d")
+            directory.append(child)
+            directory = child
+        directory.append(ArchiveFile("leaf"))
+        archive = C64Archive()
+        archive.root = root
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+        path = "/".join(["d"] * (depth + 1) + ["leaf"])
+        assert isinstance(archive.ls(path, sep="/"), ArchiveFile)
+        assert len(list(archive.walk())) == depth + 1
+        copy = archive.root.copy()
+        other = archive.root.copy()
+        _, leaf, _ = list(other.traverse())[-1]
+        leaf.name = "other"
+        copy.merge(other)
+        assert len(list(copy.traverse())) == depth + 3
+
+    def test_serialized_size(self):
+        archive = self._create_archive()
+
+        def check():
+            with io.BytesIO() as f:
+                archive.serialize(f)
+                assert archive.serialized_size() == len(f.getvalue())
+
+        check()
+        archive.root = ArchiveDirectory(name="root")
+        check()
+        record = archive.touch("root/a/b/foo.t", sep="/", create_directories=True)
+        check()
+        record.write(100 * b"x")
+        check()
+        record.truncate(10)
+        check()
+        spooled = SpooledArchiveFile(name="big.t", memory_budget=4)
+        archive.root["a"].append(spooled)
+        spooled.write(b"spooled")
+        check()
+        archive.root["a"][0] = ArchiveFile(name="b")
+        check()
+        archive.root["a"].pop()
+        check()
+        del archive.root[0]
+        check()
+        archive.root.append(ArchiveDirectory(name="d", iterable=[ArchiveFile("e")]))
+        archive.root[0].append(ArchiveFile("f"))
+        check()
+        archive.root[0][0].writelines([b"line\n"] * 3)
+        check()
+        record = ArchiveFile(name="huge")
+        record.write(bytes(0x1000000))
+        archive.root.append(record)
+        with self.assertRaises(ValueError):
+            archive.serialized_size()
+        record.truncate(0)
+        check()
+
+    def test_save(self):
+        archive = self._create_archive()
+        archive.root = ArchiveDirectory(name="root")
+        archive.touch("root/foo.t", sep="/", buffer=io.BytesIO(b"foo"))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.car")
+            archive.save(path)
+            assert os.path.getsize(path) == archive.serialized_size()
+            archive = C64Archive.open(path, mmap=True)
+            archive.root["foo.t"].write(b"bar")
+            archive.save(path)
+            assert C64Archive.open(path).root["foo.t"].getvalue() == b"bar"
+            assert os.listdir(tmpdir) == ["test.car"]
+
     def test_merge(self):
         a = ArchiveDirectory(name="root")
         b = ArchiveDirectory(name="root")
@@ -62,6 +332,44 @@ class TestArchive(unittest.TestCase):
         with self.assertRaises(ValueError):
             a + b
 
+    def test_copy(self):
+        a = ArchiveDirectory(name="root")
+        a.append(ArchiveDirectory(name="inner"))
+        a["inner"].append(ArchiveFile(name="foo.t"))
+        a["inner"]["foo.t"].write(b"foo")
+        b = ArchiveDirectory(name="root")
+        b.append(ArchiveFile(name="bar.t"))
+        b.append(ArchiveDirectory(name="inner", iterable=[ArchiveFile(name="baz.t")]))
+        a.append(ArchiveDirectory(name="sub"))
+        merged = a + b
+        assert merged.keys() == ["inner", "sub", "bar.t"]
+        assert merged["inner"].keys() == ["foo.t", "baz.t"]
+        assert merged["inner"]["foo.t"].path == ["root", "inner", "foo.t"]
+        # every record in the result is new
+        for _, record, _ in merged.traverse():
+            for _, original, _ in itertools.chain(a.traverse(), b.traverse()):
+                assert record is not original
+        size = merged.serialized_size()
+        # changing the result does not change either operand
+        merged["inner"]["foo.t"].write(b"ZZZ")
+        merged["sub"].append(ArchiveFile(name="new.t"))
+        merged["bar.t"].name = "renamed.t"
+        assert merged.serialized_size() == size + 3 + 22
+        assert a["inner"]["foo.t"].getvalue() == b"foo"
+        assert a["inner"]["foo.t"].parent is a["inner"]
+        assert not len(a["sub"])
+        assert b.keys() == ["bar.t", "inner"]
+        assert b["bar.t"].parent is b
+        # and changing an operand does not change the result
+        a["inner"]["foo.t"].name = "renamed.t"
+        a["inner"]["renamed.t"].write(b"!")
+        assert merged["inner"].keys() == ["foo.t", "baz.t"]
+        assert merged["inner"]["foo.t"].getvalue() == b"fooZZZ"
+        with self.assertRaises(ValueError):
+            a + ArchiveDirectory(name="root", iterable=[ArchiveFile(name="inner")])
+        with self.assertRaises(ValueError):
+            a + ArchiveDirectory(name="other")
+
     def test_ls(self):
         archive = self._create_archive()
         archive.root = ArchiveDirectory(name="root")
@@ -138,6 +446,94 @@ class TestArchive(unittest.TestCase):
         assert isinstance(archive["root"]["test.o"], ArchiveFile)
         assert archive["root"]["test.o"].size == 5
 
+    def test_memory_budget(self):
+        archive = self._create_archive()
+        archive.memory_budget = 16
+        record = archive.touch("root/big.t", sep="/", create_directories=True)
+        assert isinstance(record, SpooledArchiveFile) and not record.spilled
+        record.write(32 * b"x")
+        assert record.spilled
+        record = archive.touch("root/small.t", sep="/", buffer=io.BytesIO(b"abc"))
+        assert not record.spilled and record.read() == b"abc"
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+        assert archive.memory_budget is None
+        assert archive.root["big.t"].getvalue() == 32 * b"x"
+        assert get_memory_budget() is None
+        set_memory_budget(8)
+        try:
+            record = archive.touch("root/new.t", sep="/")
+            assert isinstance(record, SpooledArchiveFile)
+            with io.BytesIO() as f:
+                archive.serialize(f)
+                f.seek(0)
+                archive = C64Archive.deserialize(f)
+            assert archive.root["big.t"].spilled
+            assert not archive.root["small.t"].spilled
+            assert get_memory_budget().used == 3
+        finally:
+            set_memory_budget(None)
+        with self.assertRaises(ValueError):
+            archive.memory_budget = -1
+
+    def test_shared_memory_budget(self):
+        budget = MemoryBudget(8)
+        first = SpooledArchiveFile(name="a.t", memory_budget=budget)
+        second = SpooledArchiveFile(name="b.t", memory_budget=budget)
+        first.write(6 * b"a")
+        assert not first.spilled and budget.used == 6
+        second.write(6 * b"b")
+        assert second.spilled and budget.used == 6
+        first.truncate(2)
+        assert budget.used == 2
+        third = first.copy()
+        assert not third.spilled and budget.used == 4
+        third.close()
+        first.close()
+        assert budget.used == 0
+        assert second.getvalue() == 6 * b"b"
+        second.seek(0)
+        assert second.read(2) == b"bb"
+        with self.assertRaises(ValueError):
+            MemoryBudget(-1)
+
+    def test_spooled_getbuffer(self):
+        record = SpooledArchiveFile(name="a.t", memory_budget=8)
+        record.write(b"abc")
+        with record.getbuffer() as view:
+            assert bytes(view) == b"abc"
+            view[0] = ord("x")
+        assert record.getvalue() == b"xbc"
+        record.rollover()
+        assert record.spilled and record.memory_budget.used == 0
+        with record.getbuffer() as view:
+            assert bytes(view) == b"xbc"
+        empty = SpooledArchiveFile(name="b.t")
+        empty.rollover()
+        with empty.getbuffer() as view:
+            assert view.nbytes == 0
+
+    def test_spooled_copy(self):
+        root = ArchiveDirectory(name="root")
+        for name in ("a.t", "b.t"):
+            record = SpooledArchiveFile(name=name, memory_budget=8)
+            record.write(6 * b"x")
+            root.append(record)
+        root["b.t"].rollover()
+        size = root.serialized_size()
+        # copying the contents does not hand out views of them (which would mark
+        # the files as exported)
+        with mock.patch.object(
+            SpooledArchiveFile, "getbuffer", side_effect=AssertionError
+        ):
+            with io.BytesIO() as f:
+                root.serialize(f)
+                assert len(f.getvalue()) == size
+            dup = root.copy()
+        assert dup["a.t"].getvalue() == dup["b.t"].getvalue() == 6 * b"x"
+
     def test_rm(self):
         archive = self._create_archive()
         with self.assertRaises(ValueError):
@@ -165,6 +561,59 @@ class TestArchive(unittest.TestCase):
             archive = C64Archive.deserialize(f)
         self._assert_archive(archive)
 
+    def test_deserialize_pipe(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            data = f.read()
+        with io.BufferedReader(Pipe(data)) as f:
+            assert not f.seekable()
+            archive = C64Archive.deserialize(f, memory_budget=1)
+        self._assert_archive(archive)
+        record = archive.root["untitled.t"]
+        assert isinstance(record, SpooledArchiveFile)
+        assert record.spilled
+        assert record.size == 2
+        assert record.read() == b"  "
+        dup = record.copy()
+        record.write(b"!")
+        assert record.getvalue() == b"  !"
+        assert isinstance(dup, SpooledArchiveFile) and dup.spilled
+        assert dup.getvalue() == b"  "
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            archive = C64Archive.deserialize(f, memory_budget=16)
+        assert not archive.root["untitled.t"].spilled
+        assert archive.root["untitled.t"].getvalue() == b"  !"
+
+    def test_open(self):
+        path = os.path.join("tests", "data", "test.car")
+        archive = C64Archive.open(path)
+        self._assert_archive(archive)
+        assert not isinstance(archive.root["untitled.t"], MappedArchiveFile)
+        archive = C64Archive.open(path, mmap=True)
+        self._assert_archive(archive)
+        record = archive.root["untitled.t"]
+        assert isinstance(record, MappedArchiveFile)
+        assert record.mapped
+        assert record.size == 2
+        assert record.read(1) == b" "
+        with record.getbuffer() as view:
+            assert view.readonly
+        for _ in range(2):
+            # copying releases only its own views, so the file stays readable
+            record.seek(0)
+            with io.BytesIO() as f:
+                assert copy_buffer(record, f) == 2
+                assert f.getvalue() == b"  "
+        dup = archive.root.copy()["untitled.t"]
+        assert isinstance(dup, MappedArchiveFile) and dup.mapped
+        record.seek(0, os.SEEK_END)
+        record.write(b"!")
+        assert not record.mapped
+        assert record.getvalue() == b"  !"
+        assert dup.getvalue() == b"  "
+
     def test_serialize(self):
         archive = self._create_archive()
         archive.root = ArchiveDirectory(name="test")
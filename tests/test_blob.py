@@ -0,0 +1,84 @@
+import gc
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from c64os_util.car import ArchiveBlobStore, ArchiveDirectory, ArchiveFile, C64Archive
+
+
+def _file(name, data):
+    record = ArchiveFile(name=name)
+    record.write(data)
+    record.seek(0)
+    return record
+
+
+class TestBlobStore(unittest.TestCase):
+    def test_intern(self):
+        store = ArchiveBlobStore()
+        data = os.urandom(1000)
+        blob = store.intern(bytearray(data))
+        assert blob == data
+        assert store.intern(data) is blob
+        assert store.intern(blob) is blob
+        assert len(store) == 1
+        assert store.nbytes == 1000
+        store.intern(b"other")
+        assert len(store) == 2
+
+    def test_touch(self):
+        store = ArchiveBlobStore()
+        data = os.urandom(5000)
+        archives = []
+        for _ in range(3):
+            archive = C64Archive(blob_store=store)
+            archive.touch("app/icon", create_directories=True, buffer=io.BytesIO(data))
+            archives.append(archive)
+        values = [archive.ls("app/icon").getvalue() for archive in archives]
+        assert all(value is values[0] for value in values)
+        assert len(store) == 1
+        # modifying one copy does not affect the others
+        record = archives[0].ls("app/icon")
+        record.write(b"xx")
+        assert record.getvalue()[:2] == b"xx"
+        assert archives[1].ls("app/icon").getvalue() == data
+        assert store.prune() == 0
+        del record, archive
+        archives.clear()
+        # records and their parent directories refer to each other
+        gc.collect()
+        assert store.prune() == 1 and len(store) == 0
+
+    def test_read(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "asset")
+            with open(path, "wb") as f:
+                f.write(b"asset data")
+            store = ArchiveBlobStore()
+            assert store.read(path) is store.read(path)
+            buffer = store.open(path)
+            assert buffer.read() == b"asset data"
+            assert store.prune() == 0
+            del buffer
+            assert store.prune() == 1
+            assert store.open(path).read() == b"asset data"
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_dedup(self):
+        data = os.urandom(2000)
+        root = ArchiveDirectory(name="root")
+        root.extend([_file("a", data), _file("b", data), _file("c", os.urandom(10))])
+        store = ArchiveBlobStore()
+        assert store.dedup(root) == len(data)
+        assert root.get_child("a").getvalue() is root.get_child("b").getvalue()
+        assert root.get_child("b").read() == data
+        assert len(store) == 2
+        assert store.prune() == 0
+        del data
+        root.clear()
+        assert store.prune() == 2
+        assert len(store) == 0
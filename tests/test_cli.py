@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from c64os_util.car import C64Archive, CarRecordType, get_memory_budget
+from c64os_util.cli import car_parser
+from scripts.car import (
+    _extract_archive,
+    _list_archive,
+    _run_jobs,
+    do_append,
+    do_cat,
+    do_create,
+    do_extract,
+    do_list,
+)
+
+ARCHIVE = os.path.join("tests", "data", "test.car")
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.parser = car_parser()
+        os.makedirs(os.path.join(self.tmpdir, "app", "sub"))
+        with open(os.path.join(self.tmpdir, "app", "foo.t"), "wb") as f:
+            f.write(b"foo")
+        with open(os.path.join(self.tmpdir, "app", "sub", "bar.o"), "wb") as f:
+            f.write(b"barbar")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _path(self, *parts):
+        return os.path.join(self.tmpdir, *parts)
+
+    def test_extract_archive(self):
+        output = self._path("out")
+        _extract_archive(ARCHIVE, output, set(), False, False, False)
+        with open(os.path.join(output, "test", "untitled.t"), "rb") as f:
+            assert f.read() == b"  "
+        with self.assertRaises(FileExistsError):
+            _extract_archive(ARCHIVE, output, set(), False, False, False)
+        _extract_archive(ARCHIVE, output, set(), False, False, True)
+        _extract_archive(ARCHIVE, output, set(), False, True, False)
+        output = self._path("skipped")
+        _extract_archive(ARCHIVE, output, {CarRecordType.SEQFILE}, True, False, False)
+        assert not os.path.exists(output)
+
+    def test_extract_parallel(self):
+        other = self._path("other.car")
+        shutil.copy(ARCHIVE, other)
+        output = self._path("out")
+        archives = [ARCHIVE, other]
+        results = list(
+            _run_jobs(_extract_archive, archives, 2, output, set(), False, False, False)
+        )
+        errors = [err for _, _, err in results if err is not None]
+        assert len(errors) == 1 and isinstance(errors[0], FileExistsError)
+
+    def test_list_archive(self):
+        assert _list_archive(ARCHIVE, "", -1) == ["test/", "test/untitled.t"]
+        assert _list_archive(ARCHIVE, "", 1) == ["test/"]
+        assert _list_archive(ARCHIVE, "test", 0) == ["test/"]
+        with self.assertRaises(KeyError):
+            _list_archive(ARCHIVE, "missing", -1)
+
+    def test_run_jobs(self):
+        missing = self._path("missing.car")
+        for jobs in (1, 2):
+            results = list(_run_jobs(_list_archive, [ARCHIVE, missing], jobs, "", 1))
+            assert [archive for archive, _, _ in results] == [ARCHIVE, missing]
+            assert results[0][1:] == (["test/"], None)
+            assert results[1][1] is None
+            assert isinstance(results[1][2], FileNotFoundError)
+
+    def test_create(self):
+        output = self._path("app.car")
+        args = self.parser.parse_args(
+            ["create", self._path("app"), "-o", output, "--sort", "-p", "-j", "1"]
+        )
+        do_create(args)
+        archive = C64Archive.open(output)
+        assert archive.root.keys() == ["foo.t", "sub"]
+        assert archive.root["foo.t"].file_type == CarRecordType.PRGFILE
+        assert archive.root["sub"]["bar.o"].getvalue() == b"barbar"
+        args = self.parser.parse_args(
+            ["create", self._path("app"), self._path("app"), "-o", output]
+        )
+        with self.assertRaises(SystemExit):
+            do_create(args)
+
+    def test_create_compressed(self):
+        output = self._path("app.car")
+        args = self.parser.parse_args(
+            ["create", self._path("app"), "-o", output, "-z", "rle", "-j", "1"]
+        )
+        do_create(args)
+        extracted = self._path("out")
+        _extract_archive(output, extracted, set(), False, False, False)
+        with open(os.path.join(extracted, "app", "sub", "bar.o"), "rb") as f:
+            assert f.read() == b"barbar"
+
+    def test_append(self):
+        output = self._path("appended.car")
+        args = self.parser.parse_args(
+            ["append", ARCHIVE, self._path("app"), "-o", output, "--note", "hi"]
+        )
+        do_append(args)
+        archive = C64Archive.open(output)
+        assert archive.header.note == "hi"
+        assert archive.root.keys() == ["untitled.t", "app"]
+        assert archive.root["app"]["foo.t"].getvalue() == b"foo"
+        args = self.parser.parse_args(
+            ["append", self._path("missing.car"), self._path("app"), "-o", output]
+        )
+        with self.assertRaises(SystemExit):
+            do_append(args)
+
+    def test_append_sort(self):
+        output = self._path("appended.car")
+        args = self.parser.parse_args(
+            ["append", ARCHIVE, self._path("app"), "-o", output, "--sort"]
+        )
+        do_append(args)
+        archive = C64Archive.open(output)
+        assert archive.root.keys() == ["app", "untitled.t"]
+        assert archive.root["app"].keys() == ["foo.t", "sub"]
+        shutil.copy(ARCHIVE, output)
+        args = self.parser.parse_args(
+            ["append", output, self._path("app"), "--in-place", "--sort"]
+        )
+        with self.assertRaises(SystemExit):
+            do_append(args)
+
+    def test_append_memory_budget(self):
+        output = self._path("appended.car")
+        args = self.parser.parse_args(
+            ["append", ARCHIVE, self._path("app"), "-o", output, "--memory-budget", "4"]
+        )
+        do_append(args)
+        assert get_memory_budget() is None
+        archive = C64Archive.open(output)
+        assert archive.root["app"]["sub"]["bar.o"].getvalue() == b"barbar"
+        args.memory_budget = -1
+        with self.assertRaises(SystemExit):
+            do_append(args)
+
+    def test_cat(self):
+        output = self._path("untitled.t")
+        args = self.parser.parse_args(["cat", ARCHIVE, "test/untitled.t", "-o", output])
+        do_cat(args)
+        with open(output, "rb") as f:
+            assert f.read() == b"  "
+        for path in ("test/missing.t", "test"):
+            args = self.parser.parse_args(["cat", ARCHIVE, path, "-o", output])
+            with self.assertRaises(SystemExit):
+                do_cat(args)
+
+    def test_extract(self):
+        output = self._path("out")
+        args = self.parser.parse_args(["extract", ARCHIVE, "-o", output, "-j", "1"])
+        with self.assertRaises(SystemExit) as cm:
+            do_extract(args)
+        assert cm.exception.code == 0
+        assert os.path.isfile(os.path.join(output, "test", "untitled.t"))
+        with self.assertRaises(SystemExit) as cm:
+            do_extract(args)
+        assert cm.exception.code == 1
+
+    def test_list(self):
+        args = self.parser.parse_args(["list", ARCHIVE, "-n", "1"])
+        with self.assertRaises(SystemExit) as cm:
+            do_list(args)
+        assert cm.exception.code == 0
@@ -0,0 +1,97 @@
+import importlib.util
+import io
+import os
+import unittest
+
+from c64os_util.car import (
+    ArchiveColumns,
+    ArchiveDirectory,
+    ArchiveFile,
+    ArchiveIndex,
+    C64Archive,
+    CarRecordType,
+)
+from c64os_util.util import LC_CODEC
+
+
+def _file(name, size, file_type=CarRecordType.SEQFILE):
+    record = ArchiveFile(name=name, file_type=file_type)
+    record.write(size * b"x")
+    return record
+
+
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        archive = C64Archive()
+        archive.root = ArchiveDirectory(name="root")
+        apps = ArchiveDirectory(name="apps")
+        apps.append(_file("a.o", 100, CarRecordType.PRGFILE))
+        apps.append(_file("readme.t", 40))
+        apps.append(ArchiveDirectory(name="empty"))
+        apps.append(ArchiveDirectory("sub", [_file("b.o", 7, CarRecordType.PRGFILE)]))
+        archive.root.append(apps)
+        archive.root.append(_file("c.o", 1000, CarRecordType.PRGFILE))
+        archive.root.append(ArchiveDirectory(name="none"))
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            self.data = f.getvalue()
+
+    def test_deserialize(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            columns = ArchiveColumns.deserialize(f)
+        assert len(columns) == 2
+        assert list(columns.body_offsets) == [70, 92]
+        assert columns.path(1) == ["test", "untitled.t"]
+        assert columns.find("test/untitled.t", sep="/") == 1
+        with self.assertRaises(KeyError):
+            columns.find("test/missing.t", sep="/")
+
+    def test_columns(self):
+        columns = ArchiveColumns.deserialize(io.BytesIO(self.data))
+        index = ArchiveIndex.deserialize(io.BytesIO(self.data))
+        assert len(columns) == len(index)
+        for i, entry in enumerate(index):
+            assert columns.path(i) == entry.path
+            assert columns.record_type(i) == entry.record_type
+            assert columns.sizes[i] == entry.size
+            assert columns.body_offsets[i] == entry.body_offset
+            assert columns.depths[i] == len(entry.path) - 1
+        assert list(columns.parents) == [-1, 0, 1, 1, 1, 1, 5, 0, 0]
+        assert list(columns.ends) == [9, 7, 3, 4, 5, 7, 7, 8, 9]
+        assert list(columns.children(1)) == [2, 3, 4, 5]
+        other = ArchiveColumns.from_index(index)
+        assert other.names == columns.names
+        assert list(other.ends) == list(columns.ends)
+        assert list(other.body_offsets) == list(columns.body_offsets)
+
+    def test_queries(self):
+        columns = ArchiveColumns.deserialize(io.BytesIO(self.data))
+        apps = columns.find("root/apps", sep="/")
+        assert columns.total_size() == 1147
+        assert columns.total_size(apps) == 147
+        assert columns.total_size(apps, record_type=CarRecordType.PRGFILE) == 107
+        assert columns.count(apps) == 3
+        assert columns.count(record_type=CarRecordType.DIRECTORY) == 5
+        assert [columns.name(i) for i in columns.largest(2)] == ["c.o", "a.o"]
+        assert [columns.name(i) for i in columns.largest(5, apps)] == [
+            "a.o",
+            "readme.t",
+            "b.o",
+        ]
+        assert [columns.name(i) for i in columns.empty_directories()] == [
+            "empty",
+            "none",
+        ]
+        assert columns.empty_directories(apps) == [4]
+        with self.assertRaises(ValueError):
+            columns.total_size(record_type=CarRecordType.DIRECTORY)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_to_numpy(self):
+        columns = ArchiveColumns.deserialize(io.BytesIO(self.data))
+        arrays = columns.to_numpy()
+        assert arrays["sizes"].tolist() == list(columns.sizes)
+        assert arrays["parents"].tolist() == list(columns.parents)
+        assert len(arrays["names"]) == len(columns)
+        assert arrays["names"][0].rstrip(b"\xa0") == "root".encode(LC_CODEC)
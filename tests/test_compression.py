@@ -0,0 +1,155 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    C64Archive,
+    C64ArchiveReader,
+    C64ArchiveWriter,
+    CarCompressionType,
+    deserialize_async,
+    extract_record,
+    get_codec,
+    register_codec,
+)
+from c64os_util.car.compression import RLE
+
+
+class TestCompression(unittest.TestCase):
+    def test_rle(self):
+        codec = get_codec(RLE)
+        samples = [
+            b"",
+            b"a",
+            b"ab",
+            b"aaa",
+            300 * b"\0",
+            b"abc" + 129 * b"x" + b"yz" + os.urandom(500),
+            os.urandom(200000),
+            bytes(range(256)) * 1000 + 70000 * b"\xff",
+        ]
+        for data in samples:
+            encoded = codec.compress_bytes(data)
+            assert codec.decompress_bytes(encoded) == data
+        assert len(codec.compress_bytes(300 * b"\0")) == 6
+        with self.assertRaises(ValueError):
+            codec.decompress_bytes(b"\x05abc")
+
+    def test_archive(self):
+        archive = C64Archive()
+        archive.root = ArchiveDirectory(name="root")
+        data = 1000 * b"\x20" + b"hello"
+        record = archive.touch(
+            "root/text.t",
+            sep="/",
+            compression_type=RLE,
+            buffer=io.BytesIO(data),
+        )
+        assert record.size == len(data)
+        assert record.stored_size < 30
+        assert record.header.size == record.stored_size
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            assert archive.serialized_size() == len(f.getvalue())
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+            f.seek(0)
+            assert extract_record(f, "root/text.t", sep="/").read() == data
+            f.seek(0)
+            for _, header, body in C64ArchiveReader(f):
+                if body is not None:
+                    assert header.size == record.stored_size
+                    assert body.size == len(data)
+                    assert body.read() == data
+        record = archive.root["text.t"]
+        assert record.compression_type == RLE
+        assert record.read() == data
+        record.write(b"!")
+        copy = archive.root.copy()
+        assert copy["text.t"].getvalue() == data + b"!"
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            archive = C64Archive.deserialize(f, memory_budget=16)
+        assert archive.root["text.t"].getvalue() == data + b"!"
+
+    def test_writer(self):
+        data = 500 * b"ab" + 500 * b"c"
+        with tempfile.TemporaryFile() as out:
+            writer = C64ArchiveWriter(out)
+            writer.write_directory("root", 1)
+            writer.write_file(
+                "f",
+                io.BytesIO(data),
+                len(data),
+                compression_type=RLE,
+            )
+            writer.close()
+            assert out.tell() < 48 + 22 + len(data)
+            out.seek(0)
+            archive = C64Archive.deserialize(out)
+            assert archive.root["f"].getvalue() == data
+            out.seek(0)
+            body = out.read()
+
+        async def run():
+            stream = asyncio.StreamReader()
+            stream.feed_data(body)
+            stream.feed_eof()
+            return await deserialize_async(stream)
+
+        assert asyncio.run(run()).root["f"].getvalue() == data
+
+    def test_register(self):
+        codec = get_codec(RLE)
+        calls = []
+
+        def compress(src, dest):
+            calls.append("compress")
+            return codec.compress(src, dest)
+
+        try:
+            register_codec(RLE, compress, codec.decompress)
+            record = ArchiveFile(name="f", compression_type=RLE)
+            record.write(b"xxxx")
+            with io.BytesIO() as f:
+                record.serialize(f)
+                f.seek(0)
+                assert ArchiveFile.deserialize(f).getvalue() == b"xxxx"
+            assert calls == ["compress"]
+        finally:
+            register_codec(RLE, codec.compress, codec.decompress)
+
+    def test_compression_type(self):
+        assert list(CarCompressionType) == [CarCompressionType.NONE]
+        assert CarCompressionType(0xFF) is RLE
+        assert CarCompressionType(7) is CarCompressionType(7)
+        assert CarCompressionType(7).name == "TYPE_7"
+        with self.assertRaises(ValueError):
+            CarCompressionType(256)
+        with self.assertRaises(ValueError):
+            get_codec(CarCompressionType(7))
+
+    def test_cached_encoding(self):
+        directory = ArchiveDirectory(name="root")
+        record = ArchiveFile(name="f")
+        record.write(300 * b"\0")
+        directory.append(record)
+        assert directory.serialized_size() == 2 * 22 + 300
+        record.compression_type = RLE
+        assert directory.serialized_size() == 2 * 22 + 6
+        view = record.getbuffer()
+        assert directory.serialized_size() == 2 * 22 + 6
+        view[100:200] = os.urandom(100)
+        stored = record.stored_size
+        assert stored > 100
+        assert directory.serialized_size() == 2 * 22 + stored
+        with io.BytesIO() as f:
+            record.serialize(f)
+            f.seek(0)
+            assert ArchiveFile.deserialize(f).getvalue() == bytes(view)
+        view.release()
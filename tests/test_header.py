@@ -0,0 +1,38 @@
+import unittest
+
+from c64os_util.car import CarCompressionType, CarRecordType
+from c64os_util.car.record.header import ArchiveRecordHeader
+
+
+class TestHeader(unittest.TestCase):
+    def test_pack(self):
+        header = ArchiveRecordHeader(
+            name="foo.t", size=0x123456, record_type=CarRecordType.PRGFILE
+        )
+        data = header.pack()
+        assert len(data) == ArchiveRecordHeader.SIZE == 22
+        assert data[:5] == b"\x50\x00\x56\x34\x12"
+        parsed = ArchiveRecordHeader.unpack(data)
+        assert parsed.name_bytes == b"FOO.T"
+        assert parsed.name == "foo.t"
+        assert parsed.size == 0x123456
+        assert parsed.record_type == CarRecordType.PRGFILE
+        assert parsed.compression_type == CarCompressionType.NONE
+        with self.assertRaises(ValueError):
+            ArchiveRecordHeader(name="foo.t", size=0x1000000).pack()
+        with self.assertRaises(ValueError):
+            ArchiveRecordHeader(name=16 * "a").pack()
+
+    def test_unpack_many(self):
+        names = [f"file{i}.t" for i in range(10)]
+        data = b"".join(
+            ArchiveRecordHeader(name=name, size=i).pack()
+            for i, name in enumerate(names)
+        )
+        headers = ArchiveRecordHeader.unpack_many(b"\0\0" + data, offset=2)
+        assert [header.name for header in headers] == names
+        assert [header.size for header in headers] == list(range(10))
+        headers = ArchiveRecordHeader.unpack_many(data, count=3)
+        assert len(headers) == 3
+        with self.assertRaises(ValueError):
+            ArchiveRecordHeader.unpack_many(data[:-1], count=10)
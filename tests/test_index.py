@@ -0,0 +1,65 @@
+import datetime
+import io
+import os
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    ArchiveIndex,
+    C64Archive,
+    CarArchiveType,
+    CarRecordType,
+)
+
+from .pipe import Pipe
+
+
+class TestIndex(unittest.TestCase):
+    def test_deserialize(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            index = ArchiveIndex.deserialize(f)
+        assert index.header.archive_type == CarArchiveType.GENERAL
+        assert len(index) == 2
+        assert index[0].path == ["test"]
+        assert index[0].record_type == CarRecordType.DIRECTORY
+        assert index[0].header_offset == 48
+        assert index[0].body_offset == 70
+        entry = index.ls("test/untitled.t", sep="/")
+        assert entry == index[1]
+        assert entry.record_type == CarRecordType.SEQFILE
+        assert entry.header_offset == 70
+        assert entry.body_offset == 92
+        with self.assertRaises(KeyError):
+            index.ls("test/missing.t", sep="/")
+
+    def test_deserialize_pipe(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            data = f.read()
+        with io.BufferedReader(Pipe(data)) as f:
+            index = ArchiveIndex.deserialize(f)
+        assert [entry.body_offset for entry in index] == [70, 92]
+
+    def test_offsets(self):
+        archive = C64Archive(timestamp=datetime.datetime(2022, 5, 13, 3, 27))
+        archive.root = ArchiveDirectory(name="root")
+        archive.root.append(ArchiveDirectory(name="inner"))
+        archive.root["inner"].append(ArchiveFile(name="foo.t"))
+        archive.root["inner"]["foo.t"].write(b"foo")
+        archive.root.append(ArchiveFile(name="bar.t"))
+        archive.root["bar.t"].write(b"barbar")
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            index = ArchiveIndex.deserialize(f)
+            paths = ["/".join(entry.path) for entry in index]
+            assert paths == ["root", "root/inner", "root/inner/foo.t", "root/bar.t"]
+            assert [entry.name for entry in index.directories()] == ["root", "inner"]
+            for entry in index.files():
+                f.seek(entry.body_offset)
+                assert (
+                    f.read(entry.size)
+                    == archive.ls("/".join(entry.path), "/").getvalue()
+                )
@@ -0,0 +1,97 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    C64Archive,
+    CarArchiveType,
+    append_in_place,
+    update_header,
+)
+from c64os_util.car.header import ArchiveHeader
+
+
+def _file(name, data):
+    record = ArchiveFile(name=name)
+    record.write(data)
+    record.seek(0)
+    return record
+
+
+class TestInPlace(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.car")
+        archive = C64Archive(timestamp=datetime.datetime(2022, 5, 13, 3, 27))
+        archive.root = ArchiveDirectory(name="root")
+        archive.root.append(ArchiveDirectory(name="first"))
+        archive.root["first"].append(_file("a.t", b"aaa"))
+        archive.root.append(ArchiveDirectory(name="last"))
+        archive.root["last"].append(_file("b.t", b"bbb"))
+        with open(self.path, "wb") as f:
+            archive.serialize(f)
+            f.write(b"junk")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            return C64Archive.deserialize(f)
+
+    def test_append_tail(self):
+        size = os.path.getsize(self.path)
+        assert append_in_place(self.path, [_file("c.t", b"ccc")], "root/last", sep="/")
+        assert os.path.getsize(self.path) == size - len(b"junk") + 22 + 3
+        assert append_in_place(self.path, [_file("d.t", b"ddd")])
+        archive = self._load()
+        assert archive.root.keys() == ["first", "last", "d.t"]
+        assert archive.root["last"].keys() == ["b.t", "c.t"]
+        assert archive.root["last"]["c.t"].getvalue() == b"ccc"
+        with self.assertRaises(ValueError):
+            append_in_place(self.path, [_file("d.t", b"ddd")])
+
+    def test_append_missing(self):
+        with self.assertRaises(KeyError):
+            append_in_place(self.path, [_file("e.t", b"e")], "root/new/x", sep="/")
+        assert append_in_place(
+            self.path, [_file("e.t", b"e")], "root/new/x", sep="/", create_missing=True
+        )
+        archive = self._load()
+        assert archive.ls("root/new/x/e.t", sep="/").getvalue() == b"e"
+
+    def test_append_rewrite(self):
+        assert not append_in_place(
+            self.path, [_file("c.t", b"ccc")], "root/first", sep="/"
+        )
+        archive = self._load()
+        assert archive.root["first"].keys() == ["a.t", "c.t"]
+        assert archive.root["last"]["b.t"].getvalue() == b"bbb"
+        assert os.listdir(self.tmpdir) == ["test.car"]
+
+    def test_update_header(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        header = update_header(
+            self.path,
+            archive_type=CarArchiveType.RESTORE,
+            timestamp=datetime.datetime(2023, 1, 2, 3, 4),
+            note="build 42",
+        )
+        assert header.note == "build 42"
+        with open(self.path, "rb") as f:
+            new_data = f.read()
+        assert new_data[ArchiveHeader.SIZE :] == data[ArchiveHeader.SIZE :]
+        archive = self._load()
+        assert archive.header.archive_type == CarArchiveType.RESTORE
+        assert archive.header.timestamp.to_datetime() == datetime.datetime(
+            2023, 1, 2, 3, 4
+        )
+        assert archive.header.note == "build 42"
+        with self.assertRaises(ValueError):
+            update_header(self.path, note=32 * "x")
+        assert self._load().header.note == "build 42"
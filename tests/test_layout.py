@@ -0,0 +1,45 @@
+import io
+import unittest
+
+from c64os_util.car import (
+    ArchiveLayout,
+    C64ArchiveWriter,
+    CarRecordType,
+    read_headers,
+    walk_layout,
+)
+from c64os_util.car.record.header import ArchiveRecordHeader
+
+
+class TestLayout(unittest.TestCase):
+    def test_walk_layout(self):
+        headers = [
+            ArchiveRecordHeader("root", 3, CarRecordType.DIRECTORY),
+            ArchiveRecordHeader("a", 0, CarRecordType.DIRECTORY),
+            ArchiveRecordHeader("b", 1, CarRecordType.DIRECTORY),
+            ArchiveRecordHeader("c", 5),
+            ArchiveRecordHeader("d", 2),
+            ArchiveRecordHeader("extra", 0),
+        ]
+        walked = [(depth, h.name) for depth, h in walk_layout(headers)]
+        assert walked == [(0, "root"), (1, "a"), (1, "b"), (2, "c"), (1, "d")]
+        with self.assertRaises(ValueError):
+            list(walk_layout(headers[:4]))
+        with io.BytesIO() as f:
+            for header in headers[:-1]:
+                header.serialize(f)
+            f.seek(0)
+            assert len(list(walk_layout(read_headers(f)))) == 5
+            assert f.read() == b""
+
+    def test_archive_layout(self):
+        layout = ArchiveLayout()
+        assert not layout.complete
+        data = layout.pack(ArchiveRecordHeader("root", 1, CarRecordType.DIRECTORY))
+        assert len(data) == ArchiveRecordHeader.SIZE
+        assert layout.begin() == 1
+        assert layout.complete
+        with self.assertRaises(ValueError):
+            layout.begin()
+        with self.assertRaises(ValueError):
+            C64ArchiveWriter(io.BytesIO()).write_directory("x" * 16, 0)
@@ -0,0 +1,97 @@
+import datetime
+import io
+import os
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    C64Archive,
+    C64ArchiveReader,
+    CarRecordType,
+    extract_record,
+    iter_records,
+)
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.count = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.count += len(data)
+        return data
+
+
+class TestStream(unittest.TestCase):
+    def test_reader(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            reader = C64ArchiveReader(f)
+            assert reader.header.timestamp.year == 2022
+            records = [(path, header, body) for path, header, body in reader]
+        assert [path for path, _, _ in records] == [["test"], ["test", "untitled.t"]]
+        assert records[0][1].record_type == CarRecordType.DIRECTORY
+        assert records[0][2] is None
+        assert records[1][1].record_type == CarRecordType.SEQFILE
+        assert records[1][2].closed
+
+    def test_iter_records(self):
+        archive = C64Archive(timestamp=datetime.datetime(2022, 5, 13, 3, 27))
+        archive.root = ArchiveDirectory(name="root")
+        archive.root.append(ArchiveDirectory(name="inner"))
+        archive.root["inner"].append(ArchiveFile(name="foo.t"))
+        archive.root["inner"]["foo.t"].write(b"foo")
+        archive.root.append(ArchiveFile(name="bar.t"))
+        archive.root["bar.t"].write(b"barbar")
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            f.seek(0)
+            contents = {}
+            for path, header, body in iter_records(f):
+                if body is None:
+                    continue
+                assert body.size == header.size
+                if header.name == "bar.t":
+                    contents["/".join(path)] = body.read(3)
+                    assert body.remaining == 3
+                else:
+                    contents["/".join(path)] = body.read()
+                    assert body.read() == b""
+        assert contents == {"root/inner/foo.t": b"foo", "root/bar.t": b"bar"}
+
+    def test_truncated(self):
+        path = os.path.join("tests", "data", "test.car")
+        with open(path, "rb") as f:
+            data = f.read()
+        with self.assertRaises(ValueError):
+            for _, _, body in iter_records(io.BytesIO(data[:93])):
+                if body is not None:
+                    body.read()
+
+    def test_extract_record(self):
+        archive = C64Archive(timestamp=datetime.datetime(2022, 5, 13, 3, 27))
+        archive.root = ArchiveDirectory(name="root")
+        archive.root.append(ArchiveDirectory(name="big"))
+        archive.root["big"].append(ArchiveFile(name="big.t"))
+        archive.root["big"]["big.t"].write(100000 * b"x")
+        archive.root.append(ArchiveDirectory(name="inner"))
+        archive.root["inner"].append(ArchiveFile(name="foo.t"))
+        archive.root["inner"]["foo.t"].write(b"foo")
+        with io.BytesIO() as f:
+            archive.serialize(f)
+            data = f.getvalue()
+        f = _CountingReader(data)
+        record = extract_record(f, "root/inner/foo.t", sep="/")
+        assert isinstance(record, ArchiveFile)
+        assert record.name == "foo.t"
+        assert record.read() == b"foo"
+        assert f.count < 1000
+        record = extract_record(io.BytesIO(data), "root/inner", sep="/")
+        assert isinstance(record, ArchiveDirectory)
+        assert record["foo.t"].getvalue() == b"foo"
+        for path in ["root/missing.t", "root/big/big.t/x", "other", "root/inner/bar.t"]:
+            with self.assertRaises(KeyError):
+                extract_record(io.BytesIO(data), path, sep="/")
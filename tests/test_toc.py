@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from c64os_util.car import ArchiveIndex, ArchiveTocCache, CarRecordType, load_index
+
+
+class TestToc(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "test.car")
+        shutil.copy(os.path.join("tests", "data", "test.car"), self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sidecar(self):
+        index = load_index(self.path)
+        assert os.path.exists(self.path + ".toc")
+        cached = load_index(self.path)
+        assert cached.header.note == index.header.note
+        assert [entry.path for entry in cached] == [entry.path for entry in index]
+        assert [e.body_offset for e in cached] == [e.body_offset for e in index]
+        assert (
+            cached.ls("test/untitled.t", sep="/").record_type == CarRecordType.SEQFILE
+        )
+        with mock.patch.object(ArchiveIndex, "deserialize") as deserialize:
+            load_index(self.path)
+        deserialize.assert_not_called()
+
+    def test_invalidate(self):
+        cache = ArchiveTocCache(cache_dir=os.path.join(self.tmpdir, "cache"))
+        cache.load(self.path)
+        toc_path = cache.toc_path(self.path)
+        assert os.path.dirname(toc_path) == cache.cache_dir
+        assert os.path.exists(toc_path)
+        with open(self.path, "ab") as f:
+            f.write(b"\0")
+        with open(toc_path, "rb") as f:
+            stale = f.read()
+        cache.load(self.path)
+        with open(toc_path, "rb") as f:
+            assert f.read() != stale
+        cache.invalidate(self.path)
+        assert not os.path.exists(toc_path)
+        with open(toc_path, "wb") as f:
+            f.write(b"garbage")
+        assert len(cache.load(self.path)) == 2
@@ -0,0 +1,55 @@
+import io
+import os
+import tempfile
+import unittest
+
+from c64os_util.util import copy_buffer, transfer_buffer
+
+
+class TestUtil(unittest.TestCase):
+    def test_transfer_files(self):
+        data = bytes(range(256)) * 1000
+        with tempfile.TemporaryFile() as src, tempfile.TemporaryFile() as dest:
+            src.write(data)
+            src.seek(10)
+            dest.write(b"head")
+            assert transfer_buffer(src, dest, 100000) == 100000
+            assert src.tell() == 100010
+            assert dest.tell() == 100004
+            dest.write(b"tail")
+            assert transfer_buffer(src, dest, len(data)) == len(data) - 100010
+            dest.seek(0)
+            assert dest.read() == b"head" + data[10:100010] + b"tail" + data[100010:]
+
+    def test_transfer_fallback(self):
+        data = os.urandom(5000)
+        with tempfile.TemporaryFile() as src:
+            src.write(data)
+            src.seek(0)
+            dest = io.BytesIO()
+            assert transfer_buffer(src, dest, 3000) == 3000
+            assert dest.getvalue() == data[:3000]
+        dest = io.BytesIO()
+        assert transfer_buffer(io.BytesIO(data), dest, 6000) == 5000
+        assert dest.getvalue() == data
+
+    def test_copy_buffer(self):
+        data = os.urandom(300000)
+        src = io.BytesIO(data)
+        src.seek(10)
+        dest = io.BytesIO()
+        assert copy_buffer(src, dest, max_size=1000) == 1000
+        assert src.tell() == 1010
+        assert copy_buffer(src, dest) == len(data) - 1010
+        assert dest.getvalue() == data[10:]
+        with tempfile.TemporaryFile() as src:
+            src.write(data)
+            src.seek(0)
+            dest = io.BytesIO()
+            assert copy_buffer(src, dest, max_size=200000) == 200000
+            assert copy_buffer(src, dest, chunk_size=7) == 100000
+            assert dest.getvalue() == data
+        reader = io.BufferedReader(io.BytesIO(data))
+        dest = io.BytesIO()
+        assert copy_buffer(reader, dest, max_size=len(data) + 1) == len(data)
+        assert dest.getvalue() == data
@@ -0,0 +1,161 @@
+import datetime
+import inspect
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from c64os_util.car import (
+    ArchiveDirectory,
+    ArchiveFile,
+    C64Archive,
+    C64ArchiveWriter,
+    CarCompressionType,
+    CarRecordType,
+)
+from c64os_util.car.compression import RLE, get_codec, register_codec
+
+
+def _reverse(src, dest):
+    return dest.write(src.read()[::-1])
+
+
+def _unreverse(src, dest, size):
+    return dest.write(src.read(size)[::-1])
+
+
+class TestWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, "app", "sub"))
+        os.makedirs(os.path.join(self.tmpdir, "app", "empty"))
+        with open(os.path.join(self.tmpdir, "app", "foo.t"), "wb") as f:
+            f.write(b"foo")
+        with open(os.path.join(self.tmpdir, "app", "sub", "bar.o"), "wb") as f:
+            f.write(b"barbar")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_path(self):
+        with io.BytesIO() as f:
+            writer = C64ArchiveWriter(f, note="hello world")
+            written = writer.write_path(
+                os.path.join(self.tmpdir, "app"),
+                file_type=CarRecordType.PRGFILE,
+                sort=True,
+                exclude="*.o",
+            )
+            writer.close()
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+        assert len(written) == 4
+        assert archive.header.note == "hello world"
+        assert archive.root.name == "app"
+        assert archive.root.keys() == ["empty", "foo.t", "sub"]
+        assert archive.root["foo.t"].getvalue() == b"foo"
+        assert archive.root["foo.t"].file_type == CarRecordType.PRGFILE
+        assert len(archive.root["sub"]) == 0
+        with io.BytesIO() as f:
+            writer = C64ArchiveWriter(f)
+            writer.write_path(os.path.join(self.tmpdir, "app"), no_empty_dir=True)
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+        assert "empty" not in archive.root
+        assert archive.root["sub"]["bar.o"].getvalue() == b"barbar"
+
+    def test_write_path_invalid(self):
+        with open(os.path.join(self.tmpdir, "app", "sub", "a-long-filename.o"), "wb"):
+            pass
+        with io.BytesIO() as f:
+            writer = C64ArchiveWriter(f)
+            with self.assertRaises(ValueError):
+                writer.write_path(os.path.join(self.tmpdir, "app"), sort=True)
+            assert len(f.getvalue()) == writer.header.SIZE
+            assert not writer.complete
+
+    def test_write_path_deep(self):
+        deep = os.path.join(self.tmpdir, "deep")
+        os.makedirs(os.path.join(deep, *(300 * ["d"])))
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(len(inspect.stack()) + 100)
+        try:
+            with io.BytesIO() as f:
+                writer = C64ArchiveWriter(f)
+                with self.assertRaises(ValueError):
+                    writer.write_path(deep, no_empty_dir=True)
+                assert len(writer.write_path(deep)) == 301
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_write_path_parallel(self):
+        with open(os.path.join(self.tmpdir, "app", "sub", "big.o"), "wb") as f:
+            f.write(os.urandom(1000) + bytes(100000))
+        outputs = []
+        for workers in (1, 3):
+            with io.BytesIO() as f:
+                writer = C64ArchiveWriter(f, timestamp=datetime.datetime(2000, 1, 1))
+                writer.write_path(
+                    os.path.join(self.tmpdir, "app"),
+                    sort=True,
+                    compression_type=RLE,
+                    workers=workers,
+                )
+                writer.close()
+                outputs.append(f.getvalue())
+        assert outputs[0] == outputs[1]
+        assert len(outputs[0]) < 3000
+        archive = C64Archive.deserialize(io.BytesIO(outputs[1]))
+        assert archive.root["sub"]["bar.o"].getvalue() == b"barbar"
+        assert archive.root["sub"]["big.o"].size == 101000
+        with self.assertRaises(ValueError):
+            C64ArchiveWriter(io.BytesIO()).write_path(self.tmpdir, workers=0)
+
+    def test_write_path_custom_codec(self):
+        compression_type = CarCompressionType(0x7F)
+        codec = get_codec(RLE)
+
+        def compress(src, dest):
+            return codec.compress(src, dest)
+
+        for functions in ((_reverse, _unreverse), (compress, codec.decompress)):
+            register_codec(compression_type, *functions)
+            with io.BytesIO() as f:
+                writer = C64ArchiveWriter(f)
+                writer.write_path(
+                    os.path.join(self.tmpdir, "app"),
+                    sort=True,
+                    compression_type=compression_type,
+                    workers=2,
+                )
+                writer.close()
+                f.seek(0)
+                archive = C64Archive.deserialize(f)
+            assert archive.root["sub"]["bar.o"].getvalue() == b"barbar"
+
+    def test_write_records(self):
+        with io.BytesIO() as f:
+            writer = C64ArchiveWriter(f)
+            writer.write_directory("root", 2)
+            assert not writer.complete
+            writer.write_file("foo.t", io.BytesIO(b"foobar"), 3)
+            directory = ArchiveDirectory(name="inner")
+            directory.append(ArchiveFile(name="bar.t"))
+            writer.write_record(directory)
+            assert writer.complete
+            with self.assertRaises(ValueError):
+                writer.write_directory("extra", 0)
+            writer.close()
+            f.seek(0)
+            archive = C64Archive.deserialize(f)
+        assert archive.root["foo.t"].getvalue() == b"foo"
+        assert "bar.t" in archive.root["inner"]
+        with io.BytesIO() as f:
+            writer = C64ArchiveWriter(f)
+            writer.write_directory("root", 1)
+            with self.assertRaises(ValueError):
+                writer.close()
+            with self.assertRaises(ValueError):
+                writer.write_file("foo.t", io.BytesIO(b"fo"), 3)